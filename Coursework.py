@@ -10,17 +10,3112 @@ import sqlite3
 import smtplib
 from email.mime.text import *
 from email.mime.multipart import *
+from email.header import Header
 from collections import deque
 import logging
 import os
+import sys
+import math
+import struct
 import platform
+import queue
+from contextlib import contextmanager
+from urllib.request import pathname2url, urlopen
+from urllib.parse import urlparse, parse_qs, urlencode
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+import argparse
+import signal
+import tempfile
+import gzip
+from concurrent.futures import ThreadPoolExecutor, wait
+from array import array
+from bisect import bisect_left, bisect_right, insort
+from itertools import chain, islice
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:  # экспорт в колоночные форматы недоступен
+    pa = pq = None
+
+try:
+    import numpy as np
+except ImportError:  # классификация пакета показаний выполняется без NumPy
+    np = None
+
+
+# Миграции схемы БД: (версия, список SQL-команд). Номер последней примененной
+# миграции хранится в PRAGMA user_version.
+SCHEMA_MIGRATIONS = [
+    (1, [
+        'CREATE INDEX IF NOT EXISTS idx_measurements_sensor_time ON measurements (sensor_id, timestamp)',
+        'CREATE INDEX IF NOT EXISTS idx_measurements_time ON measurements (timestamp)',
+        'CREATE INDEX IF NOT EXISTS idx_measurements_status_time ON measurements (status, timestamp)',
+        'CREATE INDEX IF NOT EXISTS idx_alerts_time ON alerts (timestamp)',
+        'CREATE INDEX IF NOT EXISTS idx_alerts_sensor_time ON alerts (sensor_id, timestamp)',
+    ]),
+    (2, [
+        '''
+        CREATE TABLE IF NOT EXISTS rollup_minute (
+            sensor_id TEXT NOT NULL,
+            bucket TEXT NOT NULL,
+            samples INTEGER NOT NULL,
+            level_sum REAL NOT NULL,
+            level_sum_sq REAL NOT NULL,
+            level_min REAL NOT NULL,
+            level_max REAL NOT NULL,
+            non_normal INTEGER NOT NULL,
+            PRIMARY KEY (sensor_id, bucket)
+        ) WITHOUT ROWID
+        ''',
+        'CREATE INDEX IF NOT EXISTS idx_rollup_minute_bucket ON rollup_minute (bucket)',
+        '''
+        CREATE TABLE IF NOT EXISTS rollup_hour (
+            sensor_id TEXT NOT NULL,
+            bucket TEXT NOT NULL,
+            samples INTEGER NOT NULL,
+            level_sum REAL NOT NULL,
+            level_sum_sq REAL NOT NULL,
+            level_min REAL NOT NULL,
+            level_max REAL NOT NULL,
+            non_normal INTEGER NOT NULL,
+            PRIMARY KEY (sensor_id, bucket)
+        ) WITHOUT ROWID
+        ''',
+        'CREATE INDEX IF NOT EXISTS idx_rollup_hour_bucket ON rollup_hour (bucket)',
+        '''
+        CREATE TABLE IF NOT EXISTS rollup_day (
+            sensor_id TEXT NOT NULL,
+            bucket TEXT NOT NULL,
+            samples INTEGER NOT NULL,
+            level_sum REAL NOT NULL,
+            level_sum_sq REAL NOT NULL,
+            level_min REAL NOT NULL,
+            level_max REAL NOT NULL,
+            non_normal INTEGER NOT NULL,
+            PRIMARY KEY (sensor_id, bucket)
+        ) WITHOUT ROWID
+        ''',
+        'CREATE INDEX IF NOT EXISTS idx_rollup_day_bucket ON rollup_day (bucket)',
+    ]),
+    (3, [
+        # Очередь отправки оповещений: notified = 0 - ожидает, 1 - отправлено, 2 - ошибка
+        'ALTER TABLE alerts ADD COLUMN attempts INTEGER DEFAULT 0',
+        'CREATE INDEX IF NOT EXISTS idx_alerts_notified ON alerts (notified, id)',
+        # Оповещения, записанные до появления очереди, повторно не отправляются
+        'UPDATE alerts SET notified = 1 WHERE notified = 0',
+    ]),
+    (4, [
+        # Событие состояния оповещений: raised, escalated, downgraded, cleared, reminder
+        "ALTER TABLE alerts ADD COLUMN event TEXT DEFAULT 'raised'",
+        # Прежние оповещения не открывают состояние датчика (см. AlertStateMachine.restore)
+        'UPDATE alerts SET event = NULL',
+    ]),
+    (5, [
+        # Скетчи квантилей (QuantileSketch.to_bytes) часовых и суточных агрегатов
+        'ALTER TABLE rollup_hour ADD COLUMN sketch BLOB',
+        'ALTER TABLE rollup_day ADD COLUMN sketch BLOB',
+    ]),
+    (6, [
+        # Сжатые блоки исходных измерений (ChunkStore): GorillaCodec на датчик и интервал
+        '''
+        CREATE TABLE IF NOT EXISTS measurement_chunks (
+            sensor_id TEXT NOT NULL,
+            chunk_start TEXT NOT NULL,
+            chunk_end TEXT NOT NULL,
+            samples INTEGER NOT NULL,
+            non_normal INTEGER NOT NULL,
+            data BLOB NOT NULL,
+            PRIMARY KEY (sensor_id, chunk_start)
+        )
+        ''',
+        'CREATE INDEX IF NOT EXISTS idx_measurement_chunks_start ON measurement_chunks (chunk_start)',
+    ]),
+]
+
+
+def day_range(first_day, last_day=None):
+    """Полуоткрытый интервал времени [first_day 00:00, last_day + 1 день 00:00)
+
+    Фильтр вида timestamp >= ? AND timestamp < ? использует индексы по timestamp,
+    в отличие от DATE(timestamp) = ?, требующего полного просмотра таблицы.
+    """
+    last_day = last_day or first_day
+    start = datetime.combine(first_day, datetime.min.time())
+    end = datetime.combine(last_day + timedelta(days=1), datetime.min.time())
+    return start.isoformat(sep=' '), end.isoformat(sep=' ')
+
+
+class DatabaseManager:
+    """Менеджер соединений с базой данных
+
+    База работает в режиме WAL: запись измерений и чтение данных интерфейсом и
+    отчетами не блокируют друг друга. Все изменения выполняются через одно
+    соединение записи (writer), чтение - через небольшой пул соединений только
+    для чтения (reader).
+
+    При synchronous=NORMAL в режиме WAL сбой процесса не приводит к потере
+    зафиксированных транзакций; при отключении питания могут быть потеряны
+    последние транзакции, но целостность файла БД сохраняется.
+    """
+
+    def __init__(self, db_path, pool_size=3, cache_size_kb=16384, mmap_size_mb=256):
+        self.db_path = db_path
+        self.pool_size = pool_size
+        self.cache_size_kb = cache_size_kb
+        self.mmap_size_mb = mmap_size_mb
+
+        self.write_lock = threading.RLock()
+        self.writer_conn = self.connect()
+        # Для новой БД: освобожденные страницы возвращаются через incremental_vacuum
+        self.writer_conn.execute('PRAGMA auto_vacuum = INCREMENTAL')
+        self.writer_conn.execute('PRAGMA journal_mode = WAL')
+
+        # Соединения чтения создаются по мере необходимости
+        self.readers = queue.Queue()
+        self.readers_created = 0
+        self.readers_lock = threading.Lock()
+
+    def connect(self, read_only=False):
+        """Открытие соединения с настройкой параметров SQLite"""
+        if read_only:
+            uri = f"file:{pathname2url(os.path.abspath(self.db_path))}?mode=ro"
+            conn = sqlite3.connect(uri, uri=True, check_same_thread=False)
+        else:
+            conn = sqlite3.connect(self.db_path, check_same_thread=False)
+
+        conn.execute('PRAGMA busy_timeout = 5000')
+        conn.execute('PRAGMA synchronous = NORMAL')
+        conn.execute(f'PRAGMA cache_size = -{int(self.cache_size_kb)}')
+        conn.execute(f'PRAGMA mmap_size = {int(self.mmap_size_mb) * 1024 * 1024}')
+        return conn
+
+    @contextmanager
+    def writer(self):
+        """Соединение записи: блок выполняется одной транзакцией"""
+        with self.write_lock:
+            try:
+                yield self.writer_conn
+                self.writer_conn.commit()
+            except BaseException:
+                self.writer_conn.rollback()
+                raise
+
+    @contextmanager
+    def reader(self):
+        """Соединение чтения из пула"""
+        conn = None
+        with self.readers_lock:
+            if self.readers.empty() and self.readers_created < self.pool_size:
+                conn = self.connect(read_only=True)
+                self.readers_created += 1
+
+        if conn is None:
+            conn = self.readers.get()
 
+        try:
+            yield conn
+        finally:
+            self.readers.put(conn)
+
+    def apply_migrations(self, migrations, logger=None):
+        """Применение миграций схемы, которые еще не были применены"""
+        with self.writer() as conn:
+            version = conn.execute('PRAGMA user_version').fetchone()[0]
+
+            for migration_version, statements in migrations:
+                if migration_version <= version:
+                    continue
+                for statement in statements:
+                    conn.execute(statement)
+                conn.execute(f'PRAGMA user_version = {int(migration_version)}')
+                if logger:
+                    logger.info(f"Применена миграция схемы БД: версия {migration_version}")
+
+    def delete_measurements(self, start, end, batch_size=5000, pause=0, max_id=None):
+        """Удаление измерений из интервала [start, end) пакетами по batch_size
+
+        Каждый пакет удаляется отдельной короткой транзакцией, между пакетами
+        выдерживается пауза pause секунд, чтобы не задерживать запись новых
+        измерений. При max_id удаляются только строки с id не больше него.
+        Возвращает количество удаленных строк.
+        """
+        deleted = 0
+        while True:
+            with self.writer() as conn:
+                cursor = conn.execute('''
+                    DELETE FROM measurements WHERE id IN (
+                        SELECT id FROM measurements WHERE timestamp >= ? AND timestamp < ? AND id <= ? LIMIT ?
+                    )
+                ''', (start, end, max_id if max_id is not None else sys.maxsize, batch_size))
+            deleted += cursor.rowcount
+            if cursor.rowcount < batch_size:
+                return deleted
+            if pause:
+                time.sleep(pause)
+
+    def incremental_vacuum(self, pages):
+        """Возврат не более pages свободных страниц файловой системе
+
+        Возвращает количество свободных страниц, оставшихся после шага.
+        """
+        with self.writer() as conn:
+            if conn.execute('PRAGMA auto_vacuum').fetchone()[0] != 2:
+                return 0
+            conn.execute(f'PRAGMA incremental_vacuum({int(pages)})').fetchall()
+            return conn.execute('PRAGMA freelist_count').fetchone()[0]
+
+    def close(self):
+        """Закрытие всех соединений"""
+        while not self.readers.empty():
+            self.readers.get_nowait().close()
+        with self.write_lock:
+            self.writer_conn.close()
+
+
+class QuantileSketch:
+    """Объединяемый скетч квантилей с логарифмическими интервалами (DDSketch)
+
+    Значение x > 0 учитывается в интервале с номером ceil(log(x) / log(gamma)),
+    gamma = (1 + ALPHA) / (1 - ALPHA); хранится только число значений в каждом
+    интервале. Оценка любого квантиля отличается от точного значения
+    соответствующего ранга не более чем на ALPHA относительно (1 %), независимо
+    от числа и распределения значений. Скетчи складываются без потери
+    точности (merge), поэтому квантиль за период получается объединением
+    скетчей часов или суток. Значения не больше MIN_VALUE учитываются как нули.
+    """
+
+    ALPHA = 0.01
+    GAMMA = (1 + ALPHA) / (1 - ALPHA)
+    LOG_GAMMA = math.log(GAMMA)
+    MIN_VALUE = 1e-9
 
-class RadiationMonitoringSystem:
     def __init__(self):
-        self.root = tk.Tk()
-        self.root.title("Система контроля уровня радиации - АО 'КОНСИСТ-ОС'")
-        self.root.geometry("1400x900")
+        self.bins = {}  # номер интервала -> число значений
+        self.zeros = 0
+        self.count = 0
+
+    def add(self, value, count=1):
+        if value > self.MIN_VALUE:
+            index = math.ceil(math.log(value) / self.LOG_GAMMA)
+            self.bins[index] = self.bins.get(index, 0) + count
+        else:
+            self.zeros += count
+        self.count += count
+
+    def merge(self, other):
+        """Добавление значений другого скетча"""
+        for index, count in other.bins.items():
+            self.bins[index] = self.bins.get(index, 0) + count
+        self.zeros += other.zeros
+        self.count += other.count
+        return self
+
+    def quantile(self, q):
+        """Оценка квантиля q (0..1) или None для пустого скетча"""
+        if not self.count:
+            return None
+        rank = q * (self.count - 1)
+        seen = self.zeros
+        if seen > rank:
+            return 0.0
+        for index in sorted(self.bins):
+            seen += self.bins[index]
+            if seen > rank:
+                return 2 * self.GAMMA ** index / (self.GAMMA + 1)
+        return 2 * self.GAMMA ** max(self.bins) / (self.GAMMA + 1)
+
+    def to_bytes(self):
+        """Компактное представление для хранения в BLOB"""
+        indexes = sorted(self.bins)
+        return struct.pack(f'<II{len(indexes)}i{len(indexes)}I', len(indexes), self.zeros,
+                           *indexes, *(self.bins[index] for index in indexes))
+
+    @classmethod
+    def from_bytes(cls, data):
+        sketch = cls()
+        size, sketch.zeros = struct.unpack_from('<II', data)
+        values = struct.unpack_from(f'<{size}i{size}I', data, 8)
+        sketch.bins = dict(zip(values[:size], values[size:]))
+        sketch.count = sketch.zeros + sum(values[size:])
+        return sketch
+
+
+class RollupManager:
+    """Предварительно агрегированные данные (rollup) по минутам, часам и суткам
+
+    Для каждого датчика и интервала хранятся количество измерений, сумма,
+    сумма квадратов, минимум, максимум и количество измерений вне нормы,
+    для часов и суток - также скетч квантилей (QuantileSketch).
+    Агрегаты обновляются вместе с записью пакета измерений, поэтому отчеты
+    читают несколько сотен строк вместо миллионов исходных измерений.
+
+    Скетчи текущего часа и суток хранятся в памяти и записываются в БД при
+    переходе к следующему интервалу, раз в sketch_checkpoint секунд и при
+    остановке записи (flush_sketches). При аварийном завершении теряются
+    значения с последней записи скетча, их восстанавливает --backfill-rollups.
+    """
+
+    # Уровень: (таблица, формат начала интервала, выражение SQL для начала интервала)
+    LEVELS = {
+        'minute': ('rollup_minute', '%Y-%m-%d %H:%M:00', "substr(timestamp, 1, 16) || ':00'"),
+        'hour': ('rollup_hour', '%Y-%m-%d %H:00:00', "substr(timestamp, 1, 13) || ':00:00'"),
+        'day': ('rollup_day', '%Y-%m-%d 00:00:00', "substr(timestamp, 1, 10) || ' 00:00:00'")
+    }
+    # Уровни со скетчами квантилей
+    SKETCH_LEVELS = ('hour', 'day')
+
+    def __init__(self, db, logger=None, sketch_checkpoint=300):
+        self.db = db
+        self.logger = logger or logging.getLogger(__name__)
+        self.sketch_tables = {self.LEVELS[level][0] for level in self.SKETCH_LEVELS}
+        self.sketch_checkpoint = sketch_checkpoint
+        self.sketch_lock = threading.Lock()
+        self.open_sketches = {table: {} for table in self.sketch_tables}  # таблица -> {(датчик, интервал): скетч}
+        # Значения пакета, еще не зафиксированного в БД: [(таблица, {ключ: значения}, записанные ключи)]
+        self.pending_sketches = []
+        self.last_checkpoint = time.monotonic()
+
+    def update(self, conn, batch):
+        """Учет пакета измерений (в транзакции записи этого пакета)
+
+        После фиксации транзакции вызывается commit_sketches(), после отмены -
+        commit_sketches(committed=False).
+        """
+        for table, bucket_format, _ in self.LEVELS.values():
+            buckets = {}
+            bucket_names = {}  # время -> начало интервала (в пакете обычно одно время цикла)
+            values = {} if table in self.sketch_tables else None
+            for sensor_id, radiation_level, timestamp, status in batch:
+                bucket_name = bucket_names.get(timestamp)
+                if bucket_name is None:
+                    bucket_name = bucket_names[timestamp] = timestamp.strftime(bucket_format)
+                key = (sensor_id, bucket_name)
+                if values is not None:
+                    values.setdefault(key, []).append(radiation_level)
+                non_normal = 0 if status == "НОРМА" else 1
+                bucket = buckets.get(key)
+                if bucket is None:
+                    buckets[key] = [1, radiation_level, radiation_level * radiation_level,
+                                    radiation_level, radiation_level, non_normal]
+                else:
+                    bucket[0] += 1
+                    bucket[1] += radiation_level
+                    bucket[2] += radiation_level * radiation_level
+                    bucket[3] = min(bucket[3], radiation_level)
+                    bucket[4] = max(bucket[4], radiation_level)
+                    bucket[5] += non_normal
+
+            conn.executemany(f'''
+                INSERT INTO {table} (sensor_id, bucket, samples, level_sum, level_sum_sq,
+                                     level_min, level_max, non_normal)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+                ON CONFLICT (sensor_id, bucket) DO UPDATE SET
+                    samples = samples + excluded.samples,
+                    level_sum = level_sum + excluded.level_sum,
+                    level_sum_sq = level_sum_sq + excluded.level_sum_sq,
+                    level_min = MIN(level_min, excluded.level_min),
+                    level_max = MAX(level_max, excluded.level_max),
+                    non_normal = non_normal + excluded.non_normal
+            ''', [(sensor_id, bucket, *values) for (sensor_id, bucket), values in buckets.items()])
+
+            if values is not None:
+                self.update_sketches(conn, table, values)
+
+    def update_sketches(self, conn, table, values):
+        """Добавление значений пакета {(датчик, интервал): [значения]} в скетчи квантилей
+
+        Значения попадают в скетчи в памяти только после фиксации транзакции
+        (commit_sketches). В БД в той же транзакции записываются скетчи
+        завершенных интервалов, а по истечении sketch_checkpoint - все открытые.
+        """
+        with self.sketch_lock:
+            sketches = self.open_sketches[table]
+            # Интервал, впервые встреченный после запуска, продолжает скетч из БД
+            for bucket in {key[1] for key in values if key not in sketches}:
+                for sensor_id, data in conn.execute(f'SELECT sensor_id, sketch FROM {table} WHERE bucket = ?',
+                                                    (bucket,)):
+                    if (sensor_id, bucket) not in sketches:
+                        sketches[(sensor_id, bucket)] = (QuantileSketch.from_bytes(data) if data is not None
+                                                         else QuantileSketch())
+
+            latest = max(bucket for _, bucket in chain(sketches, values))
+            checkpoint = time.monotonic() - self.last_checkpoint >= self.sketch_checkpoint
+            closed = [key for key in set(sketches) | set(values) if checkpoint or key[1] < latest]
+            rows = []
+            for key in closed:
+                sketch = QuantileSketch().merge(sketches[key]) if key in sketches else QuantileSketch()
+                for radiation_level in values.get(key, ()):
+                    sketch.add(radiation_level)
+                rows.append((sketch.to_bytes(), *key))
+            self.pending_sketches.append((table, values, [key for key in closed if key[1] < latest]))
+
+        conn.executemany(f'UPDATE {table} SET sketch = ? WHERE sensor_id = ? AND bucket = ?', rows)
+
+    def commit_sketches(self, committed=True):
+        """Перенос значений пакета в скетчи в памяти после фиксации транзакции
+        (committed=False - транзакция отменена, значения отбрасываются)"""
+        with self.sketch_lock:
+            pending, self.pending_sketches = self.pending_sketches, []
+            if not committed:
+                return
+            for table, values, closed in pending:
+                sketches = self.open_sketches[table]
+                for key, levels in values.items():
+                    sketch = sketches.get(key)
+                    if sketch is None:
+                        sketch = sketches[key] = QuantileSketch()
+                    for radiation_level in levels:
+                        sketch.add(radiation_level)
+                # Скетчи завершенных интервалов уже записаны в БД
+                for key in closed:
+                    sketches.pop(key, None)
+            if time.monotonic() - self.last_checkpoint >= self.sketch_checkpoint:
+                self.last_checkpoint = time.monotonic()
+
+    def flush_sketches(self, conn):
+        """Запись всех скетчей из памяти в БД (при остановке записи)"""
+        with self.sketch_lock:
+            for table, sketches in self.open_sketches.items():
+                conn.executemany(f'UPDATE {table} SET sketch = ? WHERE sensor_id = ? AND bucket = ?',
+                                 [(sketch.to_bytes(), *key) for key, sketch in sketches.items()])
+            self.last_checkpoint = time.monotonic()
+
+    def discard_sketches(self):
+        """Сброс скетчей в памяти (после замены БД, например восстановления из копии)"""
+        with self.sketch_lock:
+            for sketches in self.open_sketches.values():
+                sketches.clear()
+            self.pending_sketches.clear()
+
+    def sensor_summary(self, conn, level, start=None, end=None):
+        """Агрегаты по датчикам за интервал [start, end):
+        (sensor_id, среднее, максимум, минимум, количество, вне нормы)"""
+        table = self.LEVELS[level][0]
+        cursor = conn.cursor()
+        cursor.execute(f'''
+            SELECT sensor_id, SUM(level_sum) / SUM(samples), MAX(level_max), MIN(level_min),
+                   SUM(samples), SUM(non_normal)
+            FROM {table}
+            WHERE bucket >= ? AND bucket < ?
+            GROUP BY sensor_id
+        ''', (start or '', end or '9999'))
+        return cursor.fetchall()
+
+    def total_summary(self, conn, level='day', start=None, end=None):
+        """Агрегаты по всем датчикам за интервал [start, end):
+        (количество, среднее, максимум, минимум, вне нормы)"""
+        table = self.LEVELS[level][0]
+        cursor = conn.cursor()
+        cursor.execute(f'''
+            SELECT SUM(samples), SUM(level_sum) / SUM(samples), MAX(level_max), MIN(level_min),
+                   SUM(non_normal)
+            FROM {table}
+            WHERE bucket >= ? AND bucket < ?
+        ''', (start or '', end or '9999'))
+        return cursor.fetchone()
+
+    def quantiles(self, conn, level, start=None, end=None, quantiles=(0.5, 0.95, 0.99)):
+        """Квантили уровня радиации за интервал [start, end) по скетчам агрегатов:
+        ({sensor_id: [значения квантилей]}, [значения по всем датчикам])
+
+        Интервалы без скетча (агрегаты до появления скетчей) пропускаются,
+        их можно пересчитать командой --backfill-rollups.
+        """
+        if level not in self.SKETCH_LEVELS:
+            raise ValueError(f"скетчи квантилей хранятся только для уровней {', '.join(self.SKETCH_LEVELS)}")
+        table = self.LEVELS[level][0]
+        start, end = start or '', end or '9999'
+        # Скетчи открытых интервалов в памяти новее записанных в БД
+        with self.sketch_lock:
+            open_sketches = {key: QuantileSketch().merge(sketch) for key, sketch in self.open_sketches[table].items()
+                             if start <= key[1] < end}
+
+        sketches = {}
+        stored = ((sensor_id, bucket, QuantileSketch.from_bytes(data)) for sensor_id, bucket, data in conn.execute(f'''
+            SELECT sensor_id, bucket, sketch
+            FROM {table}
+            WHERE bucket >= ? AND bucket < ? AND sketch IS NOT NULL
+        ''', (start, end)) if (sensor_id, bucket) not in open_sketches)
+        for sensor_id, bucket, sketch in chain(stored, ((*key, sketch) for key, sketch in open_sketches.items())):
+            if sensor_id in sketches:
+                sketches[sensor_id].merge(sketch)
+            else:
+                sketches[sensor_id] = sketch
+
+        total = QuantileSketch()
+        for sketch in sketches.values():
+            total.merge(sketch)
+        return ({sensor_id: [sketch.quantile(q) for q in quantiles] for sensor_id, sketch in sketches.items()},
+                [total.quantile(q) for q in quantiles])
+
+    def series(self, conn, level, start, end):
+        """Минимум и максимум по интервалам за [start, end):
+        (sensor_id, начало интервала, минимум, максимум), по датчикам и времени"""
+        table = self.LEVELS[level][0]
+        cursor = conn.cursor()
+        cursor.execute(f'''
+            SELECT sensor_id, bucket, level_min, level_max
+            FROM {table}
+            WHERE bucket >= ? AND bucket < ?
+            ORDER BY sensor_id, bucket
+        ''', (start, end))
+        return cursor.fetchall()
+
+    def is_empty(self, conn):
+        """Агрегаты отсутствуют, хотя измерения в БД есть (требуется backfill)"""
+        has_rollups = conn.execute('SELECT 1 FROM rollup_day LIMIT 1').fetchone()
+        has_measurements = conn.execute('SELECT 1 FROM measurements LIMIT 1').fetchone()
+        return has_measurements is not None and has_rollups is None
+
+    def backfill(self, chunks=None):
+        """Пересчет агрегатов по уже накопленным измерениям
+
+        Пересчет выполняется по суткам отдельными короткими транзакциями, поэтому
+        его можно запускать на работающей системе: запись новых измерений
+        блокируется не дольше, чем на обработку одних суток. Час и сутки
+        последнего измерения не пересчитываются: их скетчи служба записи
+        держит в памяти и записала бы поверх пересчитанных. Они пересчитываются
+        следующим запуском после смены интервала. Если передан ChunkStore,
+        учитываются и упакованные в блоки измерения.
+        """
+        with self.db.reader() as conn:
+            first, last = conn.execute('SELECT MIN(timestamp), MAX(timestamp) FROM measurements').fetchone()
+            if chunks is not None:
+                chunk_first, chunk_last = conn.execute(
+                    'SELECT MIN(chunk_start), MAX(chunk_end) FROM measurement_chunks').fetchone()
+                first = min(filter(None, (first, chunk_first)), default=None)
+                last = max(filter(None, (last, chunk_last)), default=None)
+
+        if first is None:
+            return 0
+
+        day = datetime.strptime(str(first)[:10], '%Y-%m-%d').date()
+        last_day = datetime.strptime(str(last)[:10], '%Y-%m-%d').date()
+        days = 0
+        open_buckets = {}  # уровень -> пропущенный открытый интервал
+
+        while day <= last_day:
+            start, end = day_range(day)
+            with self.db.writer() as conn:
+                source = chunks.materialize(conn, start, end) if chunks is not None else 'measurements'
+                for level, (table, _, bucket_sql) in self.LEVELS.items():
+                    level_end = end
+                    if level in self.SKETCH_LEVELS:
+                        # Открытый интервал (с последним измерением) пропускается
+                        open_bucket = conn.execute(f'''
+                            SELECT {bucket_sql} FROM (SELECT MAX(timestamp) AS timestamp FROM measurements)
+                        ''').fetchone()[0]
+                        if open_bucket is not None and open_bucket < end:
+                            level_end = max(start, open_bucket)
+                            open_buckets[level] = open_bucket
+                    conn.execute(f'DELETE FROM {table} WHERE bucket >= ? AND bucket < ?', (start, level_end))
+                    conn.execute(f'''
+                        INSERT INTO {table} (sensor_id, bucket, samples, level_sum, level_sum_sq,
+                                             level_min, level_max, non_normal)
+                        SELECT sensor_id, {bucket_sql}, COUNT(*), SUM(radiation_level),
+                               SUM(radiation_level * radiation_level), MIN(radiation_level),
+                               MAX(radiation_level), SUM(status != 'НОРМА')
+                        FROM {source}
+                        WHERE timestamp >= ? AND timestamp < ?
+                        GROUP BY sensor_id, {bucket_sql}
+                    ''', (start, level_end))
+
+                for level in self.SKETCH_LEVELS:
+                    table, _, bucket_sql = self.LEVELS[level]
+                    sketches = {}
+                    for sensor_id, bucket, radiation_level in conn.execute(f'''
+                        SELECT sensor_id, {bucket_sql}, radiation_level
+                        FROM {source}
+                        WHERE timestamp >= ? AND timestamp < ?
+                    ''', (start, min(end, open_buckets.get(level, end)))):
+                        sketch = sketches.get((sensor_id, bucket))
+                        if sketch is None:
+                            sketch = sketches[(sensor_id, bucket)] = QuantileSketch()
+                        sketch.add(radiation_level)
+                    conn.executemany(f'UPDATE {table} SET sketch = ? WHERE sensor_id = ? AND bucket = ?',
+                                     [(sketch.to_bytes(), *key) for key, sketch in sketches.items()])
+            days += 1
+            self.logger.info(f"Пересчитаны агрегаты за {day}")
+            day += timedelta(days=1)
+
+        for level, bucket in open_buckets.items():
+            self.logger.info(f"Открытый интервал {bucket} ({level}) не пересчитан, "
+                             f"он будет пересчитан после своего завершения")
+        return days
+
+
+class StreamingExporter:
+    """Потоковый экспорт измерений в CSV
+
+    Строки читаются из БД порциями по chunk_size (fetchmany) и сразу
+    записываются в буферизованный файл, поэтому расход памяти не зависит от
+    размера таблицы. Поддерживаются фильтры по времени и датчикам, сжатие gzip,
+    отчет о ходе выполнения и отмена. Файл пишется под временным именем и
+    получает имя filename только после успешного завершения.
+    """
+
+    HEADER = ['Время', 'Датчик', 'Участок', 'Уровень радиации', 'Статус']
+
+    def __init__(self, db, rollups=None, chunk_size=5000, buffer_size=1024 * 1024):
+        self.db = db
+        self.rollups = rollups
+        self.chunk_size = chunk_size
+        self.buffer_size = buffer_size
+
+    def build_filter(self, start=None, end=None, sensor_ids=None):
+        """Фильтр для интервала [start, end) и списка датчиков: условия и параметры
+
+        Условия - шаблоны со столбцами {time} и {sensor}, их подставляет
+        where_clause, поэтому один фильтр применим и к measurements, и к агрегатам.
+        """
+        conditions, params = [], []
+        if start:
+            conditions.append("{time} >= ?")
+            params.append(start)
+        if end:
+            conditions.append("{time} < ?")
+            params.append(end)
+        if sensor_ids:
+            conditions.append(f"{{sensor}} IN ({', '.join('?' * len(sensor_ids))})")
+            params.extend(sensor_ids)
+        return conditions, params
+
+    @staticmethod
+    def where_clause(conditions, time_column, sensor_column):
+        """Условие WHERE фильтра build_filter для заданных столбцов"""
+        if not conditions:
+            return ""
+        return "WHERE " + " AND ".join(condition.format(time=time_column, sensor=sensor_column)
+                                       for condition in conditions)
+
+    def estimate_rows(self, conn, conditions, params):
+        """Оценка количества строк по часовым агрегатам (для индикатора хода)"""
+        if not self.rollups:
+            return None
+        where = self.where_clause(conditions, 'bucket', 'sensor_id')
+        return conn.execute(f'SELECT SUM(samples) FROM rollup_hour {where}', params).fetchone()[0]
+
+    def export(self, filename, start=None, end=None, sensor_ids=None, compress=False,
+               progress=None, cancel_event=None):
+        """Экспорт в файл; возвращает число записанных строк или None при отмене"""
+        conditions, params = self.build_filter(start, end, sensor_ids)
+        where = self.where_clause(conditions, 'm.timestamp', 'm.sensor_id')
+        temp_filename = f"{filename}.part"
+        written = 0
+
+        try:
+            with self.db.reader() as conn:
+                total = self.estimate_rows(conn, conditions, params)
+
+                # Форматирование уровня выполняется средствами SQLite
+                cursor = conn.cursor()
+                cursor.execute(f'''
+                    SELECT m.timestamp, s.sensor_id, s.location,
+                           printf('%.2f мкЗв/ч', m.radiation_level), m.status
+                    FROM measurements m
+                    JOIN sensors s ON m.sensor_id = s.sensor_id
+                    {where}
+                    ORDER BY m.timestamp
+                ''', params)
+
+                if compress:
+                    output = gzip.open(temp_filename, 'wt', newline='', encoding='utf-8')
+                else:
+                    output = open(temp_filename, 'w', newline='', encoding='utf-8', buffering=self.buffer_size)
+
+                with output:
+                    writer = csv.writer(output)
+                    writer.writerow(self.HEADER)
+
+                    while True:
+                        if cancel_event is not None and cancel_event.is_set():
+                            break
+                        rows = cursor.fetchmany(self.chunk_size)
+                        if not rows:
+                            break
+                        writer.writerows(rows)
+                        written += len(rows)
+                        if progress:
+                            progress(written, total)
+
+            if cancel_event is not None and cancel_event.is_set():
+                os.remove(temp_filename)
+                return None
+        except BaseException:
+            # Недописанный файл не остается на диске
+            if os.path.exists(temp_filename):
+                os.remove(temp_filename)
+            raise
+
+        os.replace(temp_filename, filename)
+        return written
+
+
+class HistoryPager:
+    """Постраничное чтение истории измерений по ключу (timestamp, id)
+
+    Следующая страница выбирается условием (timestamp, id) < (?, ?) относительно
+    последней загруженной строки, а не через OFFSET, поэтому время чтения
+    страницы не зависит от ее удаленности от начала. Фильтры по датчику, статусу
+    и интервалу времени выполняются в SQL по индексам (sensor_id, timestamp),
+    (status, timestamp) и (timestamp).
+    """
+
+    def __init__(self, db, page_size=200):
+        self.db = db
+        self.page_size = page_size
+
+    def build_filter(self, sensor_id=None, status=None, start=None, end=None):
+        """Условия и параметры фильтра для интервала [start, end), датчика и статуса"""
+        conditions, params = [], []
+        if sensor_id:
+            conditions.append("sensor_id = ?")
+            params.append(sensor_id)
+        if status:
+            conditions.append("status = ?")
+            params.append(status)
+        if start:
+            conditions.append("timestamp >= ?")
+            params.append(start)
+        if end:
+            conditions.append("timestamp < ?")
+            params.append(end)
+        return conditions, params
+
+    def fetch(self, filters, after=None, newer=False):
+        """Страница строк (id, timestamp, sensor_id, уровень, статус) от новых к старым
+
+        after - ключ (timestamp, id) строки, от которой читается страница: в сторону
+        более старых строк или, при newer=True, более новых.
+        """
+        filters = dict(filters)
+        if after is not None:
+            # Граница интервала с той же стороны, что и ключ, избыточна и мешает
+            # SQLite начать просмотр индекса по timestamp сразу с ключа
+            filters.pop('start' if newer else 'end', None)
+        conditions, params = self.build_filter(**filters)
+        if after is not None:
+            conditions.append(f"(timestamp, id) {'>' if newer else '<'} (?, ?)")
+            params.extend(after)
+        where = f"WHERE {' AND '.join(conditions)}" if conditions else ""
+        order = "ASC" if newer else "DESC"
+
+        with self.db.reader() as conn:
+            rows = conn.execute(f'''
+                SELECT id, timestamp, sensor_id, radiation_level, status
+                FROM measurements
+                {where}
+                ORDER BY timestamp {order}, id {order}
+                LIMIT ?
+            ''', (*params, self.page_size)).fetchall()
+
+        if newer:
+            rows.reverse()
+        return rows
+
+
+class ColumnarArchive:
+    """Колоночный экспорт и холодный архив измерений (Parquet / Arrow IPC)
+
+    Данные разбиваются по суткам: <папка>/date=ГГГГ-ММ-ДД/part-<время>.parquet
+    (или .arrow). Колонки: timestamp_us - int64, микросекунды от 1970-01-01
+    по местному времени без часового пояса (так же, как время хранится в БД
+    и в ChunkStore), sensor_id и status - словарные колонки, radiation_level -
+    float32. Сутки раздела - календарные сутки того же местного времени.
+    Требуется пакет pyarrow. Сутки записываются потоково: строки measurements -
+    порциями по batch_size, упакованные измерения (ChunkStore) - по одному блоку.
+    """
+
+    EXTENSIONS = {'parquet': '.parquet', 'arrow': '.arrow'}
+
+    def __init__(self, db, logger=None, delete_batch=5000, chunks=None, batch_size=10000):
+        self.db = db
+        self.logger = logger or logging.getLogger(__name__)
+        self.delete_batch = delete_batch
+        self.chunks = chunks
+        self.batch_size = batch_size
+
+    @staticmethod
+    def available():
+        """Установлен ли pyarrow"""
+        return pa is not None
+
+    @staticmethod
+    def schema():
+        return pa.schema([
+            ('timestamp_us', pa.int64()),
+            ('sensor_id', pa.dictionary(pa.int32(), pa.string())),
+            ('radiation_level', pa.float32()),
+            ('status', pa.dictionary(pa.int32(), pa.string()))
+        ])
+
+    def days_with_data(self, conn, before=None):
+        """Сутки, за которые в БД есть измерения или блоки (раньше суток before)"""
+        first, last = conn.execute('SELECT MIN(timestamp), MAX(timestamp) FROM measurements').fetchone()
+        if self.chunks is not None:
+            chunk_first, chunk_last = conn.execute(
+                'SELECT MIN(chunk_start), MAX(chunk_end) FROM measurement_chunks').fetchone()
+            first = min(filter(None, (first, chunk_first)), default=None)
+            last = max(filter(None, (last, chunk_last)), default=None)
+        if first is None:
+            return []
+
+        day = datetime.strptime(str(first)[:10], '%Y-%m-%d').date()
+        last_day = datetime.strptime(str(last)[:10], '%Y-%m-%d').date()
+        if before is not None:
+            last_day = min(last_day, before - timedelta(days=1))
+
+        days = []
+        while day <= last_day:
+            days.append(day)
+            day += timedelta(days=1)
+        return days
+
+    def record_batch(self, timestamps, sensor_ids, levels, statuses):
+        return pa.record_batch([
+            pa.array(timestamps, type=pa.int64()),
+            pa.array(sensor_ids, type=pa.string()).dictionary_encode(),
+            pa.array(levels, type=pa.float32()),
+            pa.array(statuses, type=pa.string()).dictionary_encode()
+        ], schema=self.schema())
+
+    def read_day(self, conn, day, read=None):
+        """Порции измерений за сутки (record batch Arrow)
+
+        Если передан словарь read, в нем по мере чтения заполняются max_id -
+        наибольший id прочитанных строк measurements и chunks - прочитанные
+        блоки (датчик, начало, число измерений, измерения вне суток).
+        """
+        start, end = day_range(day)
+        if read is None:
+            read = {}
+        read.update(max_id=0, chunks=[])
+
+        if self.chunks is not None:
+            start_us, end_us = ChunkStore.to_micros(start), ChunkStore.to_micros(end)
+            for sensor_id, chunk_start, data, samples in conn.execute('''
+                SELECT sensor_id, chunk_start, data, samples FROM measurement_chunks
+                WHERE chunk_end >= ? AND chunk_start < ?
+            ''', (start, end)):
+                times, values, codes = GorillaCodec.decode(data, samples)
+                inside = [i for i, micros in enumerate(times) if start_us <= micros < end_us]
+                rest = [point for point in zip(times, values, codes) if not start_us <= point[0] < end_us]
+                read['chunks'].append((sensor_id, chunk_start, samples, rest))
+                if inside:
+                    yield self.record_batch([times[i] for i in inside], [sensor_id] * len(inside),
+                                            [values[i] for i in inside],
+                                            [MeasurementStore.STATUSES[codes[i]] for i in inside])
+
+        cursor = conn.cursor()
+        cursor.execute('''
+            SELECT id, timestamp, sensor_id, radiation_level, status
+            FROM measurements
+            WHERE timestamp >= ? AND timestamp < ?
+            ORDER BY timestamp
+        ''', (start, end))
+        while True:
+            rows = cursor.fetchmany(self.batch_size)
+            if not rows:
+                break
+            read['max_id'] = max(read['max_id'], max(row[0] for row in rows))
+            yield self.record_batch([ChunkStore.to_micros(row[1]) for row in rows], [row[2] for row in rows],
+                                    [row[3] for row in rows], [row[4] for row in rows])
+
+    def write_partition(self, batches, folder, day, fmt='parquet'):
+        """Потоковая запись порций в раздел суток; возвращает (путь, строк)
+
+        Если порций нет, файл не создается (путь None). Недописанный файл
+        удаляется.
+        """
+        path = writer = sink = None
+        rows = 0
+        try:
+            for batch in batches:
+                if not batch.num_rows:
+                    continue
+                if writer is None:
+                    partition = os.path.join(folder, f"date={day.isoformat()}")
+                    os.makedirs(partition, exist_ok=True)
+                    path = os.path.join(partition, f"part-{datetime.now().strftime('%Y%m%d%H%M%S%f')}"
+                                                   f"{self.EXTENSIONS[fmt]}")
+                    if fmt == 'parquet':
+                        writer = pq.ParquetWriter(path, self.schema(), compression='zstd')
+                    else:
+                        sink = pa.OSFile(path, 'wb')
+                        writer = pa.ipc.new_file(sink, self.schema())
+                writer.write_batch(batch)
+                rows += batch.num_rows
+        except BaseException:
+            if writer is not None:
+                writer.close()
+                if sink is not None:
+                    sink.close()
+                os.remove(path)
+            raise
+
+        if writer is not None:
+            writer.close()
+            if sink is not None:
+                sink.close()
+        return path, rows
+
+    def export(self, folder, fmt='parquet', progress=None):
+        """Экспорт всех измерений по суткам; возвращает число строк"""
+        written = 0
+        with self.db.reader() as conn:
+            days = self.days_with_data(conn)
+            for i, day in enumerate(days):
+                written += self.write_partition(self.read_day(conn, day), folder, day, fmt)[1]
+                if progress:
+                    progress(i + 1, len(days))
+        return written
+
+    def archive(self, folder, before_day, fmt='parquet'):
+        """Перенос измерений старше before_day в архив с удалением из БД
+
+        Сутки читаются из одного снимка БД и удаляются только после успешной
+        записи и проверки файла архива. Удаляются только записанные в файл
+        данные: строки measurements с id не больше прочитанного (поступившие
+        позже остаются до следующего прохода) и неизменившиеся блоки; в блоке,
+        выходящем за границы суток, остаются измерения других суток. Удаление
+        выполняется небольшими транзакциями, чтобы не задерживать запись новых
+        измерений.
+        """
+        archived = 0
+        with self.db.reader() as conn:
+            days = self.days_with_data(conn, before=before_day)
+
+        for day in days:
+            with self.db.reader() as conn:
+                conn.execute('BEGIN')
+                try:
+                    read = {}
+                    path, rows = self.write_partition(self.read_day(conn, day, read), folder, day, fmt)
+                finally:
+                    conn.rollback()
+            if path is None:
+                continue
+            if self.count_rows(path, fmt) != rows:
+                raise IOError(f"Файл архива {path} записан не полностью")
+
+            if read['chunks']:
+                self.delete_chunks(read['chunks'])
+            if read['max_id']:
+                self.db.delete_measurements(*day_range(day), self.delete_batch, max_id=read['max_id'])
+            archived += rows
+            self.logger.info(f"Архивированы измерения за {day}: {rows}")
+
+        return archived
+
+    def delete_chunks(self, chunks):
+        """Удаление архивированных блоков; в блоке остаются измерения вне суток"""
+        changed = 0
+        for i in range(0, len(chunks), 100):
+            with self.db.writer() as conn:
+                for sensor_id, chunk_start, samples, rest in chunks[i:i + 100]:
+                    if rest:
+                        times, values, codes = zip(*rest)
+                        cursor = conn.execute('''
+                            UPDATE measurement_chunks SET chunk_end = ?, samples = ?, non_normal = ?, data = ?
+                            WHERE sensor_id = ? AND chunk_start = ? AND samples = ?
+                        ''', (ChunkStore.from_micros(times[-1]), len(rest), sum(1 for code in codes if code),
+                              GorillaCodec.encode(times, values, codes), sensor_id, chunk_start, samples))
+                    else:
+                        cursor = conn.execute('''
+                            DELETE FROM measurement_chunks WHERE sensor_id = ? AND chunk_start = ? AND samples = ?
+                        ''', (sensor_id, chunk_start, samples))
+                    changed += cursor.rowcount == 0
+        if changed:
+            # Блок пополнен после чтения: он будет архивирован повторно при следующем проходе
+            self.logger.warning(f"Блоков, измененных во время архивирования: {changed}")
+
+    def count_rows(self, path, fmt):
+        """Количество строк в файле архива"""
+        if fmt == 'parquet':
+            return pq.ParquetFile(path).metadata.num_rows
+        with pa.memory_map(path) as source:
+            return pa.ipc.open_file(source).read_all().num_rows
+
+
+class GorillaCodec:
+    """Сжатие ряда измерений одного датчика (по схеме Gorilla, Facebook)
+
+    Время (микросекунды) кодируется разностью разностей: при равномерном
+    опросе большинство отметок занимает 1 бит, при небольшом дрожании -
+    около 10-25 бит. Значение кодируется XOR с предыдущим: повтор - 1 бит,
+    иначе только значащие биты XOR. Статус - 1 бит, если не изменился,
+    иначе 3 бита. Кодирование без потерь.
+    """
+
+    # Разность разностей времени: (префикс, разрядность); иначе '11111' и 64 бита
+    DOD_BUCKETS = (('10', 7), ('110', 9), ('1110', 12), ('11110', 20))
+    MASK64 = (1 << 64) - 1
+
+    @staticmethod
+    def float_bits(value):
+        return struct.unpack('>Q', struct.pack('>d', value))[0]
+
+    @classmethod
+    def encode(cls, times, values, statuses):
+        """Упаковка ряда (время в мкс, значения, коды статуса) в байты"""
+        bits = [format(times[0], '064b'), format(cls.float_bits(values[0]), '064b'),
+                format(statuses[0], '02b')]
+        prev_time, prev_delta = times[0], 0
+        prev_bits, prev_leading, prev_trailing = cls.float_bits(values[0]), None, None
+        prev_status = statuses[0]
+
+        for timestamp, value, status in zip(times[1:], values[1:], statuses[1:]):
+            delta = timestamp - prev_time
+            dod = delta - prev_delta
+            prev_time, prev_delta = timestamp, delta
+            if dod == 0:
+                bits.append('0')
+            else:
+                for prefix, width in cls.DOD_BUCKETS:
+                    if -(1 << (width - 1)) <= dod < (1 << (width - 1)):
+                        bits.append(prefix + format(dod & ((1 << width) - 1), f'0{width}b'))
+                        break
+                else:
+                    bits.append('11111' + format(dod & cls.MASK64, '064b'))
+
+            value_bits = cls.float_bits(value)
+            xor = value_bits ^ prev_bits
+            prev_bits = value_bits
+            if xor == 0:
+                bits.append('0')
+            else:
+                leading = min(64 - xor.bit_length(), 31)
+                trailing = (xor & -xor).bit_length() - 1
+                if prev_leading is not None and leading >= prev_leading and trailing >= prev_trailing:
+                    width = 64 - prev_leading - prev_trailing
+                    bits.append('10' + format(xor >> prev_trailing, f'0{width}b'))
+                else:
+                    width = 64 - leading - trailing
+                    bits.append('11' + format(leading, '05b') + format(width - 1, '06b') +
+                                format(xor >> trailing, f'0{width}b'))
+                    prev_leading, prev_trailing = leading, trailing
+
+            if status == prev_status:
+                bits.append('0')
+            else:
+                bits.append('1' + format(status, '02b'))
+                prev_status = status
+
+        stream = ''.join(bits)
+        stream += '0' * (-len(stream) % 8)
+        return int(stream, 2).to_bytes(len(stream) // 8, 'big')
+
+    @classmethod
+    def decode(cls, data, count):
+        """Распаковка count измерений: (время в мкс, значения, коды статуса)"""
+        stream = format(int.from_bytes(data, 'big'), f'0{len(data) * 8}b')
+        times, values, statuses = [int(stream[:64], 2)], array('d'), array('b', [int(stream[128:130], 2)])
+        value_bits = int(stream[64:128], 2)
+        values.append(struct.unpack('>d', value_bits.to_bytes(8, 'big'))[0])
+        position = 130
+        delta = 0
+        leading = trailing = 0
+
+        for _ in range(count - 1):
+            # Время
+            if stream[position] == '0':
+                position += 1
+            else:
+                for prefix, width in cls.DOD_BUCKETS + (('11111', 64),):
+                    if stream.startswith(prefix, position):
+                        position += len(prefix)
+                        dod = int(stream[position:position + width], 2)
+                        if dod >= 1 << (width - 1):
+                            dod -= 1 << width
+                        position += width
+                        delta += dod
+                        break
+            times.append(times[-1] + delta)
+
+            # Значение
+            if stream[position] == '0':
+                position += 1
+            else:
+                if stream[position + 1] == '1':
+                    leading = int(stream[position + 2:position + 7], 2)
+                    width = int(stream[position + 7:position + 13], 2) + 1
+                    trailing = 64 - leading - width
+                    position += 13
+                else:
+                    width = 64 - leading - trailing
+                    position += 2
+                value_bits ^= int(stream[position:position + width], 2) << trailing
+                position += width
+            values.append(struct.unpack('>d', value_bits.to_bytes(8, 'big'))[0])
+
+            # Статус
+            if stream[position] == '0':
+                statuses.append(statuses[-1])
+                position += 1
+            else:
+                statuses.append(int(stream[position + 1:position + 3], 2))
+                position += 3
+
+        return times, values, statuses
+
+
+class ChunkStore:
+    """Сжатое хранение исходных измерений блоками по датчику и интервалу
+
+    Измерения старше заданного срока упаковываются (compact) в блоки
+    measurement_chunks: один BLOB GorillaCodec на датчик и интервал
+    chunk_seconds вместо сотни байт на строку measurements. Упаковка идет
+    по интервалам: чтение и кодирование - вне транзакции записи, затем
+    блоки записываются, а упакованные строки удаляются одной короткой
+    транзакцией. Чтение (measurements, sensor_summary) объединяет блоки
+    и еще не упакованные строки.
+    """
+
+    EPOCH = datetime(1970, 1, 1)
+
+    def __init__(self, db, chunk_seconds=3600, logger=None):
+        self.db = db
+        self.chunk_seconds = chunk_seconds
+        self.logger = logger or logging.getLogger(__name__)
+
+    @classmethod
+    def to_micros(cls, timestamp):
+        return (datetime.fromisoformat(str(timestamp)) - cls.EPOCH) // timedelta(microseconds=1)
+
+    @classmethod
+    def from_micros(cls, micros):
+        return (cls.EPOCH + timedelta(microseconds=micros)).isoformat(sep=' ')
+
+    def chunk_bounds(self, timestamp):
+        """Начало и конец интервала блока, содержащего timestamp"""
+        micros = self.to_micros(timestamp)
+        size = self.chunk_seconds * 1_000_000
+        start = micros - micros % size
+        return self.from_micros(start), self.from_micros(start + size)
+
+    def compact(self, before, stop_event=None):
+        """Упаковка измерений старше before; возвращает количество упакованных строк"""
+        packed = 0
+        cursor_time = ''
+        while stop_event is None or not stop_event.is_set():
+            with self.db.reader() as conn:
+                first = conn.execute('SELECT MIN(timestamp) FROM measurements WHERE timestamp >= ?',
+                                     (cursor_time,)).fetchone()[0]
+            if first is None or str(first) >= before:
+                break
+            start, end = self.chunk_bounds(first)
+            end = min(end, before)
+            packed += self.compact_range(start, end)
+            cursor_time = end
+        if packed:
+            self.logger.info(f"Упаковано измерений в блоки: {packed}")
+        return packed
+
+    def compact_range(self, start, end):
+        """Упаковка измерений интервала [start, end) одного блока"""
+        series = {}
+        max_id = 0
+        with self.db.reader() as conn:
+            for row_id, sensor_id, timestamp, level, status in conn.execute('''
+                SELECT id, sensor_id, timestamp, radiation_level, status
+                FROM measurements
+                WHERE timestamp >= ? AND timestamp < ?
+            ''', (start, end)):
+                series.setdefault(sensor_id, []).append(
+                    (self.to_micros(timestamp), level, MeasurementStore.STATUS_CODES.get(status, 0)))
+                max_id = max(max_id, row_id)
+            # Измерения, поступившие после упаковки интервала, добавляются в блок
+            for sensor_id, data, samples in conn.execute('''
+                SELECT sensor_id, data, samples FROM measurement_chunks WHERE chunk_start = ?
+            ''', (start,)):
+                if sensor_id in series:
+                    series[sensor_id].extend(zip(*GorillaCodec.decode(data, samples)))
+
+        rows = []
+        for sensor_id, points in series.items():
+            points.sort()
+            times, values, statuses = zip(*points)
+            rows.append((sensor_id, start, self.from_micros(times[-1]), len(points),
+                         sum(1 for status in statuses if status), GorillaCodec.encode(times, values, statuses)))
+
+        with self.db.writer() as conn:
+            conn.executemany('''
+                INSERT OR REPLACE INTO measurement_chunks (sensor_id, chunk_start, chunk_end, samples,
+                                                           non_normal, data)
+                VALUES (?, ?, ?, ?, ?, ?)
+            ''', rows)
+            removed = conn.execute('DELETE FROM measurements WHERE timestamp >= ? AND timestamp < ? AND id <= ?',
+                                   (start, end, max_id)).rowcount
+        return removed
+
+    def expand(self, before):
+        """Возврат блоков старше before в таблицу measurements (например, перед архивированием)"""
+        restored = 0
+        while True:
+            with self.db.reader() as conn:
+                chunks = conn.execute('''
+                    SELECT sensor_id, chunk_start, data, samples FROM measurement_chunks
+                    WHERE chunk_start < ? LIMIT 100
+                ''', (before,)).fetchall()
+            if not chunks:
+                return restored
+            with self.db.writer() as conn:
+                for sensor_id, chunk_start, data, samples in chunks:
+                    times, values, statuses = GorillaCodec.decode(data, samples)
+                    conn.executemany('''
+                        INSERT INTO measurements (sensor_id, radiation_level, timestamp, status)
+                        VALUES (?, ?, ?, ?)
+                    ''', [(sensor_id, value, self.from_micros(micros), MeasurementStore.STATUSES[status])
+                          for micros, value, status in zip(times, values, statuses)])
+                    conn.execute('DELETE FROM measurement_chunks WHERE sensor_id = ? AND chunk_start = ?',
+                                 (sensor_id, chunk_start))
+                    restored += samples
+
+    def delete_before(self, before):
+        """Удаление блоков, целиком старше before; возвращает количество измерений в них"""
+        with self.db.writer() as conn:
+            removed = conn.execute('SELECT COALESCE(SUM(samples), 0) FROM measurement_chunks WHERE chunk_end < ?',
+                                   (before,)).fetchone()[0]
+            conn.execute('DELETE FROM measurement_chunks WHERE chunk_end < ?', (before,))
+        return removed
+
+    def measurements(self, conn, start=None, end=None, sensor_ids=None):
+        """Измерения интервала [start, end): (timestamp, sensor_id, уровень, статус)
+
+        Сначала упакованные измерения, затем строки measurements (они новее
+        упакованных), в каждой части - по датчикам и времени.
+        """
+        # Отсутствующая граница не попадает в запрос: у measurements.timestamp
+        # числовое сходство типов, и строка-заглушка вроде '9999' стала бы числом
+        chunk_conditions, row_conditions, params = [], [], []
+        if start:
+            chunk_conditions.append('chunk_end >= ?')
+            row_conditions.append('timestamp >= ?')
+            params.append(start)
+        if end:
+            chunk_conditions.append('chunk_start < ?')
+            row_conditions.append('timestamp < ?')
+            params.append(end)
+        if sensor_ids:
+            condition = f"sensor_id IN ({', '.join('?' * len(sensor_ids))})"
+            chunk_conditions.append(condition)
+            row_conditions.append(condition)
+            params.extend(sensor_ids)
+
+        chunks = conn.execute(f'''
+            SELECT sensor_id, data, samples FROM measurement_chunks
+            {'WHERE ' + ' AND '.join(chunk_conditions) if chunk_conditions else ''}
+            ORDER BY sensor_id, chunk_start
+        ''', params).fetchall()
+        for sensor_id, data, samples in chunks:
+            times, values, statuses = GorillaCodec.decode(data, samples)
+            for micros, value, status in zip(times, values, statuses):
+                timestamp = self.from_micros(micros)
+                if (not start or timestamp >= start) and (not end or timestamp < end):
+                    yield timestamp, sensor_id, value, MeasurementStore.STATUSES[status]
+
+        yield from conn.execute(f'''
+            SELECT timestamp, sensor_id, radiation_level, status FROM measurements
+            {'WHERE ' + ' AND '.join(row_conditions) if row_conditions else ''}
+            ORDER BY sensor_id, timestamp
+        ''', params)
+
+    def sensor_summary(self, conn, start=None, end=None):
+        """Агрегаты по датчикам за [start, end) по исходным измерениям, в формате
+        RollupManager.sensor_summary: (sensor_id, среднее, максимум, минимум, количество, вне нормы)"""
+        totals = {}
+        for _, sensor_id, level, status in self.measurements(conn, start, end):
+            total = totals.get(sensor_id)
+            if total is None:
+                totals[sensor_id] = [level, level, level, 1, status != "НОРМА"]
+            else:
+                total[0] += level
+                total[1] = max(total[1], level)
+                total[2] = min(total[2], level)
+                total[3] += 1
+                total[4] += status != "НОРМА"
+        return [(sensor_id, total[0] / total[3], total[1], total[2], total[3], int(total[4]))
+                for sensor_id, total in sorted(totals.items())]
+
+    def materialize(self, conn, start, end):
+        """Распаковка блоков интервала во временную таблицу; возвращает подзапрос
+        SQL со всеми измерениями (строки и блоки) для агрегирующих запросов"""
+        conn.execute('''
+            CREATE TEMP TABLE IF NOT EXISTS chunk_measurements (
+                sensor_id TEXT, radiation_level REAL, timestamp DATETIME, status TEXT
+            )
+        ''')
+        conn.execute('DELETE FROM temp.chunk_measurements')
+        rows = conn.execute('''
+            SELECT sensor_id, data, samples FROM measurement_chunks WHERE chunk_end >= ? AND chunk_start < ?
+        ''', (start, end)).fetchall()
+        for sensor_id, data, samples in rows:
+            times, values, statuses = GorillaCodec.decode(data, samples)
+            conn.executemany('INSERT INTO temp.chunk_measurements VALUES (?, ?, ?, ?)',
+                             [(sensor_id, value, self.from_micros(micros), MeasurementStore.STATUSES[status])
+                              for micros, value, status in zip(times, values, statuses)])
+        return '''(SELECT sensor_id, radiation_level, timestamp, status FROM measurements
+                   UNION ALL
+                   SELECT sensor_id, radiation_level, timestamp, status FROM temp.chunk_measurements)'''
+
+
+class RetentionManager:
+    """Ограничение срока хранения исходных измерений
+
+    Периодически (раз в check_interval секунд) удаляет измерения старше
+    retention_days суток (0 - хранить бессрочно), при включенном архивировании
+    предварительно перенося их в колоночный архив. Агрегаты (rollup) хранятся
+    бессрочно; сутки, для которых агрегаты еще не рассчитаны, не удаляются. Удаление идет
+    небольшими пакетами, после него свободные страницы постепенно возвращаются
+    файловой системе шагами incremental_vacuum, так что сбор данных не блокируется.
+
+    Если задан chunks (ChunkStore) и compress_after_days > 0, измерения старше
+    compress_after_days суток упаковываются в сжатые блоки.
+    """
+
+    def __init__(self, db, retention_days=0, check_interval=3600, delete_batch=5000,
+                 vacuum_pages=1000, archive=None, archive_folder=None, archive_format='parquet',
+                 logger=None, on_change=None, chunks=None, compress_after_days=0):
+        self.db = db
+        self.retention_days = retention_days
+        self.chunks = chunks
+        self.compress_after_days = compress_after_days
+        self.check_interval = check_interval
+        self.delete_batch = delete_batch
+        self.vacuum_pages = vacuum_pages
+        self.archive = archive
+        self.archive_folder = archive_folder
+        self.archive_format = archive_format
+        self.logger = logger or logging.getLogger(__name__)
+        self.on_change = on_change
+        self.stop_event = threading.Event()
+        self.thread = None
+
+    def start(self):
+        """Запуск фонового потока обслуживания"""
+        self.thread = threading.Thread(target=self.retention_worker, daemon=True)
+        self.thread.start()
+
+    def stop(self):
+        """Остановка фонового потока"""
+        self.stop_event.set()
+        if self.thread:
+            self.thread.join(5)
+
+    def retention_worker(self):
+        """Рабочий поток: очистка устаревших данных по расписанию"""
+        while not self.stop_event.wait(self.check_interval):
+            try:
+                self.run_once()
+            except Exception as e:
+                self.logger.error(f"Ошибка очистки устаревших данных: {e}")
+
+    def covered_cutoff(self, cutoff_day):
+        """Граница удаления, не затрагивающая сутки без агрегатов (None - удалять нельзя)"""
+        with self.db.reader() as conn:
+            first_rollup = conn.execute('SELECT MIN(bucket) FROM rollup_day').fetchone()[0]
+            first = conn.execute('SELECT MIN(timestamp) FROM measurements').fetchone()[0]
+            if self.chunks is not None:
+                chunk_first = conn.execute('SELECT MIN(chunk_start) FROM measurement_chunks').fetchone()[0]
+                first = min(filter(None, (first, chunk_first)), default=None)
+
+        if first is None:
+            return cutoff_day
+        if first_rollup is None:
+            self.logger.warning("Агрегаты для отчетов не рассчитаны, измерения не удаляются. "
+                                "Выполните: python Coursework.py --backfill-rollups")
+            return None
+
+        # Измерения раньше первых суток с агрегатами в отчеты не вошли
+        if str(first)[:10] < str(first_rollup)[:10]:
+            self.logger.warning(f"Агрегаты рассчитаны только с {str(first_rollup)[:10]}, измерения не удаляются. "
+                                "Выполните: python Coursework.py --backfill-rollups")
+            return None
+        return cutoff_day
+
+    def run_once(self):
+        """Один проход очистки; возвращает количество удаленных измерений"""
+        removed = 0
+        cutoff_day = None
+        if self.retention_days > 0:
+            cutoff_day = self.covered_cutoff(datetime.now().date() - timedelta(days=self.retention_days))
+
+        if cutoff_day is not None and self.archive and self.archive_folder and self.archive.available():
+            removed = self.archive.archive(self.archive_folder, cutoff_day, self.archive_format)
+        elif cutoff_day is not None:
+            cutoff = day_range(cutoff_day)[0]
+            removed = self.db.delete_measurements('', cutoff, self.delete_batch, pause=0.05)
+            if self.chunks is not None:
+                removed += self.chunks.delete_before(cutoff)
+
+        if removed:
+            self.logger.info(f"Удалено устаревших измерений: {removed}")
+            if self.on_change:
+                self.on_change()
+
+        packed = 0
+        if self.chunks is not None and self.compress_after_days > 0:
+            compress_day = datetime.now().date() - timedelta(days=self.compress_after_days)
+            packed = self.chunks.compact(day_range(compress_day)[0], self.stop_event)
+
+        if removed or packed:
+            self.vacuum()
+
+        return removed
+
+    def vacuum(self):
+        """Постепенное освобождение места в файле БД"""
+        while not self.stop_event.is_set():
+            if self.db.incremental_vacuum(self.vacuum_pages) == 0:
+                break
+            self.stop_event.wait(0.05)
+
+
+class BackupEngine:
+    """Резервное копирование и восстановление БД
+
+    Полная копия создается через SQLite backup API по pages_per_step страниц
+    за шаг с паузой между шагами, поэтому запись измерений не
+    приостанавливается. Копия снимается с одного согласованного состояния БД
+    (открытая транзакция чтения в режиме WAL).
+
+    Разностные копии содержат только новые измерения и оповещения, а также
+    справочник датчиков, агрегаты и сжатые блоки измерений за сутки, начиная с базовой копии:
+    differential - относительно последней полной копии, incremental -
+    относительно последней копии любого вида. Восстановление применяет полную
+    копию и цепочку разностных копий до выбранной.
+    """
+
+    KINDS = ('full', 'differential', 'incremental')
+    FILE_PREFIX = 'radiation_system_backup_'
+
+    def __init__(self, db, logger=None, pages_per_step=1024, step_pause=0.01, chunk_size=5000):
+        self.db = db
+        self.logger = logger or logging.getLogger(__name__)
+        self.pages_per_step = pages_per_step
+        self.step_pause = step_pause
+        self.chunk_size = chunk_size
+
+    def backup(self, folder, kind='full', progress=None):
+        """Создание резервной копии в папке folder; возвращает путь к файлу"""
+        timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+
+        if kind == 'full':
+            path = os.path.join(folder, f"{self.FILE_PREFIX}{timestamp}.db")
+            self.full_backup(path, progress)
+        else:
+            base = self.find_latest(folder, full_only=(kind == 'differential'))
+            if base is None:
+                raise ValueError("Не найдена базовая полная резервная копия")
+            path = os.path.join(folder, f"{self.FILE_PREFIX}{timestamp}_{kind}.db")
+            self.delta_backup(path, base, kind, progress)
+
+        self.logger.info(f"Создана резервная копия ({kind}): {path}")
+        return path
+
+    def snapshot(self):
+        """Соединение чтения с открытой транзакцией и максимальные id на момент снимка"""
+        src = self.db.connect(read_only=True)
+        src.execute('BEGIN')
+        max_measurement_id = src.execute('SELECT COALESCE(MAX(id), 0) FROM measurements').fetchone()[0]
+        max_alert_id = src.execute('SELECT COALESCE(MAX(id), 0) FROM alerts').fetchone()[0]
+        return src, max_measurement_id, max_alert_id
+
+    def write_info(self, dst, info):
+        """Запись сведений о копии в таблицу backup_info файла копии"""
+        dst.execute('CREATE TABLE IF NOT EXISTS backup_info (key TEXT PRIMARY KEY, value TEXT)')
+        dst.execute('DELETE FROM backup_info')
+        dst.executemany('INSERT INTO backup_info VALUES (?, ?)',
+                        [(key, str(value)) for key, value in info.items()])
+        dst.commit()
+
+    def read_info(self, path):
+        """Сведения о резервной копии (пустой словарь, если их нет)"""
+        conn = sqlite3.connect(f"file:{pathname2url(os.path.abspath(path))}?mode=ro", uri=True)
+        try:
+            return dict(conn.execute('SELECT key, value FROM backup_info').fetchall())
+        except sqlite3.Error:
+            return {}
+        finally:
+            conn.close()
+
+    def full_backup(self, path, progress=None):
+        """Полная копия через backup API"""
+        src, max_measurement_id, max_alert_id = self.snapshot()
+        dst = sqlite3.connect(path)
+        try:
+            def on_step(status, remaining, total):
+                if progress:
+                    progress(total - remaining, total)
+
+            src.backup(dst, pages=self.pages_per_step, progress=on_step, sleep=self.step_pause)
+            # Копия - один самостоятельный файл без журнала WAL
+            dst.execute('PRAGMA journal_mode = DELETE')
+            self.write_info(dst, {
+                'kind': 'full',
+                'created': datetime.now().isoformat(sep=' '),
+                'base': '',
+                'max_measurement_id': max_measurement_id,
+                'max_alert_id': max_alert_id
+            })
+        finally:
+            src.rollback()
+            src.close()
+            dst.close()
+
+    def delta_backup(self, path, base, kind, progress=None):
+        """Разностная копия относительно базовой копии base"""
+        base_info = self.read_info(base)
+        from_day = day_range(datetime.fromisoformat(base_info['created']).date())[0]
+        src, max_measurement_id, max_alert_id = self.snapshot()
+        dst = sqlite3.connect(path)
+
+        # Таблица: (условие отбора строк, параметры)
+        tables = [
+            ('sensors', '', ()),
+            ('measurements', 'WHERE id > ?', (int(base_info['max_measurement_id']),)),
+            ('alerts', 'WHERE id > ?', (int(base_info['max_alert_id']),)),
+            # Измерения, упакованные после базовой копии, из measurements уже удалены
+            ('measurement_chunks', 'WHERE chunk_start >= ?', (from_day,)),
+            ('rollup_minute', 'WHERE bucket >= ?', (from_day,)),
+            ('rollup_hour', 'WHERE bucket >= ?', (from_day,)),
+            ('rollup_day', 'WHERE bucket >= ?', (from_day,))
+        ]
+
+        try:
+            for i, (table, where, params) in enumerate(tables):
+                schema = src.execute("SELECT sql FROM sqlite_master WHERE type = 'table' AND name = ?",
+                                     (table,)).fetchone()
+                if schema is None:
+                    continue
+                dst.execute(schema[0])
+
+                cursor = src.execute(f'SELECT * FROM {table} {where}', params)
+                while True:
+                    rows = cursor.fetchmany(self.chunk_size)
+                    if not rows:
+                        break
+                    placeholders = ', '.join('?' * len(rows[0]))
+                    dst.executemany(f'INSERT INTO {table} VALUES ({placeholders})', rows)
+                dst.commit()
+
+                if progress:
+                    progress(i + 1, len(tables))
+
+            self.write_info(dst, {
+                'kind': kind,
+                'created': datetime.now().isoformat(sep=' '),
+                'base': os.path.basename(base),
+                'max_measurement_id': max_measurement_id,
+                'max_alert_id': max_alert_id
+            })
+        finally:
+            src.rollback()
+            src.close()
+            dst.close()
+
+    def list_backups(self, folder):
+        """Резервные копии в папке, упорядоченные по времени создания"""
+        backups = []
+        for name in os.listdir(folder):
+            if name.startswith(self.FILE_PREFIX) and name.endswith('.db'):
+                info = self.read_info(os.path.join(folder, name))
+                if info:
+                    backups.append((info['created'], os.path.join(folder, name), info))
+        return sorted(backups)
+
+    def find_latest(self, folder, full_only=False):
+        """Последняя резервная копия (только полная при full_only)"""
+        for _, path, info in reversed(self.list_backups(folder)):
+            if not full_only or info['kind'] == 'full':
+                return path
+        return None
+
+    def chain(self, path):
+        """Цепочка копий от полной до path"""
+        chain = [path]
+        info = self.read_info(path)
+        if not info:
+            # Копия старого формата (копия файла) - считается полной
+            return chain
+
+        while info['kind'] != 'full':
+            base = os.path.join(os.path.dirname(path), info['base'])
+            if not os.path.exists(base):
+                raise FileNotFoundError(f"Не найдена базовая копия {info['base']}")
+            chain.insert(0, base)
+            info = self.read_info(base)
+        return chain
+
+    def restore(self, path, progress=None, prepare=None, replaced=None):
+        """Восстановление БД из резервной копии (с цепочкой разностных копий)
+
+        Цепочка копий собирается во временном файле рядом с БД, без блокировки
+        записи: сбор данных продолжается в прежнюю БД. Затем под блокировкой
+        записи собранная БД одним шагом backup API заменяет рабочую; измерения,
+        записанные за время сборки, заменяются вместе с прежними данными.
+        prepare(db) вызывается для временной БД после восстановления полной
+        копии, до применения разностных, - например, для обновления схемы копии
+        прежней версии; replaced() - сразу после замены, под блокировкой записи.
+        """
+        chain = self.chain(path)
+        staging_path = f"{self.db.db_path}.restore"
+        self.remove_files(staging_path)
+
+        staging = DatabaseManager(staging_path, pool_size=1)
+        try:
+            src = sqlite3.connect(chain[0])
+            try:
+                def on_step(status, remaining, total):
+                    if progress:
+                        progress(total - remaining, total)
+
+                src.backup(staging.writer_conn, pages=self.pages_per_step, progress=on_step)
+            finally:
+                src.close()
+
+            conn = staging.writer_conn
+            conn.execute('PRAGMA journal_mode = WAL')
+            if prepare:
+                prepare(staging)
+            for delta in chain[1:]:
+                self.apply_delta(conn, delta)
+            conn.execute('DROP TABLE IF EXISTS backup_info')
+            conn.commit()
+
+            with self.db.write_lock:
+                conn.backup(self.db.writer_conn)
+                self.db.writer_conn.execute('PRAGMA journal_mode = WAL')
+                if replaced:
+                    replaced()
+        finally:
+            staging.close()
+            self.remove_files(staging_path)
+
+        self.logger.info(f"БД восстановлена из резервной копии: {path} (файлов в цепочке: {len(chain)})")
+        return len(chain)
+
+    @staticmethod
+    def remove_files(path):
+        """Удаление файла БД вместе с журналом WAL"""
+        for name in (path, f"{path}-wal", f"{path}-shm"):
+            if os.path.exists(name):
+                os.remove(name)
+
+    def apply_delta(self, conn, path):
+        """Применение разностной копии к БД"""
+        delta = sqlite3.connect(path)
+        try:
+            # Блоки применяются до строк measurements: строки, поступившие после
+            # упаковки блока, не должны удаляться вместе с упакованными
+            for table, verb in (('sensors', 'INSERT OR REPLACE'), ('measurement_chunks', 'INSERT OR REPLACE'),
+                                ('measurements', 'INSERT OR IGNORE'), ('alerts', 'INSERT OR IGNORE'),
+                                ('rollup_minute', 'INSERT OR REPLACE'), ('rollup_hour', 'INSERT OR REPLACE'),
+                                ('rollup_day', 'INSERT OR REPLACE')):
+                exists = delta.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = ?",
+                                       (table,)).fetchone()
+                if not exists:
+                    continue
+                cursor = delta.execute(f'SELECT * FROM {table}')
+                # Столбцы по именам: копия могла быть создана при другой версии схемы
+                columns = ', '.join(column[0] for column in cursor.description)
+                placeholders = ', '.join('?' * len(cursor.description))
+                while True:
+                    rows = cursor.fetchmany(self.chunk_size)
+                    if not rows:
+                        break
+                    conn.executemany(f'{verb} INTO {table} ({columns}) VALUES ({placeholders})', rows)
+                    if table == 'measurement_chunks':
+                        # Блок заменяет строки того же датчика за свой интервал
+                        conn.executemany('''
+                            DELETE FROM measurements WHERE sensor_id = ? AND timestamp >= ? AND timestamp <= ?
+                        ''', [(row[0], row[1], row[2]) for row in rows])
+        finally:
+            delta.close()
+
+
+class MeasurementWriter:
+    """Фоновая пакетная запись измерений в базу данных
+
+    Измерения помещаются в ограниченную очередь и записываются отдельным потоком
+    через executemany одной транзакцией - по окончании цикла опроса (flush_cycle)
+    либо не реже, чем раз в flush_interval_ms миллисекунд.
+
+    Окно потери данных: при аварийном завершении процесса теряются измерения,
+    ещё не записанные в БД, - не более одного цикла опроса или flush_interval_ms
+    (что меньше). При штатной остановке stop() дописывает всё, что осталось в очереди.
+    Пакет, запись которого не удалась (например, БД временно заблокирована),
+    записывается повторно до retries раз с экспоненциально растущей паузой backoff.
+    """
+
+    _FLUSH = object()
+    _STOP = object()
+
+    def __init__(self, db, queue_size=10000, flush_interval_ms=1000, logger=None, rollups=None,
+                 retries=5, backoff=0.1):
+        self.db = db
+        self.rollups = rollups
+        self.retries = retries
+        self.backoff = backoff
+        self.queue = queue.Queue(maxsize=queue_size)
+        self.max_batch = queue_size
+        self.flush_interval = flush_interval_ms / 1000
+        self.put_deadline = None  # граница ожидания места в очереди для текущего цикла опроса
+        self.dropped = 0  # измерений цикла, отброшенных при переполнении очереди
+        self.logger = logger or logging.getLogger(__name__)
+        self.thread = None
+
+    def start(self):
+        """Запуск потока записи"""
+        self.thread = threading.Thread(target=self.writer_worker, daemon=True)
+        self.thread.start()
+
+    def put(self, sensor_id, radiation_level, timestamp, status):
+        """Постановка измерения в очередь на запись (из потока сбора данных)
+
+        При переполнении очереди ожидание места ограничено одним интервалом
+        записи на весь цикл опроса, затем измерения цикла отбрасываются.
+        """
+        item = (sensor_id, radiation_level, timestamp, status)
+        try:
+            self.queue.put_nowait(item)
+            return True
+        except queue.Full:
+            pass
+
+        now = time.monotonic()
+        if self.put_deadline is None:
+            self.put_deadline = now + self.flush_interval
+        try:
+            self.queue.put(item, timeout=max(0, self.put_deadline - now))
+            return True
+        except queue.Full:
+            self.dropped += 1
+            return False
+
+    def flush_cycle(self):
+        """Завершение цикла опроса: накопленные измерения записываются одной транзакцией"""
+        if self.dropped:
+            self.logger.error(f"Очередь записи переполнена, отброшено измерений за цикл: {self.dropped}")
+            self.dropped = 0
+        self.put_deadline = None
+        self.queue.put(self._FLUSH)
+
+    def stop(self, timeout=10):
+        """Остановка потока записи с записью оставшихся измерений"""
+        if self.thread and self.thread.is_alive():
+            self.queue.put(self._STOP)
+            self.thread.join(timeout)
+
+    def writer_worker(self):
+        """Рабочий поток записи измерений"""
+        batch = []
+        deadline = time.monotonic() + self.flush_interval
+        running = True
+
+        while running:
+            try:
+                item = self.queue.get(timeout=max(0, deadline - time.monotonic()))
+            except queue.Empty:
+                item = self._FLUSH
+
+            if item is self._STOP:
+                running = False
+                item = self._FLUSH
+
+            if item is not self._FLUSH:
+                batch.append(item)
+
+            if item is self._FLUSH or len(batch) >= self.max_batch or time.monotonic() >= deadline:
+                self.write_batch(batch)
+                batch = []
+                deadline = time.monotonic() + self.flush_interval
+
+        if self.rollups:
+            try:
+                with self.db.writer() as conn:
+                    self.rollups.flush_sketches(conn)
+            except sqlite3.Error as e:
+                self.logger.error(f"Ошибка записи скетчей квантилей в БД: {e}")
+
+    def write_batch(self, batch):
+        """Запись пакета измерений одной транзакцией"""
+        if not batch:
+            return
+
+        for attempt in range(self.retries + 1):
+            try:
+                # Скетчи в памяти обновляются до того, как БД может быть заменена (restore)
+                with self.db.write_lock:
+                    with self.db.writer() as conn:
+                        conn.executemany('''
+                            INSERT INTO measurements (sensor_id, radiation_level, timestamp, status)
+                            VALUES (?, ?, ?, ?)
+                        ''', batch)
+                        if self.rollups:
+                            self.rollups.update(conn, batch)
+                    if self.rollups:
+                        self.rollups.commit_sketches()
+                self.logger.debug(f"Записано измерений: {len(batch)}")
+                return
+            except sqlite3.Error as e:
+                if self.rollups:
+                    self.rollups.commit_sketches(committed=False)
+                if attempt == self.retries:
+                    self.logger.error(f"Ошибка пакетной записи измерений в БД, отброшено измерений "
+                                      f"{len(batch)}: {e}")
+                    return
+                pause = self.backoff * (2 ** attempt)
+                self.logger.warning(f"Ошибка пакетной записи измерений в БД, повтор через {pause:.1f} с: {e}")
+                time.sleep(pause)
+
+
+class StatusClassifier:
+    """Классификация измерений цикла опроса одним проходом
+
+    Пороги задаются для каждого датчика (sensors.threshold - порог
+    предупреждения, порог опасности пропорционален ему). Для пакета
+    показаний коды статуса (индекс в MeasurementStore.STATUSES) вычисляются
+    векторно: с NumPy - операциями над массивами, без него - одним проходом
+    по спискам. Массивы порогов, выровненные по порядку датчиков в пакете,
+    кэшируются: опрос возвращает датчики в одном и том же порядке.
+    """
+
+    def __init__(self, warning, danger):
+        self.warning = warning
+        self.danger = danger
+        self.thresholds = {}  # датчик -> (предупреждение, опасность)
+        self.batch_ids = None
+        self.batch_thresholds = None
+
+    def set_thresholds(self, warning, danger, sensor_thresholds):
+        """Общие пороги и пороги предупреждения датчиков {датчик: порог}"""
+        self.warning = warning
+        self.danger = danger
+        ratio = danger / warning if warning else 1.0
+        self.thresholds = {sensor_id: (threshold, threshold * ratio)
+                           for sensor_id, threshold in sensor_thresholds.items() if threshold is not None}
+        self.batch_ids = None
+
+    def sensor_thresholds(self, sensor_id):
+        """Пороги датчика (предупреждение, опасность)"""
+        return self.thresholds.get(sensor_id, (self.warning, self.danger))
+
+    def aligned(self, sensor_ids):
+        """Пороги в порядке датчиков пакета"""
+        if sensor_ids != self.batch_ids:
+            pairs = [self.sensor_thresholds(sensor_id) for sensor_id in sensor_ids]
+            warning = [pair[0] for pair in pairs]
+            danger = [pair[1] for pair in pairs]
+            if np is not None:
+                warning, danger = np.array(warning), np.array(danger)
+            self.batch_ids = list(sensor_ids)
+            self.batch_thresholds = warning, danger
+        return self.batch_thresholds
+
+    def classify(self, sensor_ids, values):
+        """Коды статуса: 0 - норма, 1 - предупреждение, 2 - опасно"""
+        warning, danger = self.aligned(sensor_ids)
+        if np is not None:
+            values = np.asarray(values, dtype=float)
+            return ((values >= warning).astype(np.int8) + (values >= danger)).tolist()
+        return [(value >= low) + (value >= high) for value, low, high in zip(values, warning, danger)]
+
+    @staticmethod
+    def candidates(sensor_ids, codes, active):
+        """Номера показаний, требующих проверки оповещений
+
+        Это превышения порога и датчики, по которым оповещение еще не снято
+        (active), остальные показания не меняют состояния оповещений.
+        """
+        if np is not None and not active:
+            return np.flatnonzero(codes).tolist()
+        return [index for index, code in enumerate(codes) if code or sensor_ids[index] in active]
+
+
+class AlertStateMachine:
+    """Состояние оповещений по каждому датчику: НОРМА -> WARNING -> CRITICAL -> снято
+
+    Событие (запись в журнал и письмо) создается только при смене состояния
+    и как напоминание раз в reminder секунд, пока состояние сохраняется.
+    Повышение уровня происходит при достижении порога, понижение - только
+    когда уровень опустился ниже порога на долю hysteresis. Новое состояние
+    должно удерживаться raise_hold (повышение) или clear_hold (понижение)
+    секунд, поэтому колебания около порога не порождают лавину оповещений.
+    """
+
+    NORMAL, WARNING, CRITICAL = 0, 1, 2
+    TYPES = {NORMAL: "CLEARED", WARNING: "WARNING", CRITICAL: "CRITICAL"}
+
+    def __init__(self, hysteresis=0.1, raise_hold=0, clear_hold=60, reminder=3600):
+        self.hysteresis = hysteresis
+        self.raise_hold = raise_hold
+        self.clear_hold = clear_hold
+        self.reminder = reminder
+        self.sensors = {}  # датчик -> [состояние, кандидат, с какого времени кандидат, время события]
+        self.active = set()  # датчики с неснятым оповещением или ожидающие смены состояния
+
+    def restore(self, conn):
+        """Состояние по последнему оповещению каждого датчика (после перезапуска)
+
+        Учитываются только оповещения, записанные самим автоматом (event задан):
+        оповещения прежних версий не снимались, и датчики с ними начинают с НОРМЫ.
+        """
+        levels = {name: level for level, name in self.TYPES.items()}
+        for sensor_id, alert_type, timestamp in conn.execute('''
+            SELECT sensor_id, alert_type, timestamp
+            FROM alerts
+            WHERE id IN (SELECT MAX(id) FROM alerts
+                         WHERE alert_type IN ('WARNING', 'CRITICAL', 'CLEARED') AND event IS NOT NULL
+                         GROUP BY sensor_id)
+        '''):
+            state = levels.get(alert_type, self.NORMAL)
+            sent = datetime.fromisoformat(str(timestamp)).timestamp()
+            self.sensors[sensor_id] = [state, state, sent, sent]
+            if state != self.NORMAL:
+                self.active.add(sensor_id)
+
+    def target(self, state, value, warning, danger):
+        """Уровень, соответствующий значению, с учетом гистерезиса"""
+        clear = 1 - self.hysteresis
+        if value >= danger or (state == self.CRITICAL and value >= danger * clear):
+            return self.CRITICAL
+        if value >= warning or (state >= self.WARNING and value >= warning * clear):
+            return self.WARNING
+        return self.NORMAL
+
+    def update(self, sensor_id, value, now, warning, danger):
+        """Новое измерение; возвращает (событие, уровень) или None
+
+        События: raised, escalated, downgraded, cleared, reminder.
+        """
+        record = self.sensors.get(sensor_id)
+        if record is None:
+            record = self.sensors[sensor_id] = [self.NORMAL, self.NORMAL, now, now]
+        change = self.transition(record, value, now, warning, danger)
+        if record[0] != self.NORMAL or record[1] != self.NORMAL:
+            self.active.add(sensor_id)
+        else:
+            self.active.discard(sensor_id)
+        return change
+
+    def transition(self, record, value, now, warning, danger):
+        """Переход состояния одного датчика"""
+        state, candidate, since, sent = record
+
+        target = self.target(state, value, warning, danger)
+        if target == state:
+            record[1] = state
+            if state != self.NORMAL and self.reminder and now - sent >= self.reminder:
+                record[3] = now
+                return 'reminder', state
+            return None
+
+        if target != candidate:
+            record[1], record[2] = target, now
+            since = now
+        if now - since < (self.raise_hold if target > state else self.clear_hold):
+            return None
+
+        record[0], record[3] = target, now
+        if state == self.NORMAL:
+            return 'raised', target
+        if target == self.NORMAL:
+            return 'cleared', target
+        return ('escalated' if target > state else 'downgraded'), target
+
+    def reset(self):
+        self.sensors.clear()
+        self.active.clear()
+
+
+class ContactRateLimiter:
+    """Ограничение числа писем одному адресату: не больше limit за window секунд"""
+
+    def __init__(self, limit, window):
+        self.limit = limit
+        self.window = window
+        self.sent = {}  # адресат -> deque времени отправленных писем
+        self.lock = threading.Lock()
+
+    def allow(self, contact, now=None):
+        """Можно ли отправить письмо сейчас (разрешенная отправка учитывается)"""
+        if not self.limit:
+            return True
+        now = time.monotonic() if now is None else now
+        with self.lock:
+            sent = self.sent.setdefault(contact, deque())
+            while sent and now - sent[0] >= self.window:
+                sent.popleft()
+            if len(sent) >= self.limit:
+                return False
+            sent.append(now)
+            return True
+
+    def refund(self, contact):
+        """Возврат места в окне после неудачной отправки разрешенного письма"""
+        if not self.limit:
+            return
+        with self.lock:
+            sent = self.sent.get(contact)
+            if sent:
+                sent.pop()
+
+    def wait_time(self, contact, now=None):
+        """Секунд до освобождения места в окне для адресата"""
+        now = time.monotonic() if now is None else now
+        with self.lock:
+            sent = self.sent.get(contact)
+            if not sent or len(sent) < self.limit:
+                return 0.0
+            return max(0.0, self.window - (now - sent[0]))
+
+
+class SMTPConnectionPool:
+    """Пул SMTP-соединений с повторным использованием (keep-alive)
+
+    Подключение, STARTTLS и авторизация выполняются один раз на соединение,
+    после отправки соединение возвращается в пул. Соединение, простаивавшее
+    дольше keepalive секунд, перед использованием проверяется командой NOOP.
+    Соединение, на котором произошла ошибка, закрывается.
+    """
+
+    def __init__(self, host, port, sender, username=None, password=None, use_tls=False,
+                 timeout=10, size=2, keepalive=60):
+        self.host = host
+        self.port = port
+        self.sender = sender
+        self.username = username
+        self.password = password
+        self.use_tls = use_tls
+        self.timeout = timeout
+        self.size = size
+        self.keepalive = keepalive
+        self.idle = queue.LifoQueue()  # (соединение, время последнего использования)
+
+    def open(self):
+        """Новое соединение с сервером"""
+        smtp = smtplib.SMTP(self.host, self.port, timeout=self.timeout)
+        if self.use_tls:
+            smtp.starttls()
+        if self.username:
+            smtp.login(self.username, self.password)
+        return smtp
+
+    def acquire(self):
+        """Свободное соединение из пула или новое"""
+        while True:
+            try:
+                smtp, last_used = self.idle.get_nowait()
+            except queue.Empty:
+                return self.open()
+            if time.monotonic() - last_used < self.keepalive:
+                return smtp
+            try:
+                if smtp.noop()[0] == 250:
+                    return smtp
+            except smtplib.SMTPException:
+                pass
+            except OSError:
+                pass
+            self.discard(smtp)
+
+    def discard(self, smtp):
+        try:
+            smtp.quit()
+        except (smtplib.SMTPException, OSError):
+            smtp.close()
+
+    @contextmanager
+    def connection(self):
+        """Соединение на время отправки"""
+        smtp = self.acquire()
+        try:
+            yield smtp
+        except BaseException:
+            self.discard(smtp)
+            raise
+        if self.idle.qsize() < self.size:
+            self.idle.put((smtp, time.monotonic()))
+        else:
+            self.discard(smtp)
+
+    def send(self, recipients, subject, message):
+        """Отправка письма через соединение из пула"""
+        mail = MIMEText(message, 'plain', 'utf-8')
+        mail['Subject'] = Header(subject, 'utf-8')
+        mail['From'] = self.sender
+        mail['To'] = ', '.join(recipients)
+        with self.connection() as smtp:
+            smtp.sendmail(self.sender, recipients, mail.as_string())
+
+    def close(self):
+        """Закрытие свободных соединений (например, после смены настроек сервера)"""
+        while True:
+            try:
+                smtp, _ = self.idle.get_nowait()
+            except queue.Empty:
+                return
+            self.discard(smtp)
+
+
+class NotificationDispatcher:
+    """Асинхронная отправка оповещений об превышениях
+
+    Очередь хранится в таблице alerts: оповещение ожидает отправки, пока
+    notified = 0. Поток сбора данных только ставит id оповещения в очередь,
+    письма отправляют workers рабочих потоков. При ошибке отправки число
+    попыток (attempts) увеличивается и отправка повторяется через
+    backoff * 2^(попытка - 1) секунд; после max_attempts попыток оповещение
+    помечается notified = 2. При запуске в очередь возвращаются оповещения,
+    не отправленные до остановки.
+
+    Если адресат исчерпал лимит писем (rate_limiter), оповещения для него
+    копятся и отправляются одной сводкой, когда лимит освободится.
+    """
+
+    PENDING, SENT, FAILED = 0, 1, 2
+    _STOP = None
+
+    def __init__(self, db, format_alert, send, recipients, workers=2, max_attempts=5, backoff=5.0,
+                 rate_limiter=None, logger=None, on_result=None):
+        self.db = db
+        self.format_alert = format_alert
+        self.send = send
+        self.recipients = recipients
+        self.workers = workers
+        self.max_attempts = max_attempts
+        self.backoff = backoff
+        self.rate_limiter = rate_limiter
+        self.logger = logger or logging.getLogger(__name__)
+        self.on_result = on_result
+        self.queue = queue.Queue()
+        self.threads = []
+        self.timers = set()
+        self.digests = {}  # адресат -> {id оповещения: тема письма}
+        self.digest_lock = threading.Lock()
+        self.stopping = threading.Event()
+
+    def start(self):
+        """Запуск рабочих потоков и возврат в очередь неотправленных оповещений"""
+        with self.db.reader() as conn:
+            pending = [row[0] for row in conn.execute(
+                'SELECT id FROM alerts WHERE notified = ? ORDER BY id', (self.PENDING,))]
+        for alert_id in pending:
+            self.queue.put(alert_id)
+        if pending:
+            self.logger.info(f"Неотправленных оповещений в очереди: {len(pending)}")
+
+        for _ in range(self.workers):
+            thread = threading.Thread(target=self.dispatch_worker, daemon=True)
+            thread.start()
+            self.threads.append(thread)
+
+    def enqueue(self, alert_id):
+        """Постановка оповещения в очередь отправки (без ожидания)"""
+        self.queue.put(alert_id)
+
+    def stop(self, timeout=5):
+        """Остановка рабочих потоков; неотправленные оповещения остаются в БД"""
+        self.stopping.set()
+        for timer in list(self.timers):
+            timer.cancel()
+        for _ in self.threads:
+            self.queue.put(self._STOP)
+        for thread in self.threads:
+            thread.join(timeout)
+
+    def dispatch_worker(self):
+        """Рабочий поток: отправка оповещений и сводок из очереди"""
+        while True:
+            item = self.queue.get()
+            if item is self._STOP:
+                return
+            try:
+                if isinstance(item, tuple):
+                    self.send_digest(item[1])
+                else:
+                    self.deliver(item)
+            except Exception as e:
+                self.logger.error(f"Ошибка обработки оповещения {item}: {e}")
+
+    def deliver(self, alert_id):
+        """Отправка одного оповещения и учет результата в БД"""
+        with self.db.reader() as conn:
+            row = conn.execute('''
+                SELECT id, sensor_id, alert_type, threshold_value, actual_value, timestamp, event, attempts
+                FROM alerts
+                WHERE id = ? AND notified = ?
+            ''', (alert_id, self.PENDING)).fetchone()
+        if row is None:
+            return  # уже отправлено или журнал очищен
+
+        subject, message = self.format_alert(row)
+        ready = []
+        for contact in self.recipients():
+            if self.rate_limiter is None or self.rate_limiter.allow(contact):
+                ready.append(contact)
+            else:
+                self.hold(contact, alert_id, subject)
+        if not ready:
+            return  # оповещение будет отправлено в сводке
+
+        attempts = (row[-1] or 0) + 1
+        try:
+            self.send(subject, message, ready)
+        except Exception as e:
+            # Неотправленное письмо не расходует лимит адресата
+            if self.rate_limiter is not None:
+                for contact in ready:
+                    self.rate_limiter.refund(contact)
+            status = self.FAILED if attempts >= self.max_attempts else self.PENDING
+            with self.db.writer() as conn:
+                conn.execute('UPDATE alerts SET attempts = ?, notified = ? WHERE id = ?',
+                             (attempts, status, alert_id))
+            if status == self.FAILED:
+                self.logger.error(f"Оповещение {alert_id} не отправлено после {attempts} попыток: {e}")
+                self.report(alert_id, status)
+            elif not self.stopping.is_set():
+                delay = self.backoff * 2 ** (attempts - 1)
+                self.logger.warning(f"Ошибка отправки оповещения {alert_id} (попытка {attempts}), "
+                                    f"повтор через {delay:.1f} с: {e}")
+                self.schedule(delay, alert_id)
+            return
+
+        with self.db.writer() as conn:
+            conn.execute('UPDATE alerts SET attempts = ?, notified = ? WHERE id = ?',
+                         (attempts, self.SENT, alert_id))
+        self.logger.info(f"Оповещение {alert_id} отправлено: {subject}")
+        self.report(alert_id, self.SENT)
+
+    def hold(self, contact, alert_id, subject, delay=None):
+        """Откладывание оповещения в сводку для адресата, превысившего лимит"""
+        with self.digest_lock:
+            digest = self.digests.get(contact)
+            if digest is None:
+                digest = self.digests[contact] = {}
+                if delay is None:
+                    delay = self.rate_limiter.wait_time(contact)
+                self.schedule(delay, ('digest', contact))
+            digest[alert_id] = subject
+
+    def send_digest(self, contact):
+        """Отправка накопленных оповещений адресату одним письмом"""
+        with self.digest_lock:
+            digest = self.digests.pop(contact, None)
+        if not digest:
+            return
+        if self.rate_limiter is not None and not self.rate_limiter.allow(contact):
+            for alert_id, subject in digest.items():
+                self.hold(contact, alert_id, subject)
+            return
+
+        subject = f"Сводка оповещений системы контроля радиации: {len(digest)}"
+        message = "\n".join(digest[alert_id] for alert_id in sorted(digest))
+        try:
+            self.send(subject, message, [contact])
+        except Exception as e:
+            self.logger.warning(f"Ошибка отправки сводки оповещений ({contact}): {e}")
+            if self.rate_limiter is not None:
+                self.rate_limiter.refund(contact)
+            if not self.stopping.is_set():
+                for alert_id, subject in digest.items():
+                    self.hold(contact, alert_id, subject, delay=self.backoff)
+            return
+
+        placeholders = ', '.join('?' * len(digest))
+        with self.db.writer() as conn:
+            sent = [row[0] for row in conn.execute(
+                f'SELECT id FROM alerts WHERE notified = ? AND id IN ({placeholders})',
+                (self.PENDING, *digest))]
+            conn.execute(f'UPDATE alerts SET notified = ? WHERE notified = ? AND id IN ({placeholders})',
+                         (self.SENT, self.PENDING, *digest))
+        self.logger.info(f"Сводка оповещений отправлена ({contact}): {len(digest)}")
+        for alert_id in sent:
+            self.report(alert_id, self.SENT)
+
+    def schedule(self, delay, item):
+        """Постановка в очередь через delay секунд (повтор отправки или сводка)"""
+        def fire():
+            self.timers.discard(timer)
+            self.queue.put(item)
+
+        timer = threading.Timer(delay, fire)
+        timer.daemon = True
+        self.timers.add(timer)
+        timer.start()
+
+    def report(self, alert_id, status):
+        if self.on_result:
+            self.on_result(alert_id, status)
+
+
+class SensorDriver:
+    """Драйвер датчика: чтение текущего уровня радиации
+
+    Реализация read должна соблюдать timeout (например, таймаут сокета или
+    последовательного порта) и выбрасывать исключение при ошибке чтения.
+    """
+
+    def read(self, sensor_id, config, timeout):
+        """Текущий уровень радиации датчика, мкЗв/ч"""
+        raise NotImplementedError
+
+
+class SimulatedSensorDriver(SensorDriver):
+    """Имитация показаний датчиков: случайные значения с вариацией и аномалиями"""
+
+    def __init__(self):
+        self.base_levels = {}
+        self.lock = threading.Lock()
+
+    def read(self, sensor_id, config, timeout):
+        with self.lock:
+            if sensor_id not in self.base_levels:
+                self.base_levels[sensor_id] = 0.1 + (len(self.base_levels) % 4) * 0.3
+            base_value = self.base_levels[sensor_id]
+
+        variation = random.uniform(-0.1, 0.1)
+        radiation = max(0.01, base_value + variation)
+
+        # Имитация случайных аномалий (10% вероятность)
+        if random.random() < 0.1:
+            radiation *= random.uniform(1.5, 4.0)
+
+        return radiation
+
+
+class SensorPoller:
+    """Параллельный опрос датчиков через пул потоков
+
+    Одновременно выполняется не более max_in_flight чтений. Каждое чтение
+    ограничено timeout секундами и при ошибке повторяется до retries раз с
+    экспоненциально растущей паузой backoff. Датчик, чтение которого еще не
+    завершилось с прошлого цикла, в текущем цикле пропускается. Драйвер
+    выбирается по ключу 'driver' конфигурации датчика (по умолчанию 'simulator').
+    """
+
+    def __init__(self, max_in_flight=32, timeout=2.0, retries=2, backoff=0.2, logger=None):
+        self.timeout = timeout
+        self.retries = retries
+        self.backoff = backoff
+        self.logger = logger or logging.getLogger(__name__)
+        self.drivers = {'simulator': SimulatedSensorDriver()}
+        self.executor = ThreadPoolExecutor(max_workers=max_in_flight, thread_name_prefix="sensor-poll")
+        self.in_flight = set()
+        self.lock = threading.Lock()
+
+    def register_driver(self, name, driver):
+        """Подключение драйвера датчиков"""
+        self.drivers[name] = driver
+
+    def read_with_retry(self, sensor_id, config, deadline):
+        """Чтение показаний датчика с повторами"""
+        driver = self.drivers[config.get('driver', 'simulator')]
+        try:
+            for attempt in range(self.retries + 1):
+                try:
+                    return driver.read(sensor_id, config, self.timeout)
+                except Exception:
+                    pause = self.backoff * (2 ** attempt)
+                    if attempt == self.retries or time.monotonic() + pause >= deadline:
+                        raise
+                    time.sleep(pause)
+        finally:
+            with self.lock:
+                self.in_flight.discard(sensor_id)
+
+    def poll(self, sensors, cycle_timeout):
+        """Опрос всех датчиков; возвращает список (sensor_id, уровень, ошибка)
+
+        Показания, не полученные за cycle_timeout секунд, считаются ошибкой
+        таймаута; их чтение продолжается в фоне, а результат отбрасывается.
+        """
+        deadline = time.monotonic() + cycle_timeout
+        futures = {}
+        results = []
+
+        for sensor_id, config in sensors.items():
+            with self.lock:
+                if sensor_id in self.in_flight:
+                    results.append((sensor_id, None, TimeoutError("предыдущее чтение не завершено")))
+                    continue
+                self.in_flight.add(sensor_id)
+            futures[self.executor.submit(self.read_with_retry, sensor_id, config, deadline)] = sensor_id
+
+        done, not_done = wait(futures, timeout=max(0, deadline - time.monotonic()))
+
+        for future, sensor_id in futures.items():
+            if future in not_done:
+                results.append((sensor_id, None, TimeoutError(f"нет ответа за {cycle_timeout} с")))
+            elif future.exception() is not None:
+                results.append((sensor_id, None, future.exception()))
+            else:
+                results.append((sensor_id, future.result(), None))
+
+        return results
+
+    def shutdown(self):
+        """Остановка пула потоков опроса с ожиданием уже начатых чтений"""
+        self.executor.shutdown(wait=True, cancel_futures=True)
+
+
+class StatisticsAggregator:
+    """Счетчики статистики сбора данных в памяти
+
+    Начальные значения один раз считываются из БД (seed), далее счетчики
+    увеличиваются при каждом принятом измерении (add). Счетчик измерений
+    за сегодня обнуляется при смене суток. Чтение (snapshot) выполняется за O(1).
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.total = 0
+        self.today = 0
+        self.exceeded = 0
+        self.day = datetime.now().date()
+        self.first_timestamp = None
+        self.last_timestamp = None
+
+    def seed(self, conn):
+        """Начальное заполнение счетчиков из БД"""
+        cursor = conn.cursor()
+        day = datetime.now().date()
+
+        cursor.execute('SELECT COUNT(*) FROM measurements')
+        total = cursor.fetchone()[0]
+
+        cursor.execute('SELECT COUNT(*) FROM measurements WHERE timestamp >= ? AND timestamp < ?',
+                       day_range(day))
+        today = cursor.fetchone()[0]
+
+        cursor.execute("SELECT COUNT(*) FROM measurements WHERE status IN ('ПРЕДУПРЕЖДЕНИЕ', 'ОПАСНО')")
+        exceeded = cursor.fetchone()[0]
+
+        # MIN и MAX отдельными запросами, чтобы каждый выполнялся по индексу
+        cursor.execute('SELECT MIN(timestamp) FROM measurements')
+        first_timestamp = cursor.fetchone()[0]
+        cursor.execute('SELECT MAX(timestamp) FROM measurements')
+        last_timestamp = cursor.fetchone()[0]
+
+        # Упакованные измерения (ChunkStore) старше сегодняшних
+        cursor.execute('SELECT COALESCE(SUM(samples), 0), COALESCE(SUM(non_normal), 0) FROM measurement_chunks')
+        chunk_total, chunk_exceeded = cursor.fetchone()
+        total += chunk_total
+        exceeded += chunk_exceeded
+        cursor.execute('SELECT data FROM measurement_chunks ORDER BY chunk_start LIMIT 1')
+        row = cursor.fetchone()
+        if row is not None:
+            # Первые 64 бита блока - время первого измерения в микросекундах
+            chunk_first = ChunkStore.from_micros(int.from_bytes(row[0][:8], 'big'))
+            first_timestamp = min(filter(None, (first_timestamp, chunk_first)))
+            last_timestamp = last_timestamp or cursor.execute(
+                'SELECT MAX(chunk_end) FROM measurement_chunks').fetchone()[0]
+
+        with self.lock:
+            self.total = total
+            self.today = today
+            self.exceeded = exceeded
+            self.day = day
+            self.first_timestamp = first_timestamp
+            self.last_timestamp = last_timestamp
+
+    def add(self, timestamp, status):
+        """Учет нового измерения"""
+        with self.lock:
+            self.rollover(timestamp.date())
+            self.total += 1
+            if timestamp.date() == self.day:
+                self.today += 1
+            if status != "НОРМА":
+                self.exceeded += 1
+            if self.first_timestamp is None:
+                self.first_timestamp = timestamp
+            self.last_timestamp = timestamp
+
+    def rollover(self, day):
+        """Обнуление счетчика за сегодня при смене суток"""
+        if day > self.day:
+            self.day = day
+            self.today = 0
+
+    def snapshot(self):
+        """Текущие значения счетчиков"""
+        with self.lock:
+            self.rollover(datetime.now().date())
+            return {
+                'total': self.total,
+                'today': self.today,
+                'exceeded': self.exceeded,
+                'first_timestamp': self.first_timestamp,
+                'last_timestamp': self.last_timestamp
+            }
+
+
+def downsample_minmax(times, values, step):
+    """Прореживание ряда по интервалам времени длиной step секунд
+
+    Из каждого интервала остаются минимум и максимум в порядке следования,
+    поэтому кратковременные выбросы видны при любом масштабе. Границы интервалов
+    привязаны к абсолютному времени, и при сдвиге окна линия не "дрожит".
+    Возвращает список пар (время, значение).
+    """
+    points = []
+    bucket = None
+    low_time = high_time = low = high = None
+    for timestamp, value in zip(times, values):
+        index = int(timestamp // step)
+        if index != bucket:
+            if bucket is not None:
+                points.extend(minmax_points(low_time, low, high_time, high))
+            bucket = index
+            low_time = high_time = timestamp
+            low = high = value
+        elif value < low:
+            low_time, low = timestamp, value
+        elif value > high:
+            high_time, high = timestamp, value
+    if bucket is not None:
+        points.extend(minmax_points(low_time, low, high_time, high))
+    return points
+
+
+def minmax_points(low_time, low, high_time, high):
+    """Точки минимума и максимума интервала в порядке времени"""
+    if low_time == high_time:
+        return ((low_time, low),)
+    if low_time < high_time:
+        return (low_time, low), (high_time, high)
+    return (high_time, high), (low_time, low)
+
+
+class SeriesBuffer:
+    """Кольцевой буфер ряда измерений одного датчика
+
+    Время (секунды эпохи), значения и коды статуса хранятся в параллельных
+    массивах array: добавление выполняется за O(1) без сдвига элементов, чтение
+    возможно через memoryview без копирования. Массивы растут удвоением по мере
+    поступления точек до capacity, после чего размер больше не меняется.
+    """
+
+    INITIAL_SIZE = 1024  # точек, выделяемых при первом добавлении
+
+    def __init__(self, capacity):
+        self.capacity = capacity
+        self.times = array('d')
+        self.values = array('d')
+        self.statuses = array('b')
+        self.count = 0
+        self.head = 0  # позиция следующей записи (после заполнения - самой старой точки)
+
+    def grow(self):
+        """Увеличение массивов вдвое, но не больше capacity"""
+        extra = min(self.capacity, max(self.INITIAL_SIZE, 2 * len(self.times))) - len(self.times)
+        self.times.frombytes(bytes(8 * extra))
+        self.values.frombytes(bytes(8 * extra))
+        self.statuses.frombytes(bytes(extra))
+
+    def append(self, timestamp, value, status=0):
+        """Добавление точки; при заполнении вытесняется самая старая"""
+        if self.count == len(self.times) < self.capacity:
+            self.grow()
+        self.times[self.head] = timestamp
+        self.values[self.head] = value
+        self.statuses[self.head] = status
+        self.head = (self.head + 1) % self.capacity
+        if self.count < self.capacity:
+            self.count += 1
+
+    def first_time(self):
+        """Время самой старой точки"""
+        if not self.count:
+            return None
+        return self.times[self.head if self.count == self.capacity else 0]
+
+    def last(self):
+        """Самая новая точка (время, значение)"""
+        if not self.count:
+            return None
+        index = self.head - 1
+        return self.times[index], self.values[index]
+
+    def segments(self, since):
+        """Точки не старше since в порядке времени без копирования
+
+        Возвращает список из одного-двух фрагментов (время, значения, статусы)
+        в виде memoryview; фрагменты действительны, пока буфер не пополнен
+        (до освобождения фрагментов массивы не могут расти).
+        """
+        if self.count < self.capacity:
+            bounds = [(0, self.count)]
+        else:
+            bounds = [(self.head, self.capacity), (0, self.head)]
+        times, values, statuses = memoryview(self.times), memoryview(self.values), memoryview(self.statuses)
+        result = []
+        for start, stop in bounds:
+            if start == stop or times[stop - 1] < since:
+                continue
+            start = bisect_left(times, since, start, stop)
+            result.append((times[start:stop], values[start:stop], statuses[start:stop]))
+        return result
+
+
+class MeasurementStore:
+    """Измерения всех датчиков в памяти (кольцевые буферы по датчикам)
+
+    Идентификаторы датчиков и участков хранятся один раз (интернированы),
+    статус - кодом из STATUSES. При capacity = 0 измерения не хранятся
+    (служба без графического интерфейса). Пополняется потоком сбора данных; читатели
+    (график, статистика) получают фрагменты буферов без копирования в view()
+    под блокировкой или копию окна через window().
+    """
+
+    STATUSES = ("НОРМА", "ПРЕДУПРЕЖДЕНИЕ", "ОПАСНО")
+    STATUS_CODES = {status: code for code, status in enumerate(STATUSES)}
+
+    def __init__(self, capacity):
+        self.capacity = capacity
+        self.lock = threading.Lock()
+        self.index = {}  # датчик -> номер буфера
+        self.sensor_ids = []
+        self.locations = []  # участок датчика (интернированная строка)
+        self.series = []
+
+    def append(self, sensor_id, timestamp, value, status, location=None):
+        """Добавление измерения датчика (timestamp - секунды эпохи)"""
+        if not self.capacity:
+            return
+        with self.lock:
+            index = self.index.get(sensor_id)
+            if index is None:
+                index = self.index[sensor_id] = len(self.series)
+                self.sensor_ids.append(sys.intern(sensor_id))
+                self.locations.append(sys.intern(location) if location else None)
+                self.series.append(SeriesBuffer(self.capacity))
+            self.series[index].append(timestamp, value, self.STATUS_CODES.get(status, 0))
+
+    @contextmanager
+    def view(self, sensor_id, since):
+        """Фрагменты ряда датчика не старше since и время самой старой точки в памяти
+
+        Блокировка удерживается до выхода из блока with, чтобы фрагменты
+        не перезаписывались во время чтения; на выходе фрагменты освобождаются.
+        """
+        with self.lock:
+            index = self.index.get(sensor_id)
+            if index is None:
+                yield [], None
+                return
+            series = self.series[index]
+            segments = series.segments(since)
+            try:
+                yield segments, series.first_time()
+            finally:
+                for fragment in segments:
+                    for view in fragment:
+                        view.release()
+
+    def window(self, sensor_id, since):
+        """Копия точек датчика не старше since: (время, значения, статусы)"""
+        times, values, statuses = array('d'), array('d'), array('b')
+        with self.view(sensor_id, since) as (segments, _):
+            for segment_times, segment_values, segment_statuses in segments:
+                times.frombytes(segment_times.cast('B'))
+                values.frombytes(segment_values.cast('B'))
+                statuses.frombytes(segment_statuses.cast('B'))
+        return times, values, statuses
+
+    def last(self, sensor_id):
+        """Последнее измерение датчика (время, значение) или None"""
+        with self.lock:
+            index = self.index.get(sensor_id)
+            return self.series[index].last() if index is not None else None
+
+    def location(self, sensor_id):
+        index = self.index.get(sensor_id)
+        return self.locations[index] if index is not None else None
+
+    def clear(self):
+        with self.lock:
+            self.index.clear()
+            self.sensor_ids.clear()
+            self.locations.clear()
+            self.series.clear()
+
+    def __len__(self):
+        with self.lock:
+            return sum(series.count for series in self.series)
+
+
+class P2Quantile:
+    """Оценка квантиля потока значений алгоритмом P² (Jain, Chlamtac)
+
+    Хранит пять маркеров независимо от числа значений, обновление за O(1).
+    """
+
+    def __init__(self, p):
+        self.p = p
+        self.heights = []
+        self.positions = [1, 2, 3, 4, 5]
+        self.desired = [1, 1 + 2 * p, 1 + 4 * p, 3 + 2 * p, 5]
+        self.increments = [0, p / 2, p, (1 + p) / 2, 1]
+
+    def add(self, value):
+        heights, positions = self.heights, self.positions
+        if len(heights) < 5:
+            insort(heights, value)
+            return
+
+        if value < heights[0]:
+            heights[0] = value
+            cell = 0
+        elif value >= heights[4]:
+            heights[4] = value
+            cell = 3
+        else:
+            cell = bisect_right(heights, value) - 1
+        for i in range(cell + 1, 5):
+            positions[i] += 1
+        for i in range(5):
+            self.desired[i] += self.increments[i]
+
+        # Сдвиг средних маркеров к желаемым позициям
+        for i in (1, 2, 3):
+            delta = self.desired[i] - positions[i]
+            if (delta >= 1 and positions[i + 1] - positions[i] > 1) or \
+                    (delta <= -1 and positions[i - 1] - positions[i] < -1):
+                step = 1 if delta > 0 else -1
+                height = self.parabolic(i, step)
+                if not heights[i - 1] < height < heights[i + 1]:
+                    height = heights[i] + step * (heights[i + step] - heights[i]) / \
+                        (positions[i + step] - positions[i])
+                heights[i] = height
+                positions[i] += step
+
+    def parabolic(self, i, step):
+        heights, positions = self.heights, self.positions
+        return heights[i] + step / (positions[i + 1] - positions[i - 1]) * (
+            (positions[i] - positions[i - 1] + step) * (heights[i + 1] - heights[i]) /
+            (positions[i + 1] - positions[i]) +
+            (positions[i + 1] - positions[i] - step) * (heights[i] - heights[i - 1]) /
+            (positions[i] - positions[i - 1]))
+
+    def value(self):
+        """Текущая оценка квантиля (None, пока нет значений)"""
+        if len(self.heights) == 5:
+            return self.heights[2]
+        if not self.heights:
+            return None
+        return self.heights[round(self.p * (len(self.heights) - 1))]
+
+
+class SensorStatistics:
+    """Потоковая статистика одного датчика, обновление за O(1) на измерение
+
+    Среднее и дисперсия - алгоритмом Уэлфорда с начала работы, базовый
+    уровень - экспоненциальное скользящее среднее (EWMA) и его дисперсия,
+    минимум и максимум за последние window секунд - монотонными очередями,
+    квантили - оценками P².
+    """
+
+    QUANTILES = (0.5, 0.95, 0.99)
+
+    def __init__(self, window, alpha):
+        self.window = window
+        self.alpha = alpha
+        self.count = 0
+        self.mean = 0.0
+        self.m2 = 0.0
+        self.ewma = None
+        self.ewm_variance = 0.0
+        self.window_min = deque()  # (время, значение), значения возрастают
+        self.window_max = deque()  # (время, значение), значения убывают
+        self.quantiles = [P2Quantile(p) for p in self.QUANTILES]
+
+    def add(self, timestamp, value):
+        self.count += 1
+        delta = value - self.mean
+        self.mean += delta / self.count
+        self.m2 += delta * (value - self.mean)
+
+        if self.ewma is None:
+            self.ewma = value
+        else:
+            delta = value - self.ewma
+            self.ewma += self.alpha * delta
+            self.ewm_variance = (1 - self.alpha) * (self.ewm_variance + self.alpha * delta * delta)
+
+        while self.window_min and self.window_min[-1][1] >= value:
+            self.window_min.pop()
+        self.window_min.append((timestamp, value))
+        while self.window_max and self.window_max[-1][1] <= value:
+            self.window_max.pop()
+        self.window_max.append((timestamp, value))
+        expired = timestamp - self.window
+        while self.window_min[0][0] <= expired:
+            self.window_min.popleft()
+        while self.window_max[0][0] <= expired:
+            self.window_max.popleft()
+
+        for quantile in self.quantiles:
+            quantile.add(value)
+
+    def deviation(self, value):
+        """Отклонение значения от базового уровня в стандартных отклонениях EWMA"""
+        if self.ewma is None or self.ewm_variance <= 0:
+            return None
+        return (value - self.ewma) / math.sqrt(self.ewm_variance)
+
+    def snapshot(self):
+        return {
+            'count': self.count,
+            'mean': self.mean,
+            'stddev': math.sqrt(self.m2 / (self.count - 1)) if self.count > 1 else 0.0,
+            'ewma': self.ewma,
+            'ewm_stddev': math.sqrt(self.ewm_variance),
+            'min': self.window_min[0][1] if self.window_min else None,
+            'max': self.window_max[0][1] if self.window_max else None,
+            **{f'p{round(q.p * 100)}': q.value() for q in self.quantiles}
+        }
+
+
+class OnlineStatistics:
+    """Потоковая статистика по всем датчикам без запросов к БД
+
+    Пополняется потоком сбора данных, снимки (snapshot) читаются
+    интерфейсом, отчетами и API.
+    """
+
+    def __init__(self, window=3600, alpha=0.05):
+        self.window = window
+        self.alpha = alpha
+        self.sensors = {}
+        self.lock = threading.Lock()
+
+    def add(self, sensor_id, timestamp, value):
+        """Учет измерения (timestamp - секунды эпохи)"""
+        with self.lock:
+            stats = self.sensors.get(sensor_id)
+            if stats is None:
+                stats = self.sensors[sensor_id] = SensorStatistics(self.window, self.alpha)
+            stats.add(timestamp, value)
+
+    def deviation(self, sensor_id, value, min_samples=0):
+        """Отклонение от базового уровня датчика (None, пока данных меньше min_samples)"""
+        with self.lock:
+            stats = self.sensors.get(sensor_id)
+            if stats is None or stats.count < min_samples:
+                return None
+            return stats.deviation(value)
+
+    def snapshot(self, sensor_id):
+        """Статистика датчика или None"""
+        with self.lock:
+            stats = self.sensors.get(sensor_id)
+            return stats.snapshot() if stats else None
+
+    def snapshots(self):
+        """Статистика всех датчиков {датчик: словарь}"""
+        with self.lock:
+            return {sensor_id: stats.snapshot() for sensor_id, stats in self.sensors.items()}
+
+    def clear(self):
+        """Сброс статистики всех датчиков"""
+        with self.lock:
+            self.sensors.clear()
+
+
+class UIUpdateBus:
+    """Шина обновлений интерфейса
+
+    Рабочие потоки публикуют обновления (post) с ключом виджета, поток Tk
+    периодически применяет их (drain). Из нескольких обновлений с одним ключом
+    применяется только последнее, поэтому очередь событий Tk не переполняется
+    при любом темпе сбора данных. За один проход обновления применяются
+    в пределах бюджета времени; остаток переносится на следующий проход.
+    """
+
+    def __init__(self, logger=None):
+        self.logger = logger or logging.getLogger(__name__)
+        self.lock = threading.Lock()
+        self.pending = {}  # ключ -> (функция, аргументы) в порядке поступления
+
+    def post(self, key, callback, *args):
+        """Публикация обновления (из любого потока); заменяет неприменённое с тем же ключом"""
+        with self.lock:
+            self.pending.pop(key, None)
+            self.pending[key] = (callback, args)
+
+    def drain(self, budget):
+        """Применение накопленных обновлений не дольше budget секунд; возвращает остаток"""
+        deadline = time.perf_counter() + budget
+        while True:
+            with self.lock:
+                if not self.pending:
+                    return 0
+                key = next(iter(self.pending))
+                callback, args = self.pending.pop(key)
+
+            try:
+                callback(*args)
+            except Exception as e:
+                self.logger.error(f"Ошибка обновления интерфейса ({key}): {e}")
+
+            if time.perf_counter() >= deadline:
+                with self.lock:
+                    return len(self.pending)
+
+
+class SensorTileMap:
+    """Карта датчиков на Canvas для большого числа датчиков
+
+    Датчики сгруппированы по участкам, каждый показан плиткой: прямоугольник
+    цвета статуса и текст с идентификатором и уровнем. Раскладка вычисляется
+    без создания элементов; элементы Canvas создаются только для рядов в видимой
+    области (с запасом в один ряд) и удаляются при прокрутке за ее пределы.
+    Новое измерение меняет текст одной плитки, а цвет - только при смене статуса.
+    """
+
+    TILE_WIDTH = 110
+    TILE_HEIGHT = 44
+    GAP = 6
+    HEADER_HEIGHT = 24
+    STATUS_COLORS = {"НОРМА": "green", "ПРЕДУПРЕЖДЕНИЕ": "orange", "ОПАСНО": "red"}
+
+    def __init__(self, parent, sensor_configs, height=300):
+        self.sensor_configs = sensor_configs
+        self.readings = {}  # sensor_id -> (уровень, статус)
+        self.rows = []  # ряды раскладки: (y, 'header', участок) или (y, 'tiles', [(x, sensor_id), ...])
+        self.row_tops = []
+        self.row_items = {}  # номер ряда -> элементы Canvas
+        self.items = {}  # sensor_id -> (прямоугольник, текст) для видимых плиток
+        self.width = 0
+
+        frame = ttk.Frame(parent)
+        frame.pack(fill="both", expand=True)
+        self.canvas = tk.Canvas(frame, bg='white', height=height, highlightthickness=0)
+        scrollbar = ttk.Scrollbar(frame, orient="vertical", command=self.canvas.yview)
+        scrollbar.pack(side="right", fill="y")
+        self.canvas.pack(side="left", fill="both", expand=True)
+
+        def on_scroll(first, last):
+            scrollbar.set(first, last)
+            self.render()
+
+        self.canvas.configure(yscrollcommand=on_scroll)
+        self.canvas.bind("<Configure>", self.on_resize)
+        self.canvas.bind("<MouseWheel>", lambda event: self.canvas.yview_scroll(-1 if event.delta > 0 else 1, "units"))
+        self.canvas.bind("<Button-4>", lambda event: self.canvas.yview_scroll(-1, "units"))
+        self.canvas.bind("<Button-5>", lambda event: self.canvas.yview_scroll(1, "units"))
+
+    def on_resize(self, event):
+        """Пересчет раскладки при изменении ширины"""
+        if event.width != self.width:
+            self.width = event.width
+            self.relayout()
+
+    def relayout(self):
+        """Раскладка плиток по участкам для текущей ширины Canvas"""
+        columns = max(1, (self.width - self.GAP) // (self.TILE_WIDTH + self.GAP))
+        groups = {}
+        for sensor_id, config in self.sensor_configs.items():
+            groups.setdefault(config["location"], []).append(sensor_id)
+
+        self.rows = []
+        y = self.GAP
+        for location in sorted(groups):
+            self.rows.append((y, 'header', location))
+            y += self.HEADER_HEIGHT
+            sensor_ids = sorted(groups[location])
+            for start in range(0, len(sensor_ids), columns):
+                tiles = [(self.GAP + i * (self.TILE_WIDTH + self.GAP), sensor_id)
+                         for i, sensor_id in enumerate(sensor_ids[start:start + columns])]
+                self.rows.append((y, 'tiles', tiles))
+                y += self.TILE_HEIGHT + self.GAP
+        self.row_tops = [row[0] for row in self.rows]
+
+        self.canvas.delete("all")
+        self.row_items.clear()
+        self.items.clear()
+        self.canvas.configure(scrollregion=(0, 0, self.width, y))
+        self.render()
+
+    def render(self):
+        """Создание элементов для видимых рядов и удаление элементов остальных"""
+        margin = self.TILE_HEIGHT + self.GAP
+        top = self.canvas.canvasy(0) - margin
+        bottom = self.canvas.canvasy(self.canvas.winfo_height()) + margin
+        first = max(0, bisect_left(self.row_tops, top) - 1)
+        last = bisect_left(self.row_tops, bottom)
+        visible = range(first, last)
+
+        for index in [index for index in self.row_items if index not in visible]:
+            row = self.rows[index]
+            if row[1] == 'tiles':
+                for _, sensor_id in row[2]:
+                    self.items.pop(sensor_id, None)
+            self.canvas.delete(*self.row_items.pop(index))
+
+        for index in visible:
+            if index not in self.row_items:
+                self.row_items[index] = self.create_row(self.rows[index])
+
+    def create_row(self, row):
+        """Элементы Canvas одного ряда раскладки"""
+        y, kind, payload = row
+        if kind == 'header':
+            return [self.canvas.create_text(self.GAP, y + self.HEADER_HEIGHT // 2, text=payload,
+                                            anchor="w", font=("Arial", 10, "bold"))]
+
+        created = []
+        for x, sensor_id in payload:
+            value, status = self.readings.get(sensor_id, (None, None))
+            rect = self.canvas.create_rectangle(x, y, x + self.TILE_WIDTH, y + self.TILE_HEIGHT,
+                                                fill=self.STATUS_COLORS.get(status, "gray"), outline="")
+            text = self.canvas.create_text(x + self.TILE_WIDTH // 2, y + self.TILE_HEIGHT // 2,
+                                           text=self.tile_text(sensor_id, value), fill="white",
+                                           font=("Arial", 9, "bold"), justify="center")
+            self.items[sensor_id] = (rect, text)
+            created.extend((rect, text))
+        return created
+
+    def tile_text(self, sensor_id, value):
+        """Текст плитки"""
+        return f"{sensor_id}\n{value:.2f} мкЗв/ч" if value is not None else f"{sensor_id}\n--"
+
+    def update(self, sensor_id, value, status):
+        """Новое измерение датчика; элементы меняются только у видимой плитки"""
+        previous = self.readings.get(sensor_id)
+        self.readings[sensor_id] = (value, status)
+        items = self.items.get(sensor_id)
+        if items is None:
+            return
+        rect, text = items
+        self.canvas.itemconfig(text, text=self.tile_text(sensor_id, value))
+        if previous is None or previous[1] != status:
+            self.canvas.itemconfig(rect, fill=self.STATUS_COLORS.get(status, "gray"))
+
+
+class MonitoringService:
+    """Служба сбора данных: опрос датчиков, запись измерений, оповещения
+
+    Не зависит от графического интерфейса и может работать отдельно
+    (python Coursework.py --headless). Клиенты, например окно Tk, подписываются
+    на события службы (subscribe): 'measurement' и 'alert' (словарь с данными),
+    'cycle' (завершен цикл опроса) и 'statistics' (счетчики пересчитаны).
+    Обработчики вызываются в потоке сбора данных и не должны блокировать его.
+    История измерений в памяти нужна только графику и при keep_history=False
+    не хранится.
+    """
+
+    def __init__(self, config=None, db_path='radiation_monitoring.db', keep_history=True):
+        self.db_path = db_path
+        self.listeners = []
+        self.data_collection_active = False
+        self.collection_wakeup = threading.Event()  # прерывает паузу между циклами опроса (остановка, опрос вручную)
+        self.stopped = threading.Event()
+        self.api = None
 
         # Определяем путь к папке "Загрузки"
         self.downloads_path = self.get_downloads_path()
@@ -34,22 +3129,95 @@ class RadiationMonitoringSystem:
             'smtp_port': 587,
             'notification_email': 'safety@company.com',
             'notification_phone': '+79001234567',
-            'reports_folder': self.downloads_path  # Добавляем путь к загрузкам
+            'reports_folder': self.downloads_path,  # Добавляем путь к загрузкам
+            'writer_queue_size': 10000,  # максимум измерений в очереди на запись
+            'writer_flush_interval_ms': 1000,  # максимальная задержка записи в БД
+            'writer_retries': 5,  # повторов записи пакета при ошибке БД
+            'writer_retry_backoff': 0.1,  # начальная пауза между повторами записи, секунды
+            'rollup_sketch_checkpoint': 300,  # запись скетчей квантилей текущего часа и суток в БД, секунды
+            'db_reader_pool_size': 3,  # соединений чтения для интерфейса и отчетов
+            'db_cache_size_kb': 16384,  # кэш страниц SQLite на соединение
+            'db_mmap_size_mb': 256,  # отображение файла БД в память
+            'columnar_format': 'parquet',  # формат колоночного экспорта: parquet или arrow
+            'archive_after_days': 90,  # измерения старше переносятся в архив (не дольше raw_retention_days)
+            'archive_folder': os.path.join(self.downloads_path, 'archive'),
+            'raw_retention_days': 0,  # срок хранения исходных измерений, сут. (0 - бессрочно; агрегаты - всегда)
+            'retention_archive': False,  # переносить устаревшие измерения в архив вместо удаления
+            'retention_check_interval': 3600,  # секунды между проверками срока хранения
+            'compress_after_days': 0,  # измерения старше упаковываются в сжатые блоки (0 - не упаковывать)
+            'compress_chunk_seconds': 3600,  # интервал одного сжатого блока, секунды
+            'poll_max_in_flight': 32,  # одновременных чтений датчиков
+            'poll_timeout': 2.0,  # таймаут чтения одного датчика, секунды
+            'poll_retries': 2,  # повторов чтения при ошибке
+            'poll_backoff': 0.2,  # начальная пауза между повторами, секунды
+            'history_page_size': 200,  # строк на страницу в просмотре истории
+            'history_max_rows': 1000,  # строк в таблице просмотра истории одновременно
+            'dashboard_mode': 'auto',  # карточки датчиков: cards, tiles или auto (по числу датчиков)
+            'dashboard_cards_max': 8,  # в режиме auto при большем числе датчиков - карта на Canvas
+            'chart_frame_ms': 200,  # минимальный интервал перерисовки графика, мс
+            'ui_frame_ms': 50,  # период применения обновлений интерфейса, мс
+            'ui_frame_budget_ms': 20,  # максимальное время применения обновлений за проход, мс
+            'chart_history_seconds': 86400,  # глубина истории измерений в памяти (график), секунды
+            'api_host': '127.0.0.1',  # адрес локального API службы сбора данных
+            'api_port': 0,  # порт локального API (0 - API отключен)
+            'smtp_enabled': False,  # отправлять письма (иначе оповещения только в журнал)
+            'smtp_sender': 'monitoring@company.com',
+            'smtp_user': '',
+            'smtp_password': os.environ.get('RADIATION_SMTP_PASSWORD', ''),  # не сохраняется в файл настроек
+            'smtp_use_tls': True,  # STARTTLS после подключения
+            'smtp_timeout': 10,  # таймаут SMTP-соединения, секунды
+            'smtp_pool_size': 2,  # открытых SMTP-соединений в пуле
+            'smtp_keepalive': 60,  # после простоя соединение проверяется командой NOOP, секунды
+            'notify_workers': 2,  # потоков отправки оповещений
+            'notify_max_attempts': 5,  # попыток отправки одного оповещения
+            'notify_backoff': 5.0,  # пауза перед первой повторной отправкой, секунды
+            'notify_rate_limit': 10,  # писем одному адресату за окно (сверх лимита - сводкой, 0 - без лимита)
+            'notify_rate_window': 3600,  # окно ограничения числа писем, секунды
+            'alert_hysteresis': 0.1,  # оповещение снимается ниже порога на эту долю
+            'alert_raise_hold': 0,  # превышение должно длиться столько секунд до оповещения
+            'alert_clear_hold': 60,  # снижение должно длиться столько секунд до снятия оповещения
+            'alert_reminder_interval': 3600,  # напоминание о непрекращающемся превышении, секунды (0 - нет)
+            'stats_window_seconds': 3600,  # окно минимума и максимума в статистике датчиков, секунды
+            'stats_ewma_alpha': 0.05,  # вес нового измерения в базовом уровне (EWMA)
+            'baseline_alert_sigma': 0,  # оповещение при отклонении от базового уровня на N σ (0 - выключено)
+            'baseline_min_samples': 60  # измерений датчика до начала проверки отклонений
         }
 
         # Хранилище данных
-        self.historical_data = []
+        self.history = None  # MeasurementStore, создается после загрузки настроек
+        self.statistics = StatisticsAggregator()
         self.alerts_log = deque(maxlen=1000)
         self.sensor_configs = {}
         self.emergency_contacts = []
 
+        if config:
+            self.config.update(config)
+
+        # Последние измерения в памяти: кольцевой буфер на каждый датчик
+        self.history = MeasurementStore(
+            int(self.config['chart_history_seconds'] // self.config['polling_interval']) + 1 if keep_history else 0)
+        self.classifier = StatusClassifier(self.config['warning_threshold'], self.config['danger_threshold'])
+        self.sensor_statistics = OnlineStatistics(self.config['stats_window_seconds'], self.config['stats_ewma_alpha'])
+        self.baseline_deviations = set()  # датчики с неснятым отклонением от базового уровня
+
         # Инициализация компонентов
         self.setup_logging()
         self.init_database()
         self.init_sensor_configs()
         self.init_contacts()
-        self.setup_ui()
-        self.start_data_collection()
+        self.load_thresholds()
+
+    def subscribe(self, listener):
+        """Подписка на события службы: listener(событие, данные)"""
+        self.listeners.append(listener)
+
+    def emit(self, event, data):
+        """Передача события подписчикам; ошибка клиента не прерывает сбор данных"""
+        for listener in self.listeners:
+            try:
+                listener(event, data)
+            except Exception as e:
+                self.logger.error(f"Ошибка обработки события {event}: {e}")
 
     def get_downloads_path(self):
         """Получение пути к папке 'Загрузки' в зависимости от операционной системы"""
@@ -90,55 +3258,119 @@ class RadiationMonitoringSystem:
     def init_database(self):
         """Инициализация базы данных"""
         try:
-            self.conn = sqlite3.connect('radiation_monitoring.db', check_same_thread=False)
+            self.db = DatabaseManager(self.db_path,
+                                      self.config['db_reader_pool_size'],
+                                      self.config['db_cache_size_kb'],
+                                      self.config['db_mmap_size_mb'])
             self.create_tables()
+
+            # Начальные значения статистики
+            self.rollups = RollupManager(self.db, self.logger, self.config['rollup_sketch_checkpoint'])
+            with self.db.reader() as conn:
+                self.statistics.seed(conn)
+                if self.rollups.is_empty(conn):
+                    self.logger.warning("Агрегаты для отчетов не рассчитаны, выполните: "
+                                        "python Coursework.py --backfill-rollups")
+
+            # Поток пакетной записи измерений
+            self.measurement_writer = MeasurementWriter(self.db,
+                                                        self.config['writer_queue_size'],
+                                                        self.config['writer_flush_interval_ms'],
+                                                        self.logger, self.rollups,
+                                                        self.config['writer_retries'],
+                                                        self.config['writer_retry_backoff'])
+            self.measurement_writer.start()
+
+            self.exporter = StreamingExporter(self.db, self.rollups)
+            self.history_pager = HistoryPager(self.db, self.config['history_page_size'])
+            self.chunks = ChunkStore(self.db, self.config['compress_chunk_seconds'], self.logger)
+            self.archive = ColumnarArchive(self.db, self.logger, chunks=self.chunks)
+            self.backup_engine = BackupEngine(self.db, self.logger)
+
+            # Отправка оповещений вне потока сбора данных
+            self.smtp_pool = SMTPConnectionPool(
+                self.config['smtp_server'], self.config['smtp_port'], self.config['smtp_sender'],
+                self.config['smtp_user'], self.config['smtp_password'], self.config['smtp_use_tls'],
+                self.config['smtp_timeout'], self.config['smtp_pool_size'], self.config['smtp_keepalive'])
+            self.notifier = NotificationDispatcher(
+                self.db, self.format_alert, self.send_email_notification, self.notification_recipients,
+                self.config['notify_workers'], self.config['notify_max_attempts'], self.config['notify_backoff'],
+                ContactRateLimiter(self.config['notify_rate_limit'], self.config['notify_rate_window']),
+                self.logger,
+                on_result=lambda alert_id, status: self.emit('notified', {'id': alert_id, 'notified': status}))
+
+            # Оповещения только при смене состояния датчика и напоминания
+            self.alert_states = AlertStateMachine(self.config['alert_hysteresis'],
+                                                  self.config['alert_raise_hold'],
+                                                  self.config['alert_clear_hold'],
+                                                  self.config['alert_reminder_interval'])
+            with self.db.reader() as conn:
+                self.alert_states.restore(conn)
+
+            # Очистка устаревших измерений
+            self.retention = RetentionManager(
+                self.db, self.config['raw_retention_days'], self.config['retention_check_interval'],
+                archive=self.archive if self.config['retention_archive'] else None,
+                archive_folder=self.config['archive_folder'],
+                archive_format=self.config['columnar_format'],
+                logger=self.logger, on_change=self.reseed_statistics,
+                chunks=self.chunks, compress_after_days=self.config['compress_after_days'])
+            self.retention.start()
+
+            with self.db.reader() as conn:
+                if conn.execute('PRAGMA auto_vacuum').fetchone()[0] != 2:
+                    self.logger.warning("Место после очистки БД не освобождается, выполните: "
+                                        "python Coursework.py --enable-incremental-vacuum")
         except sqlite3.Error as e:
             self.logger.error(f"Ошибка инициализации БД: {e}")
-            messagebox.showerror("Ошибка", f"Не удалось инициализировать базу данных: {e}")
+            raise
 
-    def create_tables(self):
-        """Создание таблиц в базе данных"""
-        cursor = self.conn.cursor()
+    def create_tables(self, db=None):
+        """Создание таблиц в базе данных (по умолчанию - рабочей)"""
+        db = db or self.db
+        with db.writer() as conn:
+            cursor = conn.cursor()
 
-        # Таблица датчиков
-        cursor.execute('''
-            CREATE TABLE IF NOT EXISTS sensors (
-                sensor_id TEXT PRIMARY KEY,
-                name TEXT NOT NULL,
-                location TEXT NOT NULL,
-                threshold REAL DEFAULT 1.0,
-                calibration_date TEXT,
-                status TEXT DEFAULT 'active'
-            )
-        ''')
+            # Таблица датчиков
+            cursor.execute('''
+                CREATE TABLE IF NOT EXISTS sensors (
+                    sensor_id TEXT PRIMARY KEY,
+                    name TEXT NOT NULL,
+                    location TEXT NOT NULL,
+                    threshold REAL DEFAULT 1.0,
+                    calibration_date TEXT,
+                    status TEXT DEFAULT 'active'
+                )
+            ''')
 
-        # Таблица измерений
-        cursor.execute('''
-            CREATE TABLE IF NOT EXISTS measurements (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                sensor_id TEXT,
-                radiation_level REAL,
-                timestamp DATETIME DEFAULT CURRENT_TIMESTAMP,
-                status TEXT,
-                FOREIGN KEY (sensor_id) REFERENCES sensors (sensor_id)
-            )
-        ''')
+            # Таблица измерений
+            cursor.execute('''
+                CREATE TABLE IF NOT EXISTS measurements (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    sensor_id TEXT,
+                    radiation_level REAL,
+                    timestamp DATETIME DEFAULT CURRENT_TIMESTAMP,
+                    status TEXT,
+                    FOREIGN KEY (sensor_id) REFERENCES sensors (sensor_id)
+                )
+            ''')
 
-        # Таблица оповещений
-        cursor.execute('''
-            CREATE TABLE IF NOT EXISTS alerts (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                sensor_id TEXT,
-                alert_type TEXT,
-                threshold_value REAL,
-                actual_value REAL,
-                timestamp DATETIME DEFAULT CURRENT_TIMESTAMP,
-                notified INTEGER DEFAULT 0,
-                FOREIGN KEY (sensor_id) REFERENCES sensors (sensor_id)
-            )
-        ''')
+            # Таблица оповещений
+            cursor.execute('''
+                CREATE TABLE IF NOT EXISTS alerts (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    sensor_id TEXT,
+                    alert_type TEXT,
+                    threshold_value REAL,
+                    actual_value REAL,
+                    timestamp DATETIME DEFAULT CURRENT_TIMESTAMP,
+                    notified INTEGER DEFAULT 0,
+                    FOREIGN KEY (sensor_id) REFERENCES sensors (sensor_id)
+                )
+            ''')
 
-        self.conn.commit()
+        # Индексы и прочие изменения схемы
+        db.apply_migrations(SCHEMA_MIGRATIONS, self.logger)
 
     def init_sensor_configs(self):
         """Инициализация конфигурации датчиков"""
@@ -173,25 +3405,792 @@ class RadiationMonitoringSystem:
             }
         }
 
-        # Сохранение датчиков в БД
-        cursor = self.conn.cursor()
-        for sensor_id, config in self.sensor_configs.items():
-            cursor.execute('''
-                INSERT OR REPLACE INTO sensors (sensor_id, name, location, threshold, calibration_date, status)
-                VALUES (?, ?, ?, ?, ?, ?)
-            ''', (sensor_id, config['name'], config['location'], config['threshold'],
-                  config['calibration_date'], config['status']))
-        self.conn.commit()
+        # Сохранение датчиков в БД
+        with self.db.writer() as conn:
+            cursor = conn.cursor()
+            for sensor_id, config in self.sensor_configs.items():
+                # Порог, измененный в БД, сохраняется
+                cursor.execute('''
+                    INSERT INTO sensors (sensor_id, name, location, threshold, calibration_date, status)
+                    VALUES (?, ?, ?, ?, ?, ?)
+                    ON CONFLICT (sensor_id) DO UPDATE SET
+                        name = excluded.name, location = excluded.location,
+                        calibration_date = excluded.calibration_date, status = excluded.status
+                ''', (sensor_id, config['name'], config['location'], config['threshold'],
+                      config['calibration_date'], config['status']))
+
+    def init_contacts(self):
+        """Инициализация списка контактов для оповещений"""
+        self.emergency_contacts = [
+            "Главный инженер: +79001112233",
+            "Начальник смены: +79004445566",
+            "Радиационная безопасность: safety@company.com",
+            "Технический отдел: tech@company.com",
+            "Служба эксплуатации: +79007778899"
+        ]
+
+    def start(self):
+        """Запуск сбора данных"""
+        self.sensor_poller = SensorPoller(self.config['poll_max_in_flight'], self.config['poll_timeout'],
+                                          self.config['poll_retries'], self.config['poll_backoff'],
+                                          self.logger)
+        self.data_collection_active = True
+        self.collection_wakeup.clear()
+        self.collection_thread = threading.Thread(target=self.data_collection_worker, daemon=True)
+        self.collection_thread.start()
+        self.notifier.start()
+        self.logger.info("Система сбора данных запущена")
+
+        # Локальный API для окон мониторинга и скриптов
+        if self.config['api_port']:
+            self.api = MonitoringAPIServer(self, self.config['api_host'], self.config['api_port'])
+            self.api.start()
+
+    def data_collection_worker(self):
+        """Рабочий поток для сбора данных"""
+        while self.data_collection_active:
+            try:
+                started = time.monotonic()
+                self.collection_wakeup.clear()
+                self.collect_sensor_data()
+                # Интервал отсчитывается от начала цикла опроса
+                self.collection_wakeup.wait(max(0, self.config['polling_interval'] - (time.monotonic() - started)))
+            except Exception as e:
+                self.logger.error(f"Ошибка в потоке сбора данных: {e}")
+                self.collection_wakeup.wait(5)  # Пауза при ошибке
+
+    def request_collection(self):
+        """Внеочередной цикл опроса в потоке сбора данных; False, если сбор не запущен"""
+        if not self.data_collection_active:
+            return False
+        self.collection_wakeup.set()
+        return True
+
+    def collect_sensor_data(self):
+        """Сбор данных с датчиков"""
+        # Параллельное чтение всех датчиков в пределах интервала опроса
+        readings = self.sensor_poller.poll(self.sensor_configs, self.config['polling_interval'])
+
+        sensor_ids, values = [], []
+        for sensor_id, radiation, error in readings:
+            if error is not None:
+                self.logger.warning(f"Нет данных с датчика {sensor_id}: {error}")
+                continue
+            sensor_ids.append(sensor_id)
+            values.append(radiation)
+
+        # Определение статуса всех показаний цикла одним проходом
+        codes = self.classifier.classify(sensor_ids, values)
+
+        sigma = self.config['baseline_alert_sigma']
+        for sensor_id, radiation, code in zip(sensor_ids, values, codes):
+            try:
+                # Отклонение от базового уровня до учета нового значения
+                deviation = None
+                if sigma:
+                    deviation = self.sensor_statistics.deviation(sensor_id, radiation,
+                                                                 self.config['baseline_min_samples'])
+
+                # Сохранение данных
+                self.store_measurement(sensor_id, radiation, MeasurementStore.STATUSES[code],
+                                       self.sensor_configs[sensor_id]["location"])
+
+                if deviation is not None:
+                    self.check_baseline(sensor_id, radiation, deviation)
+            except Exception as e:
+                self.logger.error(f"Ошибка сбора данных с датчика {sensor_id}: {e}")
+
+        # Проверка пороговых значений только для превышений и неснятых оповещений
+        for index in self.classifier.candidates(sensor_ids, codes, self.alert_states.active):
+            self.check_thresholds(sensor_ids[index], values[index])
+
+        # Запись измерений цикла одной транзакцией
+        self.measurement_writer.flush_cycle()
+
+        self.emit('cycle', None)
+
+    def load_thresholds(self):
+        """Загрузка порогов датчиков (sensors.threshold) в классификатор"""
+        with self.db.reader() as conn:
+            thresholds = dict(conn.execute('SELECT sensor_id, threshold FROM sensors'))
+        for sensor_id, threshold in thresholds.items():
+            if sensor_id in self.sensor_configs and threshold is not None:
+                self.sensor_configs[sensor_id]['threshold'] = threshold
+        self.classifier.set_thresholds(self.config['warning_threshold'], self.config['danger_threshold'],
+                                       thresholds)
+
+    def set_thresholds(self, warning, danger):
+        """Изменение общих порогов
+
+        Датчики, порог которых совпадал с общим порогом предупреждения,
+        получают новый порог; индивидуальные пороги сохраняются.
+        """
+        with self.db.writer() as conn:
+            conn.execute('UPDATE sensors SET threshold = ? WHERE threshold = ?',
+                         (warning, self.config['warning_threshold']))
+        self.config['warning_threshold'] = warning
+        self.config['danger_threshold'] = danger
+        self.load_thresholds()
+
+    def store_measurement(self, sensor_id, radiation_level, status, location):
+        """Сохранение измерения в базу данных (через очередь пакетной записи)"""
+        try:
+            timestamp = datetime.now()
+
+            if self.measurement_writer.put(sensor_id, radiation_level, timestamp, status):
+                self.statistics.add(timestamp, status)
+
+            # Добавление в историю в памяти (самые старые точки вытесняются)
+            self.history.append(sensor_id, timestamp.timestamp(), radiation_level, status, location)
+            self.sensor_statistics.add(sensor_id, timestamp.timestamp(), radiation_level)
+
+            self.emit('measurement', {
+                'timestamp': timestamp,
+                'sensor_id': sensor_id,
+                'value': radiation_level,
+                'status': status,
+                'location': location
+            })
+
+            self.logger.debug(f"Сохранено измерение: {sensor_id} - {radiation_level:.2f} мкЗв/ч")
+
+        except Exception as e:
+            self.logger.error(f"Ошибка сохранения измерения: {e}")
+
+    def check_thresholds(self, sensor_id, radiation_level):
+        """Проверка превышения пороговых значений (оповещение только при смене состояния)"""
+        try:
+            timestamp = datetime.now()
+            warning, danger = self.classifier.sensor_thresholds(sensor_id)
+            change = self.alert_states.update(sensor_id, radiation_level, timestamp.timestamp(),
+                                              warning, danger)
+            if change is None:
+                return
+            event, level = change
+
+            # Определение типа оповещения
+            alert_type = AlertStateMachine.TYPES[level]
+            threshold = danger if level == AlertStateMachine.CRITICAL else warning
+            self.record_alert(sensor_id, alert_type, event, radiation_level, threshold, timestamp)
+
+            if level == AlertStateMachine.NORMAL:
+                self.logger.info(f"Уровень радиации в норме: {sensor_id} - {radiation_level:.2f} мкЗв/ч")
+            else:
+                self.logger.warning(f"Превышение порога ({event}): {sensor_id} - {radiation_level:.2f} мкЗв/ч")
+
+        except Exception as e:
+            self.logger.error(f"Ошибка проверки порогов: {e}")
+
+    def check_baseline(self, sensor_id, radiation_level, deviation):
+        """Оповещение об отклонении от базового уровня датчика (EWMA)
+
+        Срабатывает, когда отклонение достигает baseline_alert_sigma стандартных
+        отклонений, и снова - только после возврата ниже половины этой величины.
+        """
+        try:
+            sigma = self.config['baseline_alert_sigma']
+            if abs(deviation) < sigma / 2:
+                self.baseline_deviations.discard(sensor_id)
+            elif abs(deviation) >= sigma and sensor_id not in self.baseline_deviations:
+                self.baseline_deviations.add(sensor_id)
+                baseline = self.sensor_statistics.snapshot(sensor_id)['ewma']
+                self.record_alert(sensor_id, "DEVIATION", 'raised', radiation_level, round(baseline, 3),
+                                  datetime.now())
+                self.logger.warning(f"Отклонение от базового уровня ({deviation:+.1f}σ): {sensor_id} - "
+                                    f"{radiation_level:.2f} мкЗв/ч")
+        except Exception as e:
+            self.logger.error(f"Ошибка проверки отклонения от базового уровня: {e}")
+
+    def record_alert(self, sensor_id, alert_type, event, radiation_level, threshold, timestamp):
+        """Запись оповещения в журнал и постановка письма в очередь отправки"""
+        with self.db.writer() as conn:
+            alert_id = conn.execute('''
+                INSERT INTO alerts (sensor_id, alert_type, threshold_value, actual_value, timestamp, event)
+                VALUES (?, ?, ?, ?, ?, ?)
+            ''', (sensor_id, alert_type, threshold, radiation_level, timestamp, event)).lastrowid
+
+        alert = {
+            'id': alert_id,
+            'timestamp': timestamp,
+            'sensor_id': sensor_id,
+            'type': alert_type,
+            'event': event,
+            'value': radiation_level,
+            'threshold': threshold
+        }
+        self.alerts_log.append(alert)
+        self.emit('alert', alert)
+        # Письмо отправит поток оповещений, сбор данных не ждет SMTP-сервер
+        self.notifier.enqueue(alert_id)
+
+    def format_alert(self, alert):
+        """Тема и текст уведомления по строке журнала оповещений
+
+        alert: (id, sensor_id, alert_type, threshold_value, actual_value, timestamp, event, ...)
+        """
+        _, sensor_id, alert_type, threshold, radiation_level, timestamp, event = alert[:7]
+        location = self.sensor_configs.get(sensor_id, {}).get('location', '-')
+        alert_time = datetime.fromisoformat(str(timestamp)).strftime('%d.%m.%Y %H:%M:%S')
+
+        if alert_type == "DEVIATION":
+            subject = f"📈 Отклонение от обычного уровня радиации - {sensor_id}"
+            message = f"""
+        Уровень радиации заметно отличается от обычного для датчика
+
+        Детали:
+        - Датчик: {sensor_id}
+        - Местоположение: {location}
+        - Текущий уровень: {radiation_level:.2f} мкЗв/ч
+        - Обычный уровень: {threshold} мкЗв/ч
+        - Время: {alert_time}
+
+        Рекомендуется проверить датчик и обстановку на участке.
+        """
+        elif alert_type == "CLEARED":
+            subject = f"✅ Уровень радиации в норме - {sensor_id}"
+            message = f"""
+        Превышение уровня радиации прекратилось
+
+        Детали:
+        - Датчик: {sensor_id}
+        - Местоположение: {location}
+        - Текущий уровень: {radiation_level:.2f} мкЗв/ч
+        - Пороговое значение: {threshold} мкЗв/ч
+        - Время: {alert_time}
+        """
+        elif alert_type == "CRITICAL":
+            subject = f"🚨 КРИТИЧЕСКОЕ ПРЕВЫШЕНИЕ! Датчик {sensor_id}"
+            message = f"""
+        ВНИМАНИЕ! КРИТИЧЕСКОЕ ПРЕВЫШЕНИЕ УРОВНЯ РАДИАЦИИ!
+
+        Детали:
+        - Датчик: {sensor_id}
+        - Местоположение: {location}
+        - Текущий уровень: {radiation_level:.2f} мкЗв/ч
+        - Пороговое значение: {threshold} мкЗв/ч
+        - Время: {alert_time}
+
+        НЕОБХОДИМО НЕМЕДЛЕННО ПРИНЯТЬ МЕРЫ!
+        """
+        else:
+            subject = f"⚠️ ПРЕДУПРЕЖДЕНИЕ: Превышение уровня радиации - {sensor_id}"
+            message = f"""
+        ПРЕДУПРЕЖДЕНИЕ: Превышение уровня радиации
+
+        Детали:
+        - Датчик: {sensor_id}
+        - Местоположение: {location}
+        - Текущий уровень: {radiation_level:.2f} мкЗв/ч
+        - Пороговое значение: {threshold} мкЗв/ч
+        - Время: {alert_time}
+
+        Рекомендуется проверить оборудование и принять меры.
+        """
+        if event == 'reminder':
+            subject = f"Напоминание: {subject}"
+        elif event == 'downgraded':
+            subject = f"Снижение до предупреждения: {subject}"
+        return subject, message
+
+    def notification_recipients(self):
+        """Адресаты оповещений (notification_email, несколько - через запятую)"""
+        return [address.strip() for address in self.config['notification_email'].split(',') if address.strip()]
+
+    def send_email_notification(self, subject, message, recipients=None):
+        """Отправка email уведомления (ошибки передаются вызывающему для повтора)"""
+        if self.config['smtp_enabled']:
+            self.smtp_pool.send(recipients or self.notification_recipients(), subject, message.strip())
+        else:
+            # Отправка писем отключена - уведомление только в журнал
+            self.logger.info(f"EMAIL УВЕДОМЛЕНИЕ: {subject}")
+            self.logger.info(f"Сообщение: {message.strip()}")
+
+    def reseed_statistics(self):
+        """Пересчет счетчиков статистики после удаления измерений из БД"""
+        with self.db.reader() as conn:
+            self.statistics.seed(conn)
+        self.emit('statistics', None)
+
+    def load_history(self):
+        """Заполнение истории в памяти и статистики датчиков последними измерениями из БД"""
+        since = datetime.now() - timedelta(seconds=self.config['chart_history_seconds'])
+        self.history.clear()
+        self.sensor_statistics.clear()
+        with self.db.reader() as conn:
+            for sensor_id, timestamp, radiation_level, status, location in conn.execute('''
+                SELECT m.sensor_id, m.timestamp, m.radiation_level, m.status, s.location
+                FROM measurements m
+                LEFT JOIN sensors s ON m.sensor_id = s.sensor_id
+                WHERE m.timestamp >= ?
+                ORDER BY m.timestamp
+            ''', (since.isoformat(sep=' '),)):
+                seconds = datetime.fromisoformat(str(timestamp)).timestamp()
+                self.history.append(sensor_id, seconds, radiation_level, status, location)
+                self.sensor_statistics.add(sensor_id, seconds, radiation_level)
+
+    def restore_backup(self, path, progress=None):
+        """Восстановление БД из резервной копии; возвращает количество файлов в цепочке
+
+        Копия может быть создана прежней версией, поэтому схема собираемой БД
+        обновляется до текущей до применения разностных копий. Затем состояние в
+        памяти (пороги, состояние оповещений, статистика, история) заново
+        загружается из восстановленной БД.
+        """
+        # Скетчи в памяти относятся к замененной БД
+        files = self.backup_engine.restore(path, progress, prepare=self.create_tables,
+                                           replaced=self.rollups.discard_sketches)
+
+        self.init_sensor_configs()
+        self.load_thresholds()
+        self.alert_states.reset()
+        with self.db.reader() as conn:
+            self.alert_states.restore(conn)
+        self.baseline_deviations.clear()
+        self.load_history()
+        self.reseed_statistics()
+        return files
+
+    def stop(self):
+        """Остановка сбора данных и фоновых потоков с дозаписью очереди измерений"""
+        self.data_collection_active = False
+        self.collection_wakeup.set()
+        if self.api:
+            self.api.stop()
+        # Текущий цикл опроса завершается: его измерения и оповещения попадают в очередь записи
+        if hasattr(self, 'collection_thread'):
+            self.collection_thread.join(self.config['polling_interval'] + self.config['poll_timeout'] + 5)
+        if hasattr(self, 'sensor_poller'):
+            self.sensor_poller.shutdown()
+        # Запись измерений, оставшихся в очереди
+        if hasattr(self, 'measurement_writer'):
+            self.measurement_writer.stop()
+        if hasattr(self, 'retention'):
+            self.retention.stop()
+        # Неотправленные оповещения остаются в БД и будут отправлены при следующем запуске
+        if hasattr(self, 'notifier'):
+            self.notifier.stop()
+            self.smtp_pool.close()
+        if hasattr(self, 'db'):
+            self.db.close()
+        self.stopped.set()
+        self.logger.info("Система остановлена")
+
+    def run_forever(self):
+        """Работа без графического интерфейса до сигнала остановки (SIGINT, SIGTERM)"""
+        for signum in (signal.SIGINT, signal.SIGTERM):
+            signal.signal(signum, lambda *args: self.stopped.set())
+        self.start()
+        self.logger.info("Служба сбора данных запущена без графического интерфейса")
+        self.stopped.wait()
+        self.stop()
+
+
+class MonitoringAPIHandler(BaseHTTPRequestHandler):
+    """Обработчик запросов локального API службы сбора данных"""
+
+    def log_message(self, format, *args):
+        self.server.api.logger.debug(f"API {self.address_string()}: {format % args}")
+
+    def do_GET(self):
+        url = urlparse(self.path)
+        params = {key: values[-1] for key, values in parse_qs(url.query).items()}
+        if url.path == '/stream':
+            self.stream()
+            return
+
+        routes = {
+            '/sensors': self.server.api.sensors,
+            '/statistics': self.server.api.statistics,
+            '/statistics/sensors': self.server.api.sensor_statistics,
+            '/measurements': self.server.api.measurements,
+            '/measurements/raw': self.server.api.raw_measurements,
+            '/alerts': self.server.api.alerts,
+            '/rollups': self.server.api.rollups,
+            '/rollups/series': self.server.api.rollup_series,
+            '/rollups/quantiles': self.server.api.rollup_quantiles,
+        }
+        handler = routes.get(url.path)
+        if handler is None:
+            self.send_json({'error': f"неизвестный путь {url.path}"}, 404)
+            return
+
+        try:
+            self.send_json(handler(params))
+        except (KeyError, ValueError) as e:
+            self.send_json({'error': f"некорректный параметр: {e}"}, 400)
+        except Exception as e:
+            self.server.api.logger.error(f"Ошибка обработки запроса API {self.path}: {e}")
+            self.send_json({'error': str(e)}, 500)
+
+    def send_json(self, payload, status=200):
+        """Ответ в формате JSON"""
+        body = json.dumps(payload, ensure_ascii=False, default=str).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json; charset=utf-8')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def stream(self):
+        """Поток событий службы в формате Server-Sent Events"""
+        api = self.server.api
+        client = api.add_client()
+        try:
+            self.send_response(200)
+            self.send_header('Content-Type', 'text/event-stream; charset=utf-8')
+            self.send_header('Cache-Control', 'no-cache')
+            self.end_headers()
+            while True:
+                try:
+                    message = client.get(timeout=api.keepalive)
+                except queue.Empty:
+                    message = b': keep-alive\n\n'
+                if message is None:
+                    break
+                self.wfile.write(message)
+                self.wfile.flush()
+        except (OSError, ValueError) as e:
+            # Клиент отключился во время записи (разрыв, таймаут или закрытый сокет)
+            api.logger.debug(f"Клиент потока событий отключился: {e}")
+        finally:
+            api.remove_client(client)
+
+
+class MonitoringAPIServer:
+    """Локальный HTTP API службы сбора данных
+
+    /stream передает события службы (Server-Sent Events): measurement, status
+    (смена статуса датчика), alert и statistics. Каждое событие сериализуется
+    один раз и раскладывается по очередям подключенных клиентов; клиент, который
+    не успевает читать, отключается, чтобы не задерживать сбор данных.
+    Запросы /sensors, /statistics, /measurements, /alerts, /rollups и
+    /rollups/series читают данные через пул соединений чтения, поэтому любое
+    число окон и скриптов работает с одним сборщиком и одним соединением записи.
+    """
+
+    def __init__(self, service, host='127.0.0.1', port=8765, client_queue_size=1000, keepalive=15):
+        self.service = service
+        self.logger = service.logger
+        self.client_queue_size = client_queue_size
+        self.keepalive = keepalive
+        self.clients = set()
+        self.clients_lock = threading.Lock()
+        self.last_status = {}
+        self.event_id = 0
+
+        self.httpd = ThreadingHTTPServer((host, port), MonitoringAPIHandler)
+        self.httpd.daemon_threads = True
+        self.httpd.api = self
+        self.thread = None
+
+    def start(self):
+        """Запуск сервера и подписка на события службы"""
+        self.service.subscribe(self.publish)
+        self.thread = threading.Thread(target=self.httpd.serve_forever, daemon=True)
+        self.thread.start()
+        host, port = self.httpd.server_address[:2]
+        self.logger.info(f"API службы сбора данных: http://{host}:{port}")
+
+    def stop(self):
+        """Остановка сервера и отключение клиентов потока событий"""
+        self.httpd.shutdown()
+        self.httpd.server_close()
+        with self.clients_lock:
+            for client in self.clients:
+                self.offer(client, None)
+
+    def add_client(self):
+        """Очередь событий нового клиента /stream"""
+        client = queue.Queue(self.client_queue_size)
+        with self.clients_lock:
+            self.clients.add(client)
+        return client
+
+    def remove_client(self, client):
+        with self.clients_lock:
+            self.clients.discard(client)
+
+    def offer(self, client, message):
+        """Передача сообщения клиенту без ожидания; переполненная очередь - отключение"""
+        try:
+            client.put_nowait(message)
+        except queue.Full:
+            self.logger.warning("Клиент API не успевает читать поток событий и будет отключен")
+            while True:
+                try:
+                    client.get_nowait()
+                except queue.Empty:
+                    break
+            client.put_nowait(None)
+
+    def publish(self, event, data):
+        """Обработчик событий службы (в потоке сбора данных)"""
+        messages = []
+        if event == 'measurement':
+            messages.append(('measurement', data))
+            if self.last_status.get(data['sensor_id']) != data['status']:
+                self.last_status[data['sensor_id']] = data['status']
+                messages.append(('status', {'sensor_id': data['sensor_id'], 'status': data['status'],
+                                            'timestamp': data['timestamp']}))
+        elif event in ('alert', 'notified', 'statistics'):
+            messages.append((event, data))
+        if not messages:
+            return
+
+        encoded = []
+        for name, payload in messages:
+            self.event_id += 1
+            body = json.dumps(payload, ensure_ascii=False, default=str)
+            encoded.append(f"id: {self.event_id}\nevent: {name}\ndata: {body}\n\n".encode('utf-8'))
+
+        with self.clients_lock:
+            for client in list(self.clients):
+                for message in encoded:
+                    self.offer(client, message)
+
+    def sensors(self, params):
+        return self.service.sensor_configs
+
+    def statistics(self, params):
+        return self.service.statistics.snapshot()
+
+    def sensor_statistics(self, params):
+        """Потоковая статистика датчиков (среднее, EWMA, квантили, минимум и максимум за окно)"""
+        return self.service.sensor_statistics.snapshots()
+
+    def measurements(self, params):
+        """Страница истории измерений (см. HistoryPager); next - ключ следующей страницы"""
+        filters = {
+            'sensor_id': params.get('sensor_id'),
+            'status': params.get('status'),
+            'start': parse_api_time(params.get('start')),
+            'end': parse_api_time(params.get('end'))
+        }
+        after = None
+        if 'after_timestamp' in params:
+            after = (params['after_timestamp'], int(params['after_id']))
+        newer = params.get('newer') == '1'
+        rows = self.service.history_pager.fetch(filters, after, newer)
+        keys = ('id', 'timestamp', 'sensor_id', 'value', 'status')
+        page = [dict(zip(keys, row)) for row in rows]
+        next_key = None
+        if len(rows) == self.service.history_pager.page_size:
+            edge = rows[0] if newer else rows[-1]
+            next_key = {'after_timestamp': edge[1], 'after_id': edge[0]}
+        return {'rows': page, 'next': next_key}
+
+    def raw_measurements(self, params):
+        """Исходные измерения датчика за [start, end), включая упакованные в блоки"""
+        limit = min(int(params.get('limit', 10000)), 100000)
+        with self.service.db.reader() as conn:
+            rows = islice(self.service.chunks.measurements(conn, parse_api_time(params['start']),
+                                                           parse_api_time(params['end']),
+                                                           [params['sensor_id']]), limit)
+            keys = ('timestamp', 'sensor_id', 'value', 'status')
+            return [dict(zip(keys, row)) for row in rows]
+
+    def alerts(self, params):
+        """Последние оповещения"""
+        limit = min(int(params.get('limit', 50)), 1000)
+        with self.service.db.reader() as conn:
+            rows = conn.execute('''
+                SELECT id, timestamp, sensor_id, alert_type, event, actual_value, threshold_value, notified
+                FROM alerts
+                ORDER BY id DESC
+                LIMIT ?
+            ''', (limit,)).fetchall()
+        keys = ('id', 'timestamp', 'sensor_id', 'type', 'event', 'value', 'threshold', 'notified')
+        return [dict(zip(keys, row)) for row in rows]
+
+    def rollups(self, params):
+        """Агрегаты по датчикам за интервал [start, end)"""
+        level = params.get('level', 'day')
+        if level not in RollupManager.LEVELS:
+            raise ValueError(f"level={level}")
+        with self.service.db.reader() as conn:
+            rows = self.service.rollups.sensor_summary(conn, level, parse_api_time(params.get('start')),
+                                                       parse_api_time(params.get('end')))
+        keys = ('sensor_id', 'avg', 'max', 'min', 'samples', 'non_normal')
+        return [dict(zip(keys, row)) for row in rows]
+
+    def rollup_series(self, params):
+        """Минимумы и максимумы по интервалам за [start, end) для графиков"""
+        level = params.get('level', 'minute')
+        if level not in RollupManager.LEVELS:
+            raise ValueError(f"level={level}")
+        with self.service.db.reader() as conn:
+            rows = self.service.rollups.series(conn, level, parse_api_time(params['start']),
+                                               parse_api_time(params['end']))
+        keys = ('sensor_id', 'bucket', 'min', 'max')
+        return [dict(zip(keys, row)) for row in rows]
+
+    def rollup_quantiles(self, params):
+        """Медиана, 95-й и 99-й процентили за [start, end) по скетчам агрегатов"""
+        level = params.get('level', 'day')
+        if level not in RollupManager.SKETCH_LEVELS:
+            raise ValueError(f"level={level}")
+        with self.service.db.reader() as conn:
+            sensors, total = self.service.rollups.quantiles(conn, level, parse_api_time(params.get('start')),
+                                                            parse_api_time(params.get('end')))
+        keys = ('p50', 'p95', 'p99')
+        return {'sensors': {sensor_id: dict(zip(keys, values)) for sensor_id, values in sensors.items()},
+                'total': dict(zip(keys, total))}
+
+
+def parse_api_time(value):
+    """Время из параметра запроса (ISO 8601) в формате хранения в БД"""
+    if not value:
+        return None
+    return datetime.fromisoformat(value).isoformat(sep=' ')
+
+
+class MonitoringClient:
+    """Клиент локального API службы сбора данных
+
+    subscribe повторяет интерфейс MonitoringService: обработчик получает
+    (событие, данные) из потока /stream; при разрыве соединения клиент
+    переподключается. Остальные методы - запросы истории и агрегатов.
+    """
+
+    def __init__(self, base_url='http://127.0.0.1:8765', timeout=10, logger=None):
+        self.base_url = base_url.rstrip('/')
+        self.timeout = timeout
+        self.logger = logger or logging.getLogger(__name__)
+        self.stop_event = threading.Event()
+
+    def get(self, path, **params):
+        """GET-запрос к API, ответ JSON"""
+        query = urlencode({key: value for key, value in params.items() if value is not None})
+        with urlopen(f"{self.base_url}{path}{'?' + query if query else ''}", timeout=self.timeout) as response:
+            return json.loads(response.read().decode('utf-8'))
+
+    def sensors(self):
+        return self.get('/sensors')
+
+    def statistics(self):
+        return self.get('/statistics')
+
+    def sensor_statistics(self):
+        return self.get('/statistics/sensors')
+
+    def measurements(self, sensor_id=None, status=None, start=None, end=None, after=None):
+        """Страница истории; after - значение next из предыдущей страницы"""
+        return self.get('/measurements', sensor_id=sensor_id, status=status, start=start, end=end,
+                        **(after or {}))
+
+    def raw_measurements(self, sensor_id, start, end, limit=10000):
+        return self.get('/measurements/raw', sensor_id=sensor_id, start=start, end=end, limit=limit)
+
+    def alerts(self, limit=50):
+        return self.get('/alerts', limit=limit)
+
+    def rollups(self, level='day', start=None, end=None):
+        return self.get('/rollups', level=level, start=start, end=end)
+
+    def rollup_series(self, start, end, level='minute'):
+        return self.get('/rollups/series', level=level, start=start, end=end)
+
+    def rollup_quantiles(self, start=None, end=None, level='day'):
+        return self.get('/rollups/quantiles', level=level, start=start, end=end)
+
+    def subscribe(self, listener):
+        """Прием событий в фоновом потоке: listener(событие, данные)"""
+        thread = threading.Thread(target=self.stream, args=(listener,), daemon=True)
+        thread.start()
+        return thread
+
+    def stream(self, listener, retry_delay=1.0):
+        """Чтение потока событий до вызова close()"""
+        while not self.stop_event.is_set():
+            try:
+                # Таймаут чтения больше интервала keep-alive сервера
+                with urlopen(f"{self.base_url}/stream", timeout=60) as response:
+                    event, data = 'message', []
+                    for raw_line in response:
+                        if self.stop_event.is_set():
+                            return
+                        line = raw_line.decode('utf-8').rstrip('\r\n')
+                        if line.startswith('event:'):
+                            event = line[6:].strip()
+                        elif line.startswith('data:'):
+                            data.append(line[5:].strip())
+                        elif not line and data:
+                            payload = json.loads('\n'.join(data))
+                            # Ошибка обработчика не прерывает прием событий
+                            try:
+                                listener(event, payload)
+                            except Exception as e:
+                                self.logger.error(f"Ошибка обработчика события {event}: {e}")
+                            event, data = 'message', []
+            except (OSError, ValueError):
+                pass
+            self.stop_event.wait(retry_delay)
+
+    def close(self):
+        self.stop_event.set()
+
 
-    def init_contacts(self):
-        """Инициализация списка контактов для оповещений"""
-        self.emergency_contacts = [
-            "Главный инженер: +79001112233",
-            "Начальник смены: +79004445566",
-            "Радиационная безопасность: safety@company.com",
-            "Технический отдел: tech@company.com",
-            "Служба эксплуатации: +79007778899"
-        ]
+class RadiationMonitoringSystem:
+    # Окна просмотра графика: (подпись, длительность в секундах)
+    CHART_WINDOWS = (("5 мин", 300), ("1 ч", 3600), ("24 ч", 86400))
+    # Число строк в журналах измерений и оповещений
+    MEASUREMENT_LOG_ROWS = 100
+    ALERT_LOG_ROWS = 50
+    NOTIFY_STATUS = {0: "В ожидании", 1: "Отправлено", 2: "Ошибка"}  # alerts.notified
+    ALERT_EVENTS = {"escalated": "эскалация", "downgraded": "снижение", "reminder": "напоминание"}
+
+    def __init__(self, service=None):
+        self.root = tk.Tk()
+        self.root.title("Система контроля уровня радиации - АО 'КОНСИСТ-ОС'")
+        self.root.geometry("1400x900")
+
+        # Служба сбора данных: создается окном или передается извне
+        try:
+            self.service = service or MonitoringService()
+        except sqlite3.Error as e:
+            messagebox.showerror("Ошибка", f"Не удалось инициализировать базу данных: {e}")
+            raise
+        self.config = self.service.config
+        self.logger = self.service.logger
+        self.sensor_configs = self.service.sensor_configs
+
+        # Новые строки журналов, ожидающие добавления в таблицы интерфейса
+        self.measurement_log_pending = deque(maxlen=self.MEASUREMENT_LOG_ROWS)
+        self.alert_log_pending = deque(maxlen=self.ALERT_LOG_ROWS)
+        self.alert_status_pending = {}  # id оповещения -> результат отправки
+
+        # Инициализация компонентов
+        self.ui_updates = UIUpdateBus(self.logger)
+        self.setup_ui()
+        self.pump_ui_updates()
+        self.service.subscribe(self.on_service_event)
+        # Окно запускает и останавливает службу, если она еще не работает
+        self.owns_service = not self.service.data_collection_active
+        if self.owns_service:
+            self.service.start()
+
+    def on_service_event(self, event, data):
+        """События службы сбора данных (в потоке сбора) передаются в шину интерфейса"""
+        if event == 'measurement':
+            sensor_id = data['sensor_id']
+            self.measurement_log_pending.append((str(data['timestamp']), sensor_id, data['location'],
+                                                 data['value'], data['status']))
+            self.ui_updates.post(('sensor', sensor_id), self.update_sensor_display,
+                                 sensor_id, data['value'], data['status'])
+        elif event == 'alert':
+            self.alert_log_pending.append((data['id'], str(data['timestamp']), data['sensor_id'], data['type'],
+                                           data['event'], data['value'], data['threshold'], 'В ожидании'))
+            self.ui_updates.post('alerts', self.append_alerts_log)
+        elif event == 'notified':
+            self.alert_status_pending[data['id']] = self.NOTIFY_STATUS[data['notified']]
+            self.ui_updates.post('alerts', self.append_alerts_log)
+        elif event == 'cycle':
+            # Обновление журнала измерений, статистики и графика
+            self.ui_updates.post('measurement_log', self.append_measurement_log)
+            self.ui_updates.post('statistics', self.update_statistics)
+            self.ui_updates.post('chart', self.update_chart)
+        elif event == 'statistics':
+            self.ui_updates.post('db_statistics', self.update_db_statistics)
 
     def setup_ui(self):
         """Настройка пользовательского интерфейса"""
@@ -240,9 +4239,15 @@ class RadiationMonitoringSystem:
         cards_frame = ttk.Frame(main_frame)
         cards_frame.pack(fill="both", expand=True)
 
-        # Создаем карточки датчиков
+        # Создаем карточки датчиков; при большом числе датчиков - карту на Canvas
         self.sensor_cards = {}
-        sensors_list = list(self.sensor_configs.keys())
+        self.sensor_tile_map = None
+        mode = self.config['dashboard_mode']
+        if mode == 'tiles' or (mode == 'auto' and len(self.sensor_configs) > self.config['dashboard_cards_max']):
+            self.sensor_tile_map = SensorTileMap(cards_frame, self.sensor_configs)
+            sensors_list = []
+        else:
+            sensors_list = list(self.sensor_configs.keys())
 
         for i, sensor_id in enumerate(sensors_list):
             row = i // 2
@@ -275,6 +4280,10 @@ class RadiationMonitoringSystem:
             level_indicator = ttk.Label(level_frame, background="green")
             level_indicator.pack(fill="both")
 
+            # Статистика датчика (из памяти службы)
+            stats_label = ttk.Label(card, text="", font=("Arial", 8))
+            stats_label.pack()
+
             # Футер с временем обновления
             footer_label = ttk.Label(card, text="Обновлено: --:--:--",
                                      font=("Arial", 8), foreground="gray")
@@ -286,6 +4295,7 @@ class RadiationMonitoringSystem:
                 "value_label": value_label,
                 "status_label": status_label,
                 "level_indicator": level_indicator,
+                "stats_label": stats_label,
                 "footer_label": footer_label
             }
 
@@ -313,6 +4323,15 @@ class RadiationMonitoringSystem:
         chart_frame = ttk.LabelFrame(parent, text="График уровня радиации в реальном времени", padding=10)
         chart_frame.pack(fill="x", pady=10)
 
+        # Выбор окна просмотра
+        zoom_frame = ttk.Frame(chart_frame)
+        zoom_frame.pack(fill="x", pady=(0, 5))
+        ttk.Label(zoom_frame, text="Окно:").pack(side="left")
+        self.chart_window = tk.IntVar(value=self.CHART_WINDOWS[0][1])
+        for title, seconds in self.CHART_WINDOWS:
+            ttk.Radiobutton(zoom_frame, text=title, value=seconds, variable=self.chart_window,
+                            command=self.update_chart).pack(side="left", padx=5)
+
         # Создаем Canvas для графика
         chart_container = ttk.Frame(chart_frame)
         chart_container.pack(fill="both", expand=True)
@@ -320,8 +4339,10 @@ class RadiationMonitoringSystem:
         self.chart_canvas = tk.Canvas(chart_container, bg='white', height=300)
         self.chart_canvas.pack(fill="both", expand=True)
 
-        # Инициализация данных для графика
-        self.chart_data = {sensor_id: deque(maxlen=50) for sensor_id in self.sensor_configs.keys()}
+        # Данные старше истории в памяти загружаются из поминутных агрегатов БД
+        self.chart_db_series = {}
+        self.chart_db_range = None
+        self.chart_db_loading = False
 
         # Цвета для линий датчиков
         self.sensor_colors = {
@@ -331,12 +4352,109 @@ class RadiationMonitoringSystem:
             "Д-142": "orange"
         }
 
+        # Элементы графика создаются один раз и затем только перемещаются;
+        # статичные элементы перестраиваются при изменении размеров Canvas
+        self.chart_items = None
+        self.chart_scale_key = None
+        self.chart_redraw_pending = False
+        self.chart_canvas.bind("<Configure>", self.on_chart_resize)
+
+    def on_chart_resize(self, event=None):
+        """Перестроение статичных элементов графика при изменении размера"""
+        self.chart_items = None
+        self.update_chart()
+
     def update_chart(self):
-        """Обновление графика на Canvas"""
-        try:
-            # Очищаем предыдущий график
-            self.chart_canvas.delete("all")
+        """Запрос обновления графика (не чаще одного раза за chart_frame_ms)"""
+        if not self.chart_redraw_pending:
+            self.chart_redraw_pending = True
+            self.root.after(self.config['chart_frame_ms'], self.redraw_chart)
+
+    def build_chart_items(self, width, height):
+        """Создание элементов графика: оси, сетка, подписи, линии датчиков, легенда"""
+        self.chart_canvas.delete("all")
+        padding = 50
+        chart_height = height - 2 * padding
+
+        items = {'width': width, 'height': height, 'grid_labels': [], 'sensors': {}, 'shown': set()}
+
+        # Рисуем оси
+        self.chart_canvas.create_line(padding, height - padding, width - padding, height - padding,
+                                      width=2)  # X ось
+        self.chart_canvas.create_line(padding, padding, padding, height - padding, width=2)  # Y ось
+
+        # Добавляем подписи осей
+        items['x_title'] = self.chart_canvas.create_text(width // 2, height - 10, text="",
+                                                         font=("Arial", 10))
+        self.chart_canvas.create_text(10, height // 2, text="Уровень (мкЗв/ч)", font=("Arial", 10), angle=90)
+
+        # Добавляем горизонтальные линии (сетку) и подписи значений на оси Y
+        for i in range(0, 6):
+            y = padding + i * (chart_height / 5)
+            self.chart_canvas.create_line(padding, y, width - padding, y, fill="lightgray")
+            items['grid_labels'].append(self.chart_canvas.create_text(padding - 10, y, text="",
+                                                                      font=("Arial", 8)))
+
+        # Подписи времени на оси X
+        items['time_labels'] = [
+            self.chart_canvas.create_text(padding + i * (width - 2 * padding) / 4, height - padding + 12,
+                                          text="", font=("Arial", 8))
+            for i in range(5)
+        ]
+
+        # Линии порогов предупреждения и опасности
+        for key, color in (('warning', "orange"), ('danger', "red")):
+            items[key + '_line'] = self.chart_canvas.create_line(0, 0, 0, 0, fill=color, width=1,
+                                                                 dash=(4, 2), state="hidden")
+            items[key + '_text'] = self.chart_canvas.create_text(0, 0, font=("Arial", 8), anchor="w",
+                                                                 fill=color, state="hidden")
+
+        self.chart_items = items
+        self.chart_scale_key = None
+
+    def chart_sensor_items(self, sensor_id):
+        """Элементы линии, точки и легенды датчика (создаются при первом обращении)"""
+        items = self.chart_items['sensors'].get(sensor_id)
+        if items is None:
+            color = self.sensor_colors.get(sensor_id, "blue")
+            legend_x = self.chart_items['width'] - 150
+            legend_y = 50 + 10 + 20 * len(self.chart_items['sensors'])
+            items = {
+                'line': self.chart_canvas.create_line(0, 0, 0, 0, fill=color, width=2,
+                                                      state="hidden"),
+                'point': self.chart_canvas.create_oval(0, 0, 0, 0, fill=color, outline=color, state="hidden"),
+                'legend_box': self.chart_canvas.create_rectangle(legend_x, legend_y, legend_x + 10,
+                                                                 legend_y + 10, fill=color, outline=color,
+                                                                 state="hidden"),
+                'legend_text': self.chart_canvas.create_text(legend_x + 20, legend_y + 5, text="",
+                                                             font=("Arial", 9), anchor="w", state="hidden")
+            }
+            self.chart_items['sensors'][sensor_id] = items
+        return items
+
+    def draw_chart_scale(self, width, height, padding, y_max, y_scale):
+        """Подписи шкалы Y и линии порогов для текущего масштаба"""
+        for i, label in enumerate(self.chart_items['grid_labels']):
+            self.chart_canvas.itemconfig(label, text=f"{y_max - i * (y_max / 5):.1f}")
+
+        for key, title in (('warning', "Предупреждение"), ('danger', "Опасность")):
+            threshold = self.config[f'{key}_threshold']
+            threshold_y = height - padding - (threshold * y_scale)
+            if threshold > 0 and padding <= threshold_y <= height - padding:
+                self.chart_canvas.coords(self.chart_items[key + '_line'],
+                                         padding, threshold_y, width - padding, threshold_y)
+                self.chart_canvas.coords(self.chart_items[key + '_text'], width - padding + 5, threshold_y)
+                self.chart_canvas.itemconfig(self.chart_items[key + '_text'],
+                                             text=f"{title}: {threshold} мкЗв/ч", state="normal")
+                self.chart_canvas.itemconfig(self.chart_items[key + '_line'], state="normal")
+            else:
+                self.chart_canvas.itemconfig(self.chart_items[key + '_line'], state="hidden")
+                self.chart_canvas.itemconfig(self.chart_items[key + '_text'], state="hidden")
 
+    def redraw_chart(self):
+        """Обновление графика на Canvas: перемещение существующих элементов"""
+        self.chart_redraw_pending = False
+        try:
             # Получаем размеры canvas
             width = self.chart_canvas.winfo_width()
             height = self.chart_canvas.winfo_height()
@@ -344,96 +4462,128 @@ class RadiationMonitoringSystem:
             if width <= 1 or height <= 1:
                 return
 
+            if self.chart_items is None or (self.chart_items['width'], self.chart_items['height']) != (width, height):
+                self.build_chart_items(width, height)
+
             # Отступы для графика
             padding = 50
             chart_width = width - 2 * padding
             chart_height = height - 2 * padding
 
-            # Рисуем оси
-            self.chart_canvas.create_line(padding, height - padding, width - padding, height - padding,
-                                          width=2)  # X ось
-            self.chart_canvas.create_line(padding, padding, padding, height - padding, width=2)  # Y ось
-
-            # Добавляем подписи осей
-            self.chart_canvas.create_text(width // 2, height - 10, text="Время (последние измерения)",
-                                          font=("Arial", 10))
-            self.chart_canvas.create_text(10, height // 2, text="Уровень (мкЗв/ч)", font=("Arial", 10), angle=90)
-
-            # Добавляем горизонтальные линии (сетку)
-            for i in range(0, 6):
-                y = padding + i * (chart_height / 5)
-                self.chart_canvas.create_line(padding, y, width - padding, y, fill="lightgray")
-
-                # Подписи значений на оси Y
-                value = 3.0 - i * (3.0 / 5)
-                self.chart_canvas.create_text(padding - 10, y, text=f"{value:.1f}", font=("Arial", 8))
+            # Окно просмотра; ряды прореживаются до двух точек (минимум и максимум) на пиксель
+            window = self.chart_window.get()
+            now = time.time()
+            since = now - window
+            step = window / max(chart_width, 1)
+            series = {sensor_id: self.chart_series(sensor_id, since, step)
+                      for sensor_id in self.sensor_configs.keys()}
 
             # Находим максимальное значение для масштабирования
             max_value = 0.1
-            for sensor_id, data in self.chart_data.items():
-                if data:
-                    max_value = max(max_value, max(data))
+            for points in series.values():
+                if points:
+                    max_value = max(max_value, max(value for _, value in points))
 
             # Масштабируем так, чтобы максимальное значение было видно
-            y_scale = chart_height / max(max_value * 1.2, 3.0)
-
-            # Рисуем линии для каждого датчика
-            legend_x = width - 150
-            legend_y = padding + 10
-
-            for sensor_id in self.sensor_configs.keys():
-                data = list(self.chart_data[sensor_id])
-                if len(data) > 1:
-                    points = []
-                    x_scale = chart_width / (len(data) - 1) if len(data) > 1 else chart_width
-
-                    for i, value in enumerate(data):
-                        x = padding + i * x_scale
-                        y = height - padding - (value * y_scale)
-                        points.extend([x, y])
-
-                    if points:
-                        # Рисуем линию
-                        color = self.sensor_colors.get(sensor_id, "blue")
-                        self.chart_canvas.create_line(points, fill=color, width=2, smooth=True)
-
-                        # Добавляем точку на последнем значении
-                        last_x = points[-4] if len(points) >= 4 else points[-2]
-                        last_y = points[-3] if len(points) >= 4 else points[-1]
-                        self.chart_canvas.create_oval(last_x - 3, last_y - 3, last_x + 3, last_y + 3,
-                                                      fill=color, outline=color)
-
-                        # Добавляем легенду
-                        self.chart_canvas.create_rectangle(legend_x, legend_y, legend_x + 10, legend_y + 10,
-                                                           fill=color, outline=color)
-                        self.chart_canvas.create_text(legend_x + 20, legend_y + 5,
-                                                      text=f"{sensor_id}: {data[-1]:.2f} мкЗв/ч",
-                                                      font=("Arial", 9), anchor="w")
-                        legend_y += 20
-
-            # Добавляем горизонтальную линию для порога предупреждения
-            if self.config['warning_threshold'] > 0:
-                warning_y = height - padding - (self.config['warning_threshold'] * y_scale)
-                if padding <= warning_y <= height - padding:
-                    self.chart_canvas.create_line(padding, warning_y, width - padding, warning_y,
-                                                  fill="orange", width=1, dash=(4, 2))
-                    self.chart_canvas.create_text(width - padding + 5, warning_y,
-                                                  text=f"Предупреждение: {self.config['warning_threshold']} мкЗв/ч",
-                                                  font=("Arial", 8), anchor="w", fill="orange")
-
-            # Добавляем горизонтальную линию для порога опасности
-            if self.config['danger_threshold'] > 0:
-                danger_y = height - padding - (self.config['danger_threshold'] * y_scale)
-                if padding <= danger_y <= height - padding:
-                    self.chart_canvas.create_line(padding, danger_y, width - padding, danger_y,
-                                                  fill="red", width=1, dash=(4, 2))
-                    self.chart_canvas.create_text(width - padding + 5, danger_y,
-                                                  text=f"Опасность: {self.config['danger_threshold']} мкЗв/ч",
-                                                  font=("Arial", 8), anchor="w", fill="red")
+            y_max = max(max_value * 1.2, 3.0)
+            y_scale = chart_height / y_max
+            x_scale = chart_width / window
+
+            # Подписи шкалы и линии порогов меняются только при смене масштаба или порогов
+            scale_key = (y_max, self.config['warning_threshold'], self.config['danger_threshold'])
+            if scale_key != self.chart_scale_key:
+                self.chart_scale_key = scale_key
+                self.draw_chart_scale(width, height, padding, y_max, y_scale)
+
+            # Подписи оси времени
+            title = next(title for title, seconds in self.CHART_WINDOWS if seconds == window)
+            self.chart_canvas.itemconfig(self.chart_items['x_title'], text=f"Время (последние {title})")
+            time_format = '%H:%M:%S' if window <= 300 else '%H:%M'
+            for i, label in enumerate(self.chart_items['time_labels']):
+                label_time = datetime.fromtimestamp(since + i * window / 4)
+                self.chart_canvas.itemconfig(label, text=label_time.strftime(time_format))
+
+            # Перемещаем линии каждого датчика
+            for sensor_id, points in series.items():
+                if len(points) < 2:
+                    continue
+
+                items = self.chart_sensor_items(sensor_id)
+                coords = []
+                for timestamp, value in points:
+                    coords.append(padding + (timestamp - since) * x_scale)
+                    coords.append(height - padding - (value * y_scale))
+
+                last_x, last_y = coords[-2], coords[-1]
+                self.chart_canvas.coords(items['line'], *coords)
+                self.chart_canvas.coords(items['point'], last_x - 3, last_y - 3, last_x + 3, last_y + 3)
+                last = self.service.history.last(sensor_id)
+                if last is not None:
+                    self.chart_canvas.itemconfig(items['legend_text'], text=f"{sensor_id}: {last[1]:.2f} мкЗв/ч")
+                if sensor_id not in self.chart_items['shown']:
+                    self.chart_items['shown'].add(sensor_id)
+                    for item in items.values():
+                        self.chart_canvas.itemconfig(item, state="normal")
 
         except Exception as e:
             self.logger.error(f"Ошибка обновления графика: {e}")
 
+    def chart_series(self, sensor_id, since, step):
+        """Прореженный ряд датчика за окно: история из БД и измерения в памяти"""
+        # Буферы в памяти читаются без копирования, пока удерживается блокировка
+        with self.service.history.view(sensor_id, since) as (segments, first_time):
+            times = [segment[0] for segment in segments]
+            values = [segment[1] for segment in segments]
+
+            # Часть окна, не покрытая памятью (минута - разрешение агрегатов в БД)
+            covered_from = first_time if first_time is not None else time.time()
+            if covered_from - since > 60:
+                loaded = self.chart_db_range
+                if loaded is None or loaded[0] > since + 60 or loaded[1] < covered_from - 60:
+                    self.load_chart_history(since, covered_from)
+
+                db_times, db_values = self.chart_db_series.get(sensor_id, ((), ()))
+                start = bisect_left(db_times, since)
+                stop = bisect_left(db_times, covered_from)
+                if start < stop:
+                    times.insert(0, db_times[start:stop])
+                    values.insert(0, db_values[start:stop])
+
+            return downsample_minmax(chain(*times), chain(*values), step)
+
+    def load_chart_history(self, start, end):
+        """Фоновая загрузка поминутных минимумов и максимумов за [start, end) из БД"""
+        if self.chart_db_loading:
+            return
+        self.chart_db_loading = True
+
+        def loader():
+            series = {}
+            try:
+                with self.service.db.reader() as conn:
+                    rows = self.service.rollups.series(
+                        conn, 'minute',
+                        datetime.fromtimestamp(start).strftime('%Y-%m-%d %H:%M:00'),
+                        datetime.fromtimestamp(end).isoformat(sep=' '))
+                # Минимум и максимум минуты размещаются внутри интервала
+                for sensor_id, bucket, level_min, level_max in rows:
+                    minute = datetime.strptime(bucket, '%Y-%m-%d %H:%M:%S').timestamp()
+                    times, values = series.setdefault(sensor_id, ([], []))
+                    times.extend((minute + 15, minute + 45))
+                    values.extend((level_min, level_max))
+            except Exception as e:
+                self.logger.error(f"Ошибка загрузки истории графика: {e}")
+            self.ui_updates.post('chart_history', self.on_chart_history_loaded, start, end, series)
+
+        threading.Thread(target=loader, daemon=True).start()
+
+    def on_chart_history_loaded(self, start, end, series):
+        """Применение загруженной истории графика"""
+        self.chart_db_series = series
+        self.chart_db_range = (start, end)
+        self.chart_db_loading = False
+        self.update_chart()
+
     def create_sensors_panel(self):
         """Создание панели датчиков"""
         main_frame = ttk.Frame(self.sensors_tab)
@@ -520,6 +4670,13 @@ class RadiationMonitoringSystem:
 
         self.data_tree.pack(fill="both", expand=True)
 
+        # Строки таблицы от новых к старым; далее добавляются только новые измерения
+        self.measurement_log_items = deque()
+        self.measurement_log_last = ''
+
+        ttk.Button(log_frame, text="История измерений...",
+                   command=self.open_history_browser).pack(anchor="e", pady=(5, 0))
+
         # Загрузка последних записей
         self.load_recent_measurements()
 
@@ -555,7 +4712,7 @@ class RadiationMonitoringSystem:
         self.contacts_text = tk.Text(contacts_frame, height=4, width=60)
         self.contacts_text.pack(fill="x", padx=5, pady=5)
 
-        for contact in self.emergency_contacts:
+        for contact in self.service.emergency_contacts:
             self.contacts_text.insert("end", contact + "\n")
 
         # Журнал оповещений
@@ -572,6 +4729,11 @@ class RadiationMonitoringSystem:
 
         self.alerts_tree.pack(fill="both", expand=True)
 
+        # Строки таблицы от новых к старым (идентификатор строки - id оповещения)
+        self.alert_log_items = deque()
+        self.alert_log_last_id = 0
+        self.update_alerts_tree()
+
         # Кнопки управления
         button_frame = ttk.Frame(main_frame)
         button_frame.pack(fill="x", pady=10)
@@ -608,7 +4770,9 @@ class RadiationMonitoringSystem:
             ("Месячный отчет (CSV)", self.generate_monthly_report),
             ("Статистический отчет", self.generate_statistical_report),
             ("Отчет по событиям", self.generate_events_report),
-            ("Экспорт всех данных", self.export_all_data)
+            ("Экспорт всех данных", self.export_all_data),
+            ("Экспорт (Parquet/Arrow)", self.export_columnar),
+            ("Архивировать старые данные", self.archive_old_data)
         ]
 
         for i, (text, command) in enumerate(report_types):
@@ -672,7 +4836,9 @@ class RadiationMonitoringSystem:
             ("Порог опасности (мкЗв/ч):", "danger_threshold", "2.5"),
             ("SMTP сервер:", "smtp_server", "smtp.company.com"),
             ("Порт SMTP:", "smtp_port", "587"),
-            ("Email для уведомлений:", "notification_email", "safety@company.com")
+            ("Email для уведомлений:", "notification_email", "safety@company.com"),
+            ("Хранить измерения (сут.):", "raw_retention_days", "0"),
+            ("Сжимать измерения старше (сут.):", "compress_after_days", "0")
         ]
 
         self.settings_entries = {}
@@ -723,107 +4889,18 @@ class RadiationMonitoringSystem:
         except Exception as e:
             messagebox.showerror("Ошибка", f"Не удалось открыть папку: {e}")
 
-    def start_data_collection(self):
-        """Запуск сбора данных"""
-        self.data_collection_active = True
-        self.collection_thread = threading.Thread(target=self.data_collection_worker, daemon=True)
-        self.collection_thread.start()
-        self.logger.info("Система сбора данных запущена")
-
-    def data_collection_worker(self):
-        """Рабочий поток для сбора данных"""
-        while self.data_collection_active:
-            try:
-                self.collect_sensor_data()
-                time.sleep(self.config['polling_interval'])
-            except Exception as e:
-                self.logger.error(f"Ошибка в потоке сбора данных: {e}")
-                time.sleep(5)  # Пауза при ошибке
-
-    def collect_sensor_data(self):
-        """Сбор данных с датчиков"""
-        sensors = list(self.sensor_configs.keys())
-        locations = [self.sensor_configs[sensor_id]["location"] for sensor_id in sensors]
-
-        for i, sensor_id in enumerate(sensors):
-            try:
-                # Имитация чтения данных с датчика
-                base_value = 0.1 + (i * 0.3)
-                variation = random.uniform(-0.1, 0.1)
-                radiation = max(0.01, base_value + variation)
-
-                # Имитация случайных аномалий (10% вероятность)
-                if random.random() < 0.1:
-                    radiation *= random.uniform(1.5, 4.0)
-
-                # Определение статуса
-                status = self.determine_status(radiation)
-
-                # Сохранение данных
-                self.store_measurement(sensor_id, radiation, status, locations[i])
-
-                # Обновление интерфейса
-                self.root.after(0, lambda sid=sensor_id, r=radiation, s=status:
-                self.update_sensor_display(sid, r, s))
-
-                # Проверка пороговых значения
-                self.check_thresholds(sensor_id, radiation, status)
-
-            except Exception as e:
-                self.logger.error(f"Ошибка сбора данных с датчика {sensor_id}: {e}")
-
-        # Обновление статистики
-        self.root.after(0, self.update_statistics)
-        self.root.after(0, self.update_chart)
-
-    def determine_status(self, radiation_level):
-        """Определение статуса по уровню радиации"""
-        if radiation_level >= self.config['danger_threshold']:
-            return "ОПАСНО"
-        elif radiation_level >= self.config['warning_threshold']:
-            return "ПРЕДУПРЕЖДЕНИЕ"
-        else:
-            return "НОРМА"
-
-    def store_measurement(self, sensor_id, radiation_level, status, location):
-        """Сохранение измерения в базу данных"""
-        try:
-            cursor = self.conn.cursor()
-            timestamp = datetime.now()
-
-            cursor.execute('''
-                INSERT INTO measurements (sensor_id, radiation_level, timestamp, status)
-                VALUES (?, ?, ?, ?)
-            ''', (sensor_id, radiation_level, timestamp, status))
-
-            self.conn.commit()
-
-            # Добавление в исторические данные для отображения
-            measurement_data = {
-                'timestamp': timestamp,
-                'sensor_id': sensor_id,
-                'value': radiation_level,
-                'status': status,
-                'location': location
-            }
-            self.historical_data.append(measurement_data)
-
-            # Ограничение размера исторических данных в памяти
-            if len(self.historical_data) > 1000:
-                self.historical_data.pop(0)
-
-            # Обновление данных для графика
-            if sensor_id not in self.chart_data:
-                self.chart_data[sensor_id] = deque(maxlen=50)
-            self.chart_data[sensor_id].append(radiation_level)
-
-            self.logger.debug(f"Сохранено измерение: {sensor_id} - {radiation_level:.2f} мкЗв/ч")
-
-        except sqlite3.Error as e:
-            self.logger.error(f"Ошибка сохранения в БД: {e}")
+    def pump_ui_updates(self):
+        """Периодическое применение обновлений интерфейса из шины (в потоке Tk)"""
+        remaining = self.ui_updates.drain(self.config['ui_frame_budget_ms'] / 1000)
+        # При неисчерпанной очереди следующий проход сразу после обработки событий ввода
+        self.root.after(1 if remaining else self.config['ui_frame_ms'], self.pump_ui_updates)
 
     def update_sensor_display(self, sensor_id, radiation, status):
         """Обновление отображения данных датчика"""
+        if self.sensor_tile_map is not None:
+            self.sensor_tile_map.update(sensor_id, radiation, status)
+            return
+
         if sensor_id in self.sensor_cards:
             card_data = self.sensor_cards[sensor_id]
 
@@ -839,113 +4916,34 @@ class RadiationMonitoringSystem:
             card_data["value_label"].config(text=f"{radiation:.2f} мкЗв/ч")
             card_data["status_label"].config(text=status, foreground=color)
             card_data["level_indicator"].config(background=color)
+            stats = self.service.sensor_statistics.snapshot(sensor_id)
+            if stats:
+                card_data["stats_label"].config(
+                    text=f"Ср. {stats['ewma']:.2f} ± {stats['ewm_stddev']:.2f}, "
+                         f"мин/макс за час {stats['min']:.2f}/{stats['max']:.2f}, p95 {stats['p95']:.2f}")
             card_data["footer_label"].config(text=f"Обновлено: {datetime.now().strftime('%H:%M:%S')}")
 
-    def check_thresholds(self, sensor_id, radiation_level, status):
-        """Проверка превышения пороговых значений"""
-        try:
-            if status in ["ПРЕДУПРЕЖДЕНИЕ", "ОПАСНО"]:
-                cursor = self.conn.cursor()
-                timestamp = datetime.now()
-
-                # Определение типа оповещения
-                if status == "ОПАСНО":
-                    alert_type = "CRITICAL"
-                    threshold = self.config['danger_threshold']
-                    self.send_emergency_notification(sensor_id, radiation_level, threshold)
-                else:
-                    alert_type = "WARNING"
-                    threshold = self.config['warning_threshold']
-                    self.send_warning_notification(sensor_id, radiation_level, threshold)
-
-                # Запись в журнал оповещений
-                cursor.execute('''
-                    INSERT INTO alerts (sensor_id, alert_type, threshold_value, actual_value, timestamp)
-                    VALUES (?, ?, ?, ?, ?)
-                ''', (sensor_id, alert_type, threshold, radiation_level, timestamp))
-
-                self.conn.commit()
-
-                # Обновление интерфейса
-                self.root.after(0, self.update_alerts_tree)
-
-                self.logger.warning(f"Превышение порога: {sensor_id} - {radiation_level:.2f} мкЗв/ч")
-
-        except Exception as e:
-            self.logger.error(f"Ошибка проверки порогов: {e}")
-
-    def send_emergency_notification(self, sensor_id, radiation_level, threshold):
-        """Отправка аварийного уведомления"""
-        subject = f"🚨 КРИТИЧЕСКОЕ ПРЕВЫШЕНИЕ! Датчик {sensor_id}"
-        message = f"""
-        ВНИМАНИЕ! КРИТИЧЕСКОЕ ПРЕВЫШЕНИЕ УРОВНЯ РАДИАЦИИ!
-
-        Детали:
-        - Датчик: {sensor_id}
-        - Местоположение: {self.sensor_configs[sensor_id]['location']}
-        - Текущий уровень: {radiation_level:.2f} мкЗв/ч
-        - Пороговое значение: {threshold} мкЗв/ч
-        - Время: {datetime.now().strftime('%d.%m.%Y %H:%M:%S')}
-
-        НЕОБХОДИМО НЕМЕДЛЕННО ПРИНЯТЬ МЕРЫ!
-        """
-
-        self.send_email_notification(subject, message)
-        self.logger.critical(f"Отправлено аварийное уведомление: {sensor_id}")
-
-    def send_warning_notification(self, sensor_id, radiation_level, threshold):
-        """Отправка предупреждения"""
-        subject = f"⚠️ ПРЕДУПРЕЖДЕНИЕ: Превышение уровня радиации - {sensor_id}"
-        message = f"""
-        ПРЕДУПРЕЖДЕНИЕ: Превышение уровня радиации
-
-        Детали:
-        - Датчик: {sensor_id}
-        - Местоположение: {self.sensor_configs[sensor_id]['location']}
-        - Текущий уровень: {radiation_level:.2f} мкЗв/ч
-        - Пороговое значение: {threshold} мкЗв/ч
-        - Время: {datetime.now().strftime('%d.%m.%Y %H:%M:%S')}
-
-        Рекомендуется проверить оборудование и принять меры.
-        """
-
-        self.send_email_notification(subject, message)
-        self.logger.warning(f"Отправлено предупреждение: {sensor_id}")
-
-    def send_email_notification(self, subject, message):
-        """Отправка email уведомления"""
-        try:
-            # В реальной системе здесь будет код для отправки email
-            # Для демонстрации просто логируем
-            self.logger.info(f"EMAIL УВЕДОМЛЕНИЕ: {subject}")
-            self.logger.info(f"Сообщение: {message.strip()}")
-
-        except Exception as e:
-            self.logger.error(f"Ошибка отправки email: {e}")
-
     def send_test_notification(self):
         """Отправка тестового уведомления"""
-        self.send_email_notification(
-            "Тестовое уведомление - Система контроля радиации",
-            "Это тестовое уведомление от системы контроля уровня радиации.\n\nСистема работает нормально."
-        )
-        messagebox.showinfo("Тест", "Тестовое уведомление отправлено!")
+        def task(progress):
+            self.service.send_email_notification(
+                "Тестовое уведомление - Система контроля радиации",
+                "Это тестовое уведомление от системы контроля уровня радиации.\n\nСистема работает нормально."
+            )
+
+        # Соединение с SMTP-сервером не блокирует интерфейс
+        self.run_background_task("Отправка тестового уведомления", task,
+                                 lambda result: messagebox.showinfo("Тест", "Тестовое уведомление отправлено!"))
 
     # Методы для работы с отчетами
     def generate_daily_report(self):
         """Генерация суточного отчета"""
         try:
-            cursor = self.conn.cursor()
             today = datetime.now().date()
 
-            cursor.execute('''
-                SELECT sensor_id, AVG(radiation_level), MAX(radiation_level), MIN(radiation_level), COUNT(*)
-                FROM measurements 
-                WHERE DATE(timestamp) = ?
-                GROUP BY sensor_id
-            ''', (today,))
-
-            results = cursor.fetchall()
+            with self.service.db.reader() as conn:
+                results = self.service.rollups.sensor_summary(conn, 'day', *day_range(today))
+                percentiles, _ = self.service.rollups.quantiles(conn, 'day', *day_range(today))
 
             filename = os.path.join(self.config['reports_folder'],
                                     f"radiation_daily_report_{today.strftime('%Y%m%d')}.csv")
@@ -954,7 +4952,8 @@ class RadiationMonitoringSystem:
                 writer = csv.writer(csvfile)
                 writer.writerow(['Суточный отчет по уровню радиации', f"Дата: {today}"])
                 writer.writerow([])
-                writer.writerow(['Датчик', 'Средний уровень', 'Максимум', 'Минимум', 'Измерений'])
+                writer.writerow(['Датчик', 'Средний уровень', 'Максимум', 'Минимум', 'Измерений',
+                                 'Медиана', '95-й процентиль', '99-й процентиль'])
 
                 for row in results:
                     writer.writerow([
@@ -962,7 +4961,8 @@ class RadiationMonitoringSystem:
                         f"{row[1]:.2f} мкЗв/ч",
                         f"{row[2]:.2f} мкЗв/ч",
                         f"{row[3]:.2f} мкЗв/ч",
-                        row[4]
+                        row[4],
+                        *self.format_percentiles(percentiles.get(row[0]))
                     ])
 
             messagebox.showinfo("Успех", f"Суточный отчет создан:\n{filename}")
@@ -978,15 +4978,9 @@ class RadiationMonitoringSystem:
             end_date = datetime.now().date()
             start_date = end_date - timedelta(days=7)
 
-            cursor = self.conn.cursor()
-            cursor.execute('''
-                SELECT sensor_id, AVG(radiation_level), MAX(radiation_level), MIN(radiation_level), COUNT(*)
-                FROM measurements 
-                WHERE DATE(timestamp) BETWEEN ? AND ?
-                GROUP BY sensor_id
-            ''', (start_date, end_date))
-
-            results = cursor.fetchall()
+            with self.service.db.reader() as conn:
+                results = self.service.rollups.sensor_summary(conn, 'day', *day_range(start_date, end_date))
+                percentiles, _ = self.service.rollups.quantiles(conn, 'day', *day_range(start_date, end_date))
 
             filename = os.path.join(self.config['reports_folder'],
                                     f"radiation_weekly_report_{start_date.strftime('%Y%m%d')}_to_{end_date.strftime('%Y%m%d')}.csv")
@@ -996,7 +4990,8 @@ class RadiationMonitoringSystem:
                 writer.writerow(['Недельный отчет по уровню радиации'])
                 writer.writerow([f"Период: {start_date} - {end_date}"])
                 writer.writerow([])
-                writer.writerow(['Датчик', 'Средний уровень', 'Максимум', 'Минимум', 'Измерений'])
+                writer.writerow(['Датчик', 'Средний уровень', 'Максимум', 'Минимум', 'Измерений',
+                                 'Медиана', '95-й процентиль', '99-й процентиль'])
 
                 for row in results:
                     writer.writerow([
@@ -1004,7 +4999,8 @@ class RadiationMonitoringSystem:
                         f"{row[1]:.2f} мкЗв/ч",
                         f"{row[2]:.2f} мкЗв/ч",
                         f"{row[3]:.2f} мкЗв/ч",
-                        row[4]
+                        row[4],
+                        *self.format_percentiles(percentiles.get(row[0]))
                     ])
 
             messagebox.showinfo("Успех", f"Недельный отчет создан:\n{filename}")
@@ -1018,15 +5014,9 @@ class RadiationMonitoringSystem:
             end_date = datetime.now().date()
             start_date = end_date - timedelta(days=30)
 
-            cursor = self.conn.cursor()
-            cursor.execute('''
-                SELECT sensor_id, AVG(radiation_level), MAX(radiation_level), MIN(radiation_level), COUNT(*)
-                FROM measurements 
-                WHERE DATE(timestamp) BETWEEN ? AND ?
-                GROUP BY sensor_id
-            ''', (start_date, end_date))
-
-            results = cursor.fetchall()
+            with self.service.db.reader() as conn:
+                results = self.service.rollups.sensor_summary(conn, 'day', *day_range(start_date, end_date))
+                percentiles, _ = self.service.rollups.quantiles(conn, 'day', *day_range(start_date, end_date))
 
             filename = os.path.join(self.config['reports_folder'],
                                     f"radiation_monthly_report_{start_date.strftime('%Y%m')}.csv")
@@ -1036,7 +5026,8 @@ class RadiationMonitoringSystem:
                 writer.writerow(['Месячный отчет по уровню радиации'])
                 writer.writerow([f"Период: {start_date} - {end_date}"])
                 writer.writerow([])
-                writer.writerow(['Датчик', 'Средний уровень', 'Максимум', 'Минимум', 'Измерений'])
+                writer.writerow(['Датчик', 'Средний уровень', 'Максимум', 'Минимум', 'Измерений',
+                                 'Медиана', '95-й процентиль', '99-й процентиль'])
 
                 for row in results:
                     writer.writerow([
@@ -1044,7 +5035,8 @@ class RadiationMonitoringSystem:
                         f"{row[1]:.2f} мкЗв/ч",
                         f"{row[2]:.2f} мкЗв/ч",
                         f"{row[3]:.2f} мкЗв/ч",
-                        row[4]
+                        row[4],
+                        *self.format_percentiles(percentiles.get(row[0]))
                     ])
 
             messagebox.showinfo("Успех", f"Месячный отчет создан:\n{filename}")
@@ -1052,23 +5044,20 @@ class RadiationMonitoringSystem:
         except Exception as e:
             messagebox.showerror("Ошибка", f"Не удалось создать отчет: {e}")
 
+    @staticmethod
+    def format_percentiles(values):
+        """Квантили для отчета (по скетчам агрегатов, погрешность до 1 %)"""
+        if not values or values[0] is None:
+            return ["н/д"] * 3
+        return [f"{value:.2f} мкЗв/ч" for value in values]
+
     def generate_statistical_report(self):
         """Генерация статистического отчета"""
         try:
-            cursor = self.conn.cursor()
-
-            # Статистика за все время
-            cursor.execute('''
-                SELECT 
-                    COUNT(*) as total_measurements,
-                    AVG(radiation_level) as avg_level,
-                    MAX(radiation_level) as max_level,
-                    MIN(radiation_level) as min_level,
-                    COUNT(CASE WHEN status != 'НОРМА' THEN 1 END) as alerts_count
-                FROM measurements
-            ''')
-
-            stats = cursor.fetchone()
+            # Статистика за все время (по суточным агрегатам)
+            with self.service.db.reader() as conn:
+                stats = self.service.rollups.total_summary(conn, 'day')
+                _, percentiles = self.service.rollups.quantiles(conn, 'day')
 
             filename = os.path.join(self.config['reports_folder'],
                                     f"radiation_statistical_report_{datetime.now().strftime('%Y%m%d_%H%M')}.csv")
@@ -1083,9 +5072,23 @@ class RadiationMonitoringSystem:
                 writer.writerow(['Средний уровень', f"{stats[1]:.3f} мкЗв/ч"])
                 writer.writerow(['Максимальный уровень', f"{stats[2]:.2f} мкЗв/ч"])
                 writer.writerow(['Минимальный уровень', f"{stats[3]:.2f} мкЗв/ч"])
+                for name, value in zip(('Медиана', '95-й процентиль', '99-й процентиль'),
+                                       self.format_percentiles(percentiles)):
+                    writer.writerow([name, value])
                 writer.writerow(['Количество предупреждений', stats[4]])
                 writer.writerow(['Процент аномалий', f"{(stats[4] / stats[0] * 100 if stats[0] > 0 else 0):.1f}%"])
 
+                # Текущая статистика датчиков с момента запуска (из памяти, без запросов к БД)
+                writer.writerow([])
+                writer.writerow(['Статистика датчиков с момента запуска'])
+                writer.writerow(['Датчик', 'Измерений', 'Среднее', 'Ст. отклонение', 'Базовый уровень (EWMA)',
+                                 'Медиана', '95-й процентиль', '99-й процентиль',
+                                 'Минимум за окно', 'Максимум за окно'])
+                for sensor_id, sensor_stats in sorted(self.service.sensor_statistics.snapshots().items()):
+                    writer.writerow([sensor_id, sensor_stats['count']] + [
+                        f"{sensor_stats[key]:.3f}"
+                        for key in ('mean', 'stddev', 'ewma', 'p50', 'p95', 'p99', 'min', 'max')])
+
             messagebox.showinfo("Успех", f"Статистический отчет создан:\n{filename}")
 
         except Exception as e:
@@ -1094,14 +5097,15 @@ class RadiationMonitoringSystem:
     def generate_events_report(self):
         """Генерация отчета по событиям"""
         try:
-            cursor = self.conn.cursor()
-            cursor.execute('''
-                SELECT timestamp, sensor_id, alert_type, actual_value, threshold_value
-                FROM alerts
-                ORDER BY timestamp DESC
-            ''')
+            with self.service.db.reader() as conn:
+                cursor = conn.cursor()
+                cursor.execute('''
+                    SELECT timestamp, sensor_id, alert_type, actual_value, threshold_value, event
+                    FROM alerts
+                    ORDER BY timestamp DESC
+                ''')
 
-            events = cursor.fetchall()
+                events = cursor.fetchall()
 
             filename = os.path.join(self.config['reports_folder'],
                                     f"radiation_events_report_{datetime.now().strftime('%Y%m%d_%H%M')}.csv")
@@ -1111,7 +5115,8 @@ class RadiationMonitoringSystem:
                 writer.writerow(['Отчет по событиям системы контроля радиации'])
                 writer.writerow([f"Сформирован: {datetime.now().strftime('%d.%m.%Y %H:%M:%S')}"])
                 writer.writerow([])
-                writer.writerow(['Время', 'Датчик', 'Тип события', 'Фактический уровень', 'Пороговый уровень'])
+                writer.writerow(['Время', 'Датчик', 'Тип события', 'Фактический уровень', 'Пороговый уровень',
+                                 'Изменение состояния'])
 
                 for event in events:
                     writer.writerow([
@@ -1119,7 +5124,8 @@ class RadiationMonitoringSystem:
                         event[1],
                         event[2],
                         f"{event[3]:.2f} мкЗв/ч",
-                        f"{event[4]} мкЗв/ч"
+                        f"{event[4]} мкЗв/ч",
+                        event[5]
                     ])
 
             messagebox.showinfo("Успех", f"Отчет по событиям создан:\n{filename}")
@@ -1128,61 +5134,163 @@ class RadiationMonitoringSystem:
             messagebox.showerror("Ошибка", f"Не удалось создать отчет: {e}")
 
     def export_all_data(self):
-        """Экспорт всех данных"""
-        try:
-            cursor = self.conn.cursor()
-            cursor.execute('''
-                SELECT m.timestamp, s.sensor_id, s.location, m.radiation_level, m.status
-                FROM measurements m
-                JOIN sensors s ON m.sensor_id = s.sensor_id
-                ORDER BY m.timestamp
-            ''')
-
-            data = cursor.fetchall()
-
-            filename = os.path.join(self.config['reports_folder'],
-                                    f"radiation_export_{datetime.now().strftime('%Y%m%d_%H%M')}.csv")
+        """Экспорт данных (диалог с фильтрами, выполнение в фоновом потоке)"""
+        dialog = tk.Toplevel(self.root)
+        dialog.title("Экспорт данных")
+        dialog.geometry("450x300")
+
+        form = ttk.Frame(dialog, padding=10)
+        form.pack(fill="both", expand=True)
+
+        ttk.Label(form, text="С даты (ГГГГ-ММ-ДД):").grid(row=0, column=0, sticky="w", pady=2)
+        start_var = tk.StringVar()
+        ttk.Entry(form, textvariable=start_var).grid(row=0, column=1, sticky="ew", pady=2)
+
+        ttk.Label(form, text="По дату (ГГГГ-ММ-ДД):").grid(row=1, column=0, sticky="w", pady=2)
+        end_var = tk.StringVar()
+        ttk.Entry(form, textvariable=end_var).grid(row=1, column=1, sticky="ew", pady=2)
+
+        ttk.Label(form, text="Датчики (через запятую):").grid(row=2, column=0, sticky="w", pady=2)
+        sensors_var = tk.StringVar()
+        ttk.Entry(form, textvariable=sensors_var).grid(row=2, column=1, sticky="ew", pady=2)
+
+        compress_var = tk.BooleanVar(value=False)
+        ttk.Checkbutton(form, text="Сжать (gzip)", variable=compress_var).grid(row=3, column=0, columnspan=2,
+                                                                              sticky="w", pady=2)
+
+        progress_bar = ttk.Progressbar(form, mode="determinate", maximum=100)
+        progress_bar.grid(row=4, column=0, columnspan=2, sticky="ew", pady=10)
+        progress_label = ttk.Label(form, text="Записей: 0")
+        progress_label.grid(row=5, column=0, columnspan=2, sticky="w")
+        form.columnconfigure(1, weight=1)
+
+        cancel_event = threading.Event()
+        button_frame = ttk.Frame(form)
+        button_frame.grid(row=6, column=0, columnspan=2, pady=10)
+
+        def on_progress(written, total):
+            def apply():
+                progress_label.config(text=f"Записей: {written}")
+                if total:
+                    progress_bar.config(value=min(100, written * 100 / total))
+            self.ui_updates.post(('export_progress', str(dialog)), apply)
+
+        def on_done(filename, written, error):
+            if dialog.winfo_exists():
+                dialog.destroy()
+            if error:
+                messagebox.showerror("Ошибка", f"Не удалось экспортировать данные: {error}")
+            elif written is None:
+                messagebox.showinfo("Экспорт", "Экспорт отменен")
+            else:
+                messagebox.showinfo("Успех", f"Данные экспортированы:\n{filename}\nЗаписей: {written}")
+                self.logger.info(f"Экспорт данных: {filename}, записей: {written}")
 
-            with open(filename, 'w', newline='', encoding='utf-8') as csvfile:
-                writer = csv.writer(csvfile)
-                writer.writerow(['Время', 'Датчик', 'Участок', 'Уровень радиации', 'Статус'])
+        def worker(filename, start, end, sensor_ids, compress):
+            written, error = None, None
+            try:
+                written = self.service.exporter.export(filename, start, end, sensor_ids, compress,
+                                               on_progress, cancel_event)
+            except Exception as e:
+                error = e
+                self.logger.error(f"Ошибка экспорта данных: {e}")
+            # Ключи по окну диалога: одновременные экспорты не заменяют результаты друг друга
+            self.ui_updates.post(('export_done', str(dialog)), on_done, filename, written, error)
 
-                for row in data:
-                    writer.writerow([
-                        row[0],
-                        row[1],
-                        row[2],
-                        f"{row[3]:.2f} мкЗв/ч",
-                        row[4]
-                    ])
+        def start_export():
+            try:
+                start = end = None
+                if start_var.get().strip():
+                    start = day_range(datetime.strptime(start_var.get().strip(), '%Y-%m-%d').date())[0]
+                if end_var.get().strip():
+                    end = day_range(datetime.strptime(end_var.get().strip(), '%Y-%m-%d').date())[1]
+            except ValueError:
+                messagebox.showerror("Ошибка", "Даты должны быть в формате ГГГГ-ММ-ДД")
+                return
 
-            messagebox.showinfo("Успех", f"Данные экспортированы:\n{filename}\nЗаписей: {len(data)}")
+            sensor_ids = [sid.strip() for sid in sensors_var.get().split(',') if sid.strip()]
+            compress = compress_var.get()
+            filename = os.path.join(self.config['reports_folder'],
+                                    f"radiation_export_{datetime.now().strftime('%Y%m%d_%H%M')}.csv"
+                                    + (".gz" if compress else ""))
+
+            export_button.config(state="disabled")
+            threading.Thread(target=worker, args=(filename, start, end, sensor_ids, compress),
+                             daemon=True).start()
+
+        def cancel_export():
+            cancel_event.set()
+            # Если экспорт не запущен, просто закрываем окно
+            if str(export_button.cget("state")) != "disabled":
+                dialog.destroy()
+
+        export_button = ttk.Button(button_frame, text="Экспорт", command=start_export)
+        export_button.pack(side="left", padx=5)
+        ttk.Button(button_frame, text="Отмена", command=cancel_export).pack(side="left", padx=5)
+        dialog.protocol("WM_DELETE_WINDOW", cancel_export)
+
+    def export_columnar(self):
+        """Экспорт всех данных в колоночном формате (в фоновом потоке)"""
+        if not ColumnarArchive.available():
+            messagebox.showerror("Ошибка", "Для экспорта в Parquet/Arrow установите пакет pyarrow")
+            return
+
+        fmt = self.config['columnar_format']
+        folder = os.path.join(self.config['reports_folder'],
+                              f"radiation_export_{datetime.now().strftime('%Y%m%d_%H%M')}_{fmt}")
+
+        def worker():
+            try:
+                written = self.service.archive.export(folder, fmt)
+                self.logger.info(f"Колоночный экспорт: {folder}, записей: {written}")
+                self.root.after(0, lambda: messagebox.showinfo(
+                    "Успех", f"Данные экспортированы:\n{folder}\nЗаписей: {written}"))
+            except Exception as e:
+                self.logger.error(f"Ошибка колоночного экспорта: {e}")
+                self.root.after(0, lambda error=e: messagebox.showerror(
+                    "Ошибка", f"Не удалось экспортировать данные: {error}"))
+
+        threading.Thread(target=worker, daemon=True).start()
+
+    def archive_old_data(self):
+        """Перенос старых измерений в архив (в фоновом потоке)"""
+        if not ColumnarArchive.available():
+            messagebox.showerror("Ошибка", "Для архивирования установите пакет pyarrow")
+            return
+
+        # При ограниченном сроке хранения более старых измерений в БД уже нет
+        archive_days = self.config['archive_after_days']
+        if self.config['raw_retention_days'] > 0:
+            archive_days = min(archive_days, self.config['raw_retention_days'])
+        before_day = datetime.now().date() - timedelta(days=archive_days)
+        if not messagebox.askyesno("Архивирование",
+                                   f"Перенести измерения до {before_day} в архив\n"
+                                   f"{self.config['archive_folder']}?"):
+            return
+
+        def worker():
+            try:
+                archived = self.service.archive.archive(self.config['archive_folder'], before_day,
+                                                self.config['columnar_format'])
+                self.service.reseed_statistics()
+                self.root.after(0, lambda: messagebox.showinfo(
+                    "Архивирование", f"Перенесено в архив измерений: {archived}"))
+            except Exception as e:
+                self.logger.error(f"Ошибка архивирования: {e}")
+                self.root.after(0, lambda error=e: messagebox.showerror(
+                    "Ошибка", f"Не удалось архивировать данные: {error}"))
 
-        except Exception as e:
-            messagebox.showerror("Ошибка", f"Не удалось экспортировать данные: {e}")
+        threading.Thread(target=worker, daemon=True).start()
 
     def update_statistics(self):
         """Обновление статистики на панели"""
         try:
-            cursor = self.conn.cursor()
-
-            # Общее количество измерений
-            cursor.execute('SELECT COUNT(*) FROM measurements')
-            total_measurements = cursor.fetchone()[0]
-
-            # Измерения за сегодня
-            today = datetime.now().date()
-            cursor.execute('SELECT COUNT(*) FROM measurements WHERE DATE(timestamp) = ?', (today,))
-            today_measurements = cursor.fetchone()[0]
-
-            # Количество превышений
-            cursor.execute('SELECT COUNT(*) FROM measurements WHERE status != "НОРМА"')
-            alerts_count = cursor.fetchone()[0]
+            stats = self.service.statistics.snapshot()
 
             # Обновление меток
-            self.stats_labels["Всего измерений:"].config(text=str(total_measurements))
-            self.stats_labels["За сегодня:"].config(text=str(today_measurements))
-            self.stats_labels["Превышений порога:"].config(text=str(alerts_count))
+            self.stats_labels["Всего измерений:"].config(text=str(stats['total']))
+            self.stats_labels["За сегодня:"].config(text=str(stats['today']))
+            self.stats_labels["Превышений порога:"].config(text=str(stats['exceeded']))
             self.stats_labels["Последнее обновление:"].config(text=datetime.now().strftime('%H:%M:%S'))
 
         except Exception as e:
@@ -1191,26 +5299,18 @@ class RadiationMonitoringSystem:
     def update_db_statistics(self):
         """Обновление статистики БД"""
         try:
-            cursor = self.conn.cursor()
-
-            # Общее количество записей
-            cursor.execute('SELECT COUNT(*) FROM measurements')
-            total_records = cursor.fetchone()[0]
+            stats = self.service.statistics.snapshot()
 
             # Размер БД (приблизительно)
             db_size = 0
-            if os.path.exists('radiation_monitoring.db'):
-                db_size = os.path.getsize('radiation_monitoring.db') / (1024 * 1024)  # в МБ
+            if os.path.exists(self.service.db_path):
+                db_size = os.path.getsize(self.service.db_path) / (1024 * 1024)  # в МБ
 
-            # Первая и последняя записи
-            cursor.execute('SELECT MIN(timestamp), MAX(timestamp) FROM measurements')
-            time_range = cursor.fetchone()
-
-            first_record = time_range[0] if time_range[0] else "--"
-            last_record = time_range[1] if time_range[1] else "--"
+            first_record = stats['first_timestamp'] or "--"
+            last_record = stats['last_timestamp'] or "--"
 
             # Обновление меток
-            self.db_stats_labels["Всего записей:"].config(text=str(total_records))
+            self.db_stats_labels["Всего записей:"].config(text=str(stats['total']))
             self.db_stats_labels["Размер БД:"].config(text=f"{db_size:.2f} МБ")
             self.db_stats_labels["Первая запись:"].config(text=str(first_record)[:19])
             self.db_stats_labels["Последняя запись:"].config(text=str(last_record)[:19])
@@ -1222,55 +5322,263 @@ class RadiationMonitoringSystem:
         """Загрузка последних измерений в таблицу"""
         try:
             # Очистка таблицы
-            for item in self.data_tree.get_children():
-                self.data_tree.delete(item)
-
-            cursor = self.conn.cursor()
-            cursor.execute('''
-                SELECT m.timestamp, m.sensor_id, s.location, m.radiation_level, m.status
-                FROM measurements m
-                JOIN sensors s ON m.sensor_id = s.sensor_id
-                ORDER BY m.timestamp DESC
-                LIMIT 100
-            ''')
+            self.data_tree.delete(*self.data_tree.get_children())
+            self.measurement_log_items.clear()
 
-            for row in cursor.fetchall():
-                self.data_tree.insert("", "end", values=(
-                    row[0],
-                    row[1],
-                    row[2],
-                    f"{row[3]:.2f} мкЗв/ч",
-                    row[4]
-                ))
+            with self.service.db.reader() as conn:
+                cursor = conn.cursor()
+                cursor.execute('''
+                    SELECT m.timestamp, m.sensor_id, s.location, m.radiation_level, m.status
+                    FROM measurements m
+                    JOIN sensors s ON m.sensor_id = s.sensor_id
+                    ORDER BY m.timestamp DESC
+                    LIMIT ?
+                ''', (self.MEASUREMENT_LOG_ROWS,))
+                rows = cursor.fetchall()
+
+            self.measurement_log_last = str(rows[0][0]) if rows else ''
+            for row in rows:
+                self.measurement_log_items.append(self.insert_measurement_row("end", row))
 
         except Exception as e:
             self.logger.error(f"Ошибка загрузки измерений: {e}")
 
+    def insert_measurement_row(self, index, row):
+        """Вставка строки (время, датчик, участок, уровень, статус) в журнал измерений"""
+        return self.data_tree.insert("", index, values=(
+            row[0],
+            row[1],
+            row[2],
+            f"{row[3]:.2f} мкЗв/ч",
+            row[4]
+        ))
+
+    def append_measurement_log(self):
+        """Добавление новых измерений из памяти в начало журнала и удаление самых старых строк"""
+        try:
+            while self.measurement_log_pending:
+                row = self.measurement_log_pending.popleft()
+                # Измерения, уже загруженные из БД, пропускаются
+                if row[0] <= self.measurement_log_last:
+                    continue
+                self.measurement_log_last = row[0]
+                self.measurement_log_items.appendleft(self.insert_measurement_row(0, row))
+
+            while len(self.measurement_log_items) > self.MEASUREMENT_LOG_ROWS:
+                self.data_tree.delete(self.measurement_log_items.pop())
+
+        except Exception as e:
+            self.logger.error(f"Ошибка обновления журнала измерений: {e}")
+
+    def open_history_browser(self):
+        """Просмотр истории измерений с фильтрами и подгрузкой страниц при прокрутке
+
+        В таблице одновременно находится не больше history_max_rows строк: при
+        прокрутке вниз подгружаются более старые страницы, а строки с другого края
+        удаляются; при прокрутке обратно вверх удаленные страницы читаются снова.
+        """
+        window = tk.Toplevel(self.root)
+        window.title("История измерений")
+        window.geometry("800x550")
+
+        # Фильтры
+        filter_frame = ttk.Frame(window, padding=10)
+        filter_frame.pack(fill="x")
+
+        ttk.Label(filter_frame, text="Датчик:").pack(side="left")
+        sensor_var = tk.StringVar(value="Все")
+        ttk.Combobox(filter_frame, textvariable=sensor_var, values=["Все", *self.sensor_configs.keys()],
+                     width=10, state="readonly").pack(side="left", padx=5)
+
+        ttk.Label(filter_frame, text="Статус:").pack(side="left")
+        status_var = tk.StringVar(value="Все")
+        ttk.Combobox(filter_frame, textvariable=status_var,
+                     values=["Все", "НОРМА", "ПРЕДУПРЕЖДЕНИЕ", "ОПАСНО"],
+                     width=16, state="readonly").pack(side="left", padx=5)
+
+        ttk.Label(filter_frame, text="С (ГГГГ-ММ-ДД):").pack(side="left")
+        start_var = tk.StringVar()
+        ttk.Entry(filter_frame, textvariable=start_var, width=12).pack(side="left", padx=5)
+
+        ttk.Label(filter_frame, text="По:").pack(side="left")
+        end_var = tk.StringVar()
+        ttk.Entry(filter_frame, textvariable=end_var, width=12).pack(side="left", padx=5)
+
+        # Таблица
+        table_frame = ttk.Frame(window, padding=(10, 0))
+        table_frame.pack(fill="both", expand=True)
+
+        columns = ("Время", "Датчик", "Участок", "Уровень радиации", "Статус")
+        tree = ttk.Treeview(table_frame, columns=columns, show="headings")
+        for col, width in zip(columns, [180, 100, 120, 120, 120]):
+            tree.heading(col, text=col)
+            tree.column(col, width=width)
+
+        scrollbar = ttk.Scrollbar(table_frame, orient="vertical", command=tree.yview)
+        scrollbar.pack(side="right", fill="y")
+        tree.pack(side="left", fill="both", expand=True)
+
+        status_label = ttk.Label(window, text="", padding=10)
+        status_label.pack(fill="x")
+
+        page_size = self.config['history_page_size']
+        max_rows = self.config['history_max_rows']
+        # items - строки таблицы от новых к старым: (идентификатор строки, ключ (timestamp, id))
+        state = {'filters': {}, 'generation': 0, 'loading': False, 'items': deque(),
+                 'has_older': False, 'has_newer': False}
+
+        def insert_row(index, row):
+            location = self.sensor_configs.get(row[2], {}).get("location", "")
+            return tree.insert("", index, values=(row[1], row[2], location, f"{row[3]:.2f} мкЗв/ч", row[4]))
+
+        def request(newer):
+            if state['loading']:
+                return
+            items = state['items']
+            after = None
+            if items:
+                after = items[0][1] if newer else items[-1][1]
+            state['loading'] = True
+            generation, filters = state['generation'], state['filters']
+            status_label.config(text="Загрузка...")
+
+            def worker():
+                rows, error = None, None
+                try:
+                    rows = self.service.history_pager.fetch(filters, after, newer)
+                except Exception as e:
+                    error = e
+                    self.logger.error(f"Ошибка загрузки истории измерений: {e}")
+                # Результат каждого набора фильтров под своим ключом: иначе запоздавший
+                # результат старого запроса мог бы заменить неприменённый новый
+                self.ui_updates.post(('history', str(window), generation), on_page, generation, newer, rows, error)
+
+            threading.Thread(target=worker, daemon=True).start()
+
+        def on_page(generation, newer, rows, error):
+            # Результат запроса со старыми фильтрами не применяется
+            if generation != state['generation'] or not window.winfo_exists():
+                return
+            state['loading'] = False
+            if error:
+                status_label.config(text=f"Ошибка загрузки: {error}")
+                return
+
+            items = state['items']
+            if newer:
+                for row in reversed(rows):
+                    items.appendleft((insert_row(0, row), (row[1], row[0])))
+                state['has_newer'] = len(rows) == page_size
+                # Видимые строки остаются на месте после вставки над ними
+                tree.yview_scroll(len(rows), "units")
+                while len(items) > max_rows:
+                    tree.delete(items.pop()[0])
+                    state['has_older'] = True
+            else:
+                for row in rows:
+                    items.append((insert_row("end", row), (row[1], row[0])))
+                state['has_older'] = len(rows) == page_size
+                removed = 0
+                while len(items) > max_rows:
+                    tree.delete(items.popleft()[0])
+                    removed += 1
+                if removed:
+                    state['has_newer'] = True
+                    tree.yview_scroll(-removed, "units")
+
+            end_note = "" if state['has_older'] else " (достигнуто начало истории)"
+            status_label.config(text=f"Строк в окне: {len(items)}{end_note}")
+
+        def on_scroll(first, last):
+            scrollbar.set(first, last)
+            if float(last) >= 0.9 and state['has_older']:
+                request(newer=False)
+            elif float(first) <= 0.1 and state['has_newer']:
+                request(newer=True)
+
+        def apply_filters():
+            try:
+                start = end = None
+                if start_var.get().strip():
+                    start = day_range(datetime.strptime(start_var.get().strip(), '%Y-%m-%d').date())[0]
+                if end_var.get().strip():
+                    end = day_range(datetime.strptime(end_var.get().strip(), '%Y-%m-%d').date())[1]
+            except ValueError:
+                messagebox.showerror("Ошибка", "Даты должны быть в формате ГГГГ-ММ-ДД", parent=window)
+                return
+
+            state['filters'] = {
+                'sensor_id': None if sensor_var.get() == "Все" else sensor_var.get(),
+                'status': None if status_var.get() == "Все" else status_var.get(),
+                'start': start,
+                'end': end
+            }
+            state['generation'] += 1
+            state['loading'] = False
+            state['has_older'] = state['has_newer'] = False
+            tree.delete(*tree.get_children())
+            state['items'].clear()
+            request(newer=False)
+
+        tree.configure(yscrollcommand=on_scroll)
+        ttk.Button(filter_frame, text="Применить", command=apply_filters).pack(side="left", padx=5)
+        apply_filters()
+
     def update_alerts_tree(self):
-        """Обновление дерева оповещений"""
+        """Загрузка последних оповещений в таблицу"""
         try:
             # Очистка таблица
-            for item in self.alerts_tree.get_children():
-                self.alerts_tree.delete(item)
+            self.alerts_tree.delete(*self.alerts_tree.get_children())
+            self.alert_log_items.clear()
 
-            cursor = self.conn.cursor()
-            cursor.execute('''
-                SELECT timestamp, sensor_id, alert_type, actual_value, threshold_value,
-                       CASE WHEN notified = 1 THEN 'Отправлено' ELSE 'В ожидании' END
-                FROM alerts
-                ORDER BY timestamp DESC
-                LIMIT 50
-            ''')
+            with self.service.db.reader() as conn:
+                cursor = conn.cursor()
+                cursor.execute('''
+                    SELECT id, timestamp, sensor_id, alert_type, event, actual_value, threshold_value,
+                           CASE notified WHEN 1 THEN 'Отправлено' WHEN 2 THEN 'Ошибка' ELSE 'В ожидании' END
+                    FROM alerts
+                    ORDER BY id DESC
+                    LIMIT ?
+                ''', (self.ALERT_LOG_ROWS,))
+                rows = cursor.fetchall()
+
+            self.alert_log_last_id = rows[0][0] if rows else 0
+            for row in rows:
+                self.alert_log_items.append(self.insert_alert_row("end", row))
 
-            for row in cursor.fetchall():
-                self.alerts_tree.insert("", "end", values=(
-                    row[0],
-                    row[1],
-                    row[2],
-                    f"{row[3]:.2f} мкЗв/ч",
-                    f"{row[4]} мкЗв/ч",
-                    row[5]
-                ))
+        except Exception as e:
+            self.logger.error(f"Ошибка обновления оповещений: {e}")
+
+    def insert_alert_row(self, index, row):
+        """Вставка строки (id, время, датчик, тип, событие, уровень, порог, статус) в журнал оповещений"""
+        event = self.ALERT_EVENTS.get(row[4])
+        return self.alerts_tree.insert("", index, iid=str(row[0]), values=(
+            row[1],
+            row[2],
+            f"{row[3]} ({event})" if event else row[3],
+            f"{row[5]:.2f} мкЗв/ч",
+            f"{row[6]} мкЗв/ч",
+            row[7]
+        ))
+
+    def append_alerts_log(self):
+        """Добавление новых оповещений из памяти в начало журнала и удаление самых старых строк"""
+        try:
+            while self.alert_log_pending:
+                row = self.alert_log_pending.popleft()
+                if row[0] <= self.alert_log_last_id:
+                    continue
+                self.alert_log_last_id = row[0]
+                self.alert_log_items.appendleft(self.insert_alert_row(0, row))
+
+            while len(self.alert_log_items) > self.ALERT_LOG_ROWS:
+                self.alerts_tree.delete(self.alert_log_items.pop())
+
+            # Результаты отправки писем потоком оповещений
+            while self.alert_status_pending:
+                alert_id, text = self.alert_status_pending.popitem()
+                if self.alerts_tree.exists(str(alert_id)):
+                    self.alerts_tree.set(str(alert_id), "Статус", text)
 
         except Exception as e:
             self.logger.error(f"Ошибка обновления оповещений: {e}")
@@ -1283,15 +5591,24 @@ class RadiationMonitoringSystem:
 
             # Обновление конфигурации из полей ввода
             self.config['polling_interval'] = int(self.settings_entries['polling_interval'].get())
-            self.config['warning_threshold'] = float(self.settings_entries['warning_threshold'].get())
-            self.config['danger_threshold'] = float(self.settings_entries['danger_threshold'].get())
+            self.service.set_thresholds(float(self.settings_entries['warning_threshold'].get()),
+                                        float(self.settings_entries['danger_threshold'].get()))
             self.config['smtp_server'] = self.settings_entries['smtp_server'].get()
             self.config['smtp_port'] = int(self.settings_entries['smtp_port'].get())
             self.config['notification_email'] = self.settings_entries['notification_email'].get()
-
-            # Сохранение в файл
+            # Новые письма отправляются через соединения с новым сервером
+            self.service.smtp_pool.host = self.config['smtp_server']
+            self.service.smtp_pool.port = self.config['smtp_port']
+            self.service.smtp_pool.close()
+            self.config['raw_retention_days'] = int(self.settings_entries['raw_retention_days'].get())
+            self.service.retention.retention_days = self.config['raw_retention_days']
+            self.config['compress_after_days'] = int(self.settings_entries['compress_after_days'].get())
+            self.service.retention.compress_after_days = self.config['compress_after_days']
+
+            # Сохранение в файл (пароль SMTP задается переменной окружения RADIATION_SMTP_PASSWORD)
             with open('system_config.json', 'w', encoding='utf-8') as f:
-                json.dump(self.config, f, indent=4, ensure_ascii=False)
+                json.dump({key: value for key, value in self.config.items() if key != 'smtp_password'},
+                          f, indent=4, ensure_ascii=False)
 
             messagebox.showinfo("Успех", "Настройки сохранены!")
             self.logger.info("Настройки системы обновлены")
@@ -1304,12 +5621,12 @@ class RadiationMonitoringSystem:
     def save_notification_settings(self):
         """Сохранение настроек оповещений"""
         try:
-            self.config['warning_threshold'] = float(self.warning_threshold_var.get())
-            self.config['danger_threshold'] = float(self.danger_threshold_var.get())
+            self.service.set_thresholds(float(self.warning_threshold_var.get()),
+                                        float(self.danger_threshold_var.get()))
 
             # Обновление контактов
             contacts_text = self.contacts_text.get("1.0", "end-1c")
-            self.emergency_contacts = [line.strip() for line in contacts_text.split('\n') if line.strip()]
+            self.service.emergency_contacts[:] = [line.strip() for line in contacts_text.split('\n') if line.strip()]
 
             messagebox.showinfo("Успех", "Настройки оповещений сохранены!")
 
@@ -1325,7 +5642,9 @@ class RadiationMonitoringSystem:
             'smtp_server': 'smtp.company.com',
             'smtp_port': 587,
             'notification_email': 'safety@company.com',
-            'reports_folder': self.get_downloads_path()  # Сбрасываем к стандартному пути
+            'raw_retention_days': 0,
+            'compress_after_days': 0,
+            'reports_folder': self.service.get_downloads_path()  # Сбрасываем к стандартному пути
         }
 
         for key, entry in self.settings_entries.items():
@@ -1354,9 +5673,11 @@ class RadiationMonitoringSystem:
         messagebox.showinfo("Инфо", "Таблица датчиков обновлена")
 
     def manual_data_collection(self):
-        """Ручной сбор данных"""
-        self.collect_sensor_data()
-        messagebox.showinfo("Обновление", "Данные обновлены вручную")
+        """Ручной сбор данных: внеочередной цикл опроса в потоке сбора данных"""
+        if self.service.request_collection():
+            messagebox.showinfo("Обновление", "Запрошен внеочередной опрос датчиков")
+        else:
+            messagebox.showerror("Обновление", "Сбор данных не запущен")
 
     def reset_alarms(self):
         """Сброс аварийных сигналов"""
@@ -1366,29 +5687,90 @@ class RadiationMonitoringSystem:
     def clear_alerts_log(self):
         """Очистка журнала оповещений"""
         try:
-            cursor = self.conn.cursor()
-            cursor.execute('DELETE FROM alerts')
-            self.conn.commit()
+            with self.service.db.writer() as conn:
+                conn.execute('DELETE FROM alerts')
             self.update_alerts_tree()
             messagebox.showinfo("Очистка", "Журнал оповещений очищен")
         except Exception as e:
             messagebox.showerror("Ошибка", f"Не удалось очистить журнал: {e}")
 
+    def run_background_task(self, title, task, on_success):
+        """Выполнение длительной операции в фоновом потоке с индикатором хода"""
+        dialog = tk.Toplevel(self.root)
+        dialog.title(title)
+        dialog.geometry("400x100")
+
+        ttk.Label(dialog, text=f"{title}...").pack(pady=10)
+        progress_bar = ttk.Progressbar(dialog, mode="determinate", maximum=100)
+        progress_bar.pack(fill="x", padx=20)
+
+        def progress(done, total):
+            if total:
+                self.ui_updates.post(('progress', title),
+                                     lambda value=done * 100 / total: progress_bar.config(value=value))
+
+        def finish(result, error):
+            if dialog.winfo_exists():
+                dialog.destroy()
+            if error:
+                messagebox.showerror("Ошибка", f"{title}: {error}")
+            else:
+                on_success(result)
+
+        def worker():
+            result, error = None, None
+            try:
+                result = task(progress)
+            except Exception as e:
+                error = e
+                self.logger.error(f"{title}: {e}")
+            self.ui_updates.post(('done', title), finish, result, error)
+
+        threading.Thread(target=worker, daemon=True).start()
+
     def create_backup(self):
         """Создание резервной копии"""
-        try:
-            import shutil
-            timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-            backup_file = os.path.join(self.config['reports_folder'],
-                                       f"radiation_system_backup_{timestamp}.db")
-            shutil.copy2('radiation_monitoring.db', backup_file)
-            messagebox.showinfo("Резервная копия", f"Резервная копия создана:\n{backup_file}")
-        except Exception as e:
-            messagebox.showerror("Ошибка", f"Не удалось создать резервную копию: {e}")
+        dialog = tk.Toplevel(self.root)
+        dialog.title("Резервное копирование")
+        dialog.geometry("350x180")
+
+        kind_var = tk.StringVar(value="full")
+        for text, kind in (("Полная копия", "full"),
+                           ("Разностная (от последней полной)", "differential"),
+                           ("Инкрементальная (от последней копии)", "incremental")):
+            ttk.Radiobutton(dialog, text=text, value=kind, variable=kind_var).pack(anchor="w", padx=20, pady=2)
+
+        def start():
+            kind = kind_var.get()
+            dialog.destroy()
+            self.run_background_task(
+                "Резервное копирование",
+                lambda progress: self.service.backup_engine.backup(self.config['reports_folder'], kind, progress),
+                lambda path: messagebox.showinfo("Резервная копия", f"Резервная копия создана:\n{path}"))
+
+        ttk.Button(dialog, text="Создать", command=start).pack(pady=10)
 
     def restore_backup(self):
         """Восстановление из резервной копии"""
-        messagebox.showinfo("Инфо", "Функция восстановления в разработке")
+        path = filedialog.askopenfilename(
+            title="Выберите резервную копию",
+            initialdir=self.config['reports_folder'],
+            filetypes=[("Резервные копии", "*.db")]
+        )
+        if not path:
+            return
+        if not messagebox.askyesno("Восстановление",
+                                   "Текущие данные будут заменены данными резервной копии. Продолжить?"):
+            return
+
+        def on_restored(files):
+            self.load_recent_measurements()
+            self.update_alerts_tree()
+            messagebox.showinfo("Восстановление", f"База данных восстановлена (файлов копий: {files})")
+
+        self.run_background_task("Восстановление",
+                                 lambda progress: self.service.restore_backup(path, progress),
+                                 on_restored)
 
     def run(self):
         """Запуск приложения"""
@@ -1398,13 +5780,264 @@ class RadiationMonitoringSystem:
         except Exception as e:
             self.logger.critical(f"Критическая ошибка при запуске: {e}")
         finally:
-            self.data_collection_active = False
-            if hasattr(self, 'conn'):
-                self.conn.close()
-            self.logger.info("Система остановлена")
+            if self.owns_service:
+                self.service.stop()
+
+
+def run_query_benchmark(sizes=(1_000_000, 10_000_000), sensors=100, days=60):
+    """Сравнение времени типовых запросов до и после миграций индексов
+
+    Для каждого размера создается временная БД с синтетическими измерениями,
+    запросы выполняются в исходном виде (DATE(timestamp), без индексов) и в
+    новом (полуоткрытые интервалы по timestamp, индексы из SCHEMA_MIGRATIONS).
+    """
+    today = datetime.now().date()
+    week_start = today - timedelta(days=7)
+    queries = [
+        ("Последние 100 измерений", '''
+            SELECT m.timestamp, m.sensor_id, s.location, m.radiation_level, m.status
+            FROM measurements m JOIN sensors s ON m.sensor_id = s.sensor_id
+            ORDER BY m.timestamp DESC LIMIT 100
+        ''', (), '''
+            SELECT m.timestamp, m.sensor_id, s.location, m.radiation_level, m.status
+            FROM measurements m JOIN sensors s ON m.sensor_id = s.sensor_id
+            ORDER BY m.timestamp DESC LIMIT 100
+        ''', ()),
+        ("Суточный отчет", '''
+            SELECT sensor_id, AVG(radiation_level), MAX(radiation_level), MIN(radiation_level), COUNT(*)
+            FROM measurements WHERE DATE(timestamp) = ? GROUP BY sensor_id
+        ''', (today.isoformat(),), '''
+            SELECT sensor_id, AVG(radiation_level), MAX(radiation_level), MIN(radiation_level), COUNT(*)
+            FROM measurements WHERE timestamp >= ? AND timestamp < ? GROUP BY sensor_id
+        ''', day_range(today)),
+        ("Недельный отчет", '''
+            SELECT sensor_id, AVG(radiation_level), MAX(radiation_level), MIN(radiation_level), COUNT(*)
+            FROM measurements WHERE DATE(timestamp) BETWEEN ? AND ? GROUP BY sensor_id
+        ''', (week_start.isoformat(), today.isoformat()), '''
+            SELECT sensor_id, AVG(radiation_level), MAX(radiation_level), MIN(radiation_level), COUNT(*)
+            FROM measurements WHERE timestamp >= ? AND timestamp < ? GROUP BY sensor_id
+        ''', day_range(week_start, today)),
+        ("Измерений за сегодня", '''
+            SELECT COUNT(*) FROM measurements WHERE DATE(timestamp) = ?
+        ''', (today.isoformat(),), '''
+            SELECT COUNT(*) FROM measurements WHERE timestamp >= ? AND timestamp < ?
+        ''', day_range(today)),
+        ("Превышений порога", '''
+            SELECT COUNT(*) FROM measurements WHERE status != 'НОРМА'
+        ''', (), '''
+            SELECT COUNT(*) FROM measurements WHERE status IN ('ПРЕДУПРЕЖДЕНИЕ', 'ОПАСНО')
+        ''', ()),
+    ]
+
+    def timed(conn, sql, params):
+        started = time.perf_counter()
+        conn.execute(sql, params).fetchall()
+        return (time.perf_counter() - started) * 1000
+
+    for size in sizes:
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            db = DatabaseManager(os.path.join(tmp_dir, 'benchmark.db'))
+            with db.writer() as conn:
+                conn.execute('CREATE TABLE sensors (sensor_id TEXT PRIMARY KEY, location TEXT)')
+                conn.execute('''
+                    CREATE TABLE measurements (
+                        id INTEGER PRIMARY KEY AUTOINCREMENT, sensor_id TEXT,
+                        radiation_level REAL, timestamp DATETIME, status TEXT
+                    )
+                ''')
+                conn.execute('CREATE TABLE alerts (id INTEGER PRIMARY KEY, sensor_id TEXT, timestamp DATETIME, '
+                             'notified INTEGER DEFAULT 0)')
+                conn.executemany('INSERT INTO sensors VALUES (?, ?)',
+                                 [(f"Д-{i:04d}", f"Участок {i}") for i in range(sensors)])
+
+            # Измерения равномерно распределены по последним days дням
+            start = datetime.combine(today - timedelta(days=days - 1), datetime.min.time())
+            step = days * 86400 / size
+
+            def rows():
+                for n in range(size):
+                    level = random.uniform(0.05, 3.0)
+                    status = "ОПАСНО" if level >= 2.5 else "ПРЕДУПРЕЖДЕНИЕ" if level >= 1.0 else "НОРМА"
+                    yield (f"Д-{n % sensors:04d}", level,
+                           (start + timedelta(seconds=n * step)).isoformat(sep=' '), status)
+
+            with db.writer() as conn:
+                conn.executemany('''
+                    INSERT INTO measurements (sensor_id, radiation_level, timestamp, status)
+                    VALUES (?, ?, ?, ?)
+                ''', rows())
+
+            conn = db.writer_conn
+            before = [timed(conn, old_sql, old_params) for _, old_sql, old_params, _, _ in queries]
+            db.apply_migrations(SCHEMA_MIGRATIONS)
+            conn.execute('ANALYZE')
+            after = [timed(conn, new_sql, new_params) for _, _, _, new_sql, new_params in queries]
+            db.close()
+
+        print(f"\nИзмерений: {size:,}")
+        print(f"{'Запрос':<28}{'До, мс':>12}{'После, мс':>12}")
+        for (name, *_), old_ms, new_ms in zip(queries, before, after):
+            print(f"{name:<28}{old_ms:>12.1f}{new_ms:>12.1f}")
+
+
+def run_storage_benchmark(sizes=(1_000_000,), sensors=100, interval=5):
+    """Сравнение хранения исходных измерений строками и сжатыми блоками
+
+    Для каждого размера создается временная БД (схема и индексы из
+    SCHEMA_MIGRATIONS) с измерениями, как их записывает служба: циклы опроса
+    через interval секунд с дрожанием в несколько миллисекунд, одна отметка
+    времени на цикл, значения как у имитатора датчиков. Ряды с полной
+    точностью имитатора сравниваются с рядами, округленными до 0.01
+    (разрешение типового дозиметра). Измеряются скорость записи, размер БД
+    на измерение до и после упаковки (ChunkStore), скорость упаковки и время
+    сводки по датчикам: GROUP BY по строкам против распаковки блоков.
+    """
+    variants = [("полная точность", None), ("разрешение 0.01", 2)]
+
+    def database_bytes(conn):
+        page_size = conn.execute('PRAGMA page_size').fetchone()[0]
+        pages = conn.execute('PRAGMA page_count').fetchone()[0] - conn.execute('PRAGMA freelist_count').fetchone()[0]
+        return pages * page_size
+
+    for size in sizes:
+        cycles = size // sensors
+        start = datetime.combine(datetime.now().date() - timedelta(days=400), datetime.min.time())
+        print(f"\nИзмерений: {cycles * sensors:,} ({sensors} датчиков, опрос каждые {interval} с)")
+        print(f"{'Вариант':<18}{'Запись, тыс/с':>15}{'Строки, Б':>11}{'Блоки, Б':>10}{'Сжатие':>8}"
+              f"{'Упаковка, тыс/с':>17}{'Сводка SQL, мс':>16}{'Сводка блоки, мс':>18}")
+
+        for name, digits in variants:
+            rng = random.Random(1)
+            base_levels = [0.1 + (i % 4) * 0.3 for i in range(sensors)]
+
+            def cycle_rows(timestamp):
+                for i in range(sensors):
+                    level = max(0.01, base_levels[i] + rng.uniform(-0.1, 0.1))
+                    if rng.random() < 0.1:
+                        level *= rng.uniform(1.5, 4.0)
+                    if digits is not None:
+                        level = round(level, digits)
+                    status = "ОПАСНО" if level >= 2.5 else "ПРЕДУПРЕЖДЕНИЕ" if level >= 1.0 else "НОРМА"
+                    yield f"Д-{i:04d}", level, timestamp, status
+
+            with tempfile.TemporaryDirectory() as tmp_dir:
+                db = DatabaseManager(os.path.join(tmp_dir, 'storage.db'))
+                with db.writer() as conn:
+                    conn.execute('CREATE TABLE sensors (sensor_id TEXT PRIMARY KEY, location TEXT)')
+                    conn.execute('''
+                        CREATE TABLE measurements (
+                            id INTEGER PRIMARY KEY AUTOINCREMENT, sensor_id TEXT,
+                            radiation_level REAL, timestamp DATETIME, status TEXT
+                        )
+                    ''')
+                    conn.execute('CREATE TABLE alerts (id INTEGER PRIMARY KEY, sensor_id TEXT, timestamp DATETIME, '
+                                 'notified INTEGER DEFAULT 0)')
+                db.apply_migrations(SCHEMA_MIGRATIONS)
+
+                # Запись: один цикл опроса - одна транзакция, как в MeasurementWriter
+                started = time.perf_counter()
+                elapsed = timedelta()
+                for _ in range(cycles):
+                    elapsed += timedelta(seconds=interval, microseconds=rng.randint(0, 20000))
+                    timestamp = (start + elapsed).isoformat(sep=' ')
+                    with db.writer() as conn:
+                        conn.executemany('''
+                            INSERT INTO measurements (sensor_id, radiation_level, timestamp, status)
+                            VALUES (?, ?, ?, ?)
+                        ''', cycle_rows(timestamp))
+                insert_rate = cycles * sensors / (time.perf_counter() - started)
+
+                conn = db.writer_conn
+                row_bytes = database_bytes(conn)
+                started = time.perf_counter()
+                sql_summary = conn.execute('''
+                    SELECT sensor_id, AVG(radiation_level), MAX(radiation_level), MIN(radiation_level), COUNT(*),
+                           SUM(status != 'НОРМА')
+                    FROM measurements GROUP BY sensor_id ORDER BY sensor_id
+                ''').fetchall()
+                sql_ms = (time.perf_counter() - started) * 1000
+
+                chunks = ChunkStore(db)
+                started = time.perf_counter()
+                packed = chunks.compact('9999')
+                compact_rate = packed / (time.perf_counter() - started)
+                chunk_bytes = database_bytes(conn)
+
+                started = time.perf_counter()
+                chunk_summary = chunks.sensor_summary(conn)
+                chunk_ms = (time.perf_counter() - started) * 1000
+                db.close()
+
+            if [row[4] for row in sql_summary] != [row[4] for row in chunk_summary]:
+                raise RuntimeError("Сводка по блокам не совпадает со сводкой по строкам")
+            per_row, per_chunk = row_bytes / packed, chunk_bytes / packed
+            print(f"{name:<18}{insert_rate / 1000:>15.1f}{per_row:>11.1f}{per_chunk:>10.1f}"
+                  f"{per_row / per_chunk:>7.1f}x{compact_rate / 1000:>17.1f}{sql_ms:>16.1f}{chunk_ms:>18.1f}")
 
 
 # Запуск приложения
 if __name__ == "__main__":
-    app = RadiationMonitoringSystem()
-    app.run()
+    parser = argparse.ArgumentParser(description="Система контроля уровня радиации")
+    parser.add_argument('--benchmark', action='store_true',
+                        help="замер времени запросов к БД до и после индексов")
+    parser.add_argument('--storage-benchmark', action='store_true',
+                        help="сравнение хранения измерений строками и сжатыми блоками")
+    parser.add_argument('--rows', type=int, nargs='+',
+                        help="размеры тестовых БД для --benchmark (по умолчанию 1 и 10 млн) "
+                             "и --storage-benchmark (1 млн)")
+    parser.add_argument('--backfill-rollups', action='store_true',
+                        help="пересчитать агрегаты для отчетов по накопленным измерениям")
+    parser.add_argument('--enable-incremental-vacuum', action='store_true',
+                        help="перевести существующую БД в режим auto_vacuum=INCREMENTAL (полный VACUUM)")
+    parser.add_argument('--headless', action='store_true',
+                        help="сбор данных без графического интерфейса (служба, остановка по SIGTERM)")
+    parser.add_argument('--config', metavar='ФАЙЛ',
+                        help="файл настроек JSON (например, сохраненный из окна system_config.json)")
+    parser.add_argument('--api-port', type=int,
+                        help="включить локальный HTTP API службы на указанном порту")
+    parser.add_argument('--watch', metavar='URL',
+                        help="вывод потока событий работающей службы, например http://127.0.0.1:8765")
+    args = parser.parse_args()
+
+    config = None
+    if args.config:
+        try:
+            with open(args.config, encoding='utf-8') as f:
+                config = json.load(f)
+        except (OSError, ValueError) as e:
+            parser.error(f"не удалось прочитать настройки {args.config}: {e}")
+    if args.api_port is not None:
+        config = dict(config or {}, api_port=args.api_port)
+
+    if args.benchmark:
+        run_query_benchmark(args.rows or [1_000_000, 10_000_000])
+    elif args.storage_benchmark:
+        run_storage_benchmark(args.rows or [1_000_000])
+    elif args.backfill_rollups:
+        if not os.path.exists('radiation_monitoring.db'):
+            parser.error("файл radiation_monitoring.db не найден")
+        logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+        db = DatabaseManager('radiation_monitoring.db')
+        db.apply_migrations(SCHEMA_MIGRATIONS)
+        days = RollupManager(db).backfill(ChunkStore(db))
+        db.close()
+        print(f"Агрегаты пересчитаны, суток: {days}")
+    elif args.enable_incremental_vacuum:
+        if not os.path.exists('radiation_monitoring.db'):
+            parser.error("файл radiation_monitoring.db не найден")
+        conn = sqlite3.connect('radiation_monitoring.db')
+        conn.execute('PRAGMA auto_vacuum = INCREMENTAL')
+        conn.execute('VACUUM')
+        conn.close()
+        print("Режим auto_vacuum=INCREMENTAL включен")
+    elif args.watch:
+        try:
+            MonitoringClient(args.watch).stream(
+                lambda event, data: print(event, json.dumps(data, ensure_ascii=False)))
+        except KeyboardInterrupt:
+            pass
+    elif args.headless:
+        MonitoringService(config, keep_history=False).run_forever()
+    else:
+        app = RadiationMonitoringSystem(MonitoringService(config) if config else None)
+        app.run()
@@ -0,0 +1,76 @@
+import os
+import sys
+import tempfile
+import unittest
+from datetime import datetime, timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from Coursework import SCHEMA_MIGRATIONS, ChunkStore, DatabaseManager, GorillaCodec
+
+
+class GorillaCodecTest(unittest.TestCase):
+    def test_round_trip(self):
+        times = [1_700_000_000_000_000 + i * 5_000_000 + (i % 7) * 1234 for i in range(500)]
+        values = [0.1 + (i % 13) * 0.037 for i in range(500)]
+        statuses = [0 if i % 50 else 1 for i in range(500)]
+        decoded = GorillaCodec.decode(GorillaCodec.encode(times, values, statuses), len(times))
+        self.assertEqual(decoded[0], times)
+        self.assertEqual(list(decoded[1]), values)
+        self.assertEqual(list(decoded[2]), statuses)
+
+
+class ChunkStoreTest(unittest.TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.db = DatabaseManager(os.path.join(self.tmp_dir.name, 'test.db'))
+        with self.db.writer() as conn:
+            conn.execute('''
+                CREATE TABLE measurements (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT, sensor_id TEXT,
+                    radiation_level REAL, timestamp DATETIME, status TEXT
+                )
+            ''')
+            conn.execute('CREATE TABLE alerts (id INTEGER PRIMARY KEY, sensor_id TEXT, timestamp DATETIME, '
+                         'notified INTEGER DEFAULT 0)')
+        self.db.apply_migrations(SCHEMA_MIGRATIONS)
+        self.chunks = ChunkStore(self.db)
+
+        start = datetime(2026, 1, 1)
+        self.rows = [(sensor_id, 0.1 + (i % 10) * 0.1, start + timedelta(seconds=5 * i), 'НОРМА')
+                     for i in range(2000) for sensor_id in ('Д-124', 'Д-128')]
+        with self.db.writer() as conn:
+            conn.executemany('''
+                INSERT INTO measurements (sensor_id, radiation_level, timestamp, status)
+                VALUES (?, ?, ?, ?)
+            ''', self.rows)
+
+    def tearDown(self):
+        self.db.close()
+        self.tmp_dir.cleanup()
+
+    def test_no_end_bound_includes_unpacked_rows(self):
+        # Упакованы только первые полтора часа, остальное - строки measurements
+        packed = self.chunks.compact('2026-01-01 01:30:00')
+        self.assertEqual(packed, 1080 * 2)
+
+        with self.db.reader() as conn:
+            rows = list(self.chunks.measurements(conn))
+            summary = self.chunks.sensor_summary(conn)
+            tail = list(self.chunks.measurements(conn, start='2026-01-01 02:00:00'))
+
+        self.assertEqual(len(rows), len(self.rows))
+        self.assertEqual([row[4] for row in summary], [2000, 2000])
+        self.assertEqual(len(tail), (2000 - 1440) * 2)
+
+    def test_expand_restores_rows(self):
+        self.chunks.compact('9999-12-31 23:59:59')
+        self.chunks.expand('9999-12-31 23:59:59')
+        with self.db.reader() as conn:
+            restored = conn.execute('SELECT COUNT(*) FROM measurements').fetchone()[0]
+            chunks = conn.execute('SELECT COUNT(*) FROM measurement_chunks').fetchone()[0]
+        self.assertEqual((restored, chunks), (len(self.rows), 0))
+
+
+if __name__ == '__main__':
+    unittest.main()
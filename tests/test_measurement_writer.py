@@ -0,0 +1,77 @@
+import os
+import sqlite3
+import sys
+import tempfile
+import threading
+import time
+import unittest
+from datetime import datetime
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from Coursework import SCHEMA_MIGRATIONS, DatabaseManager, MeasurementWriter, RollupManager
+
+
+class MeasurementWriterRetryTest(unittest.TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.tmp_dir.name, 'test.db')
+        self.db = DatabaseManager(self.path)
+        with self.db.writer() as conn:
+            conn.execute('''
+                CREATE TABLE measurements (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT, sensor_id TEXT,
+                    radiation_level REAL, timestamp DATETIME, status TEXT
+                )
+            ''')
+            conn.execute('CREATE TABLE alerts (id INTEGER PRIMARY KEY, sensor_id TEXT, timestamp DATETIME, '
+                         'notified INTEGER DEFAULT 0)')
+        self.db.apply_migrations(SCHEMA_MIGRATIONS)
+        # Без ожидания внутри SQLite блокировка сразу дает "database is locked"
+        self.db.writer_conn.execute('PRAGMA busy_timeout = 0')
+        self.rollups = RollupManager(self.db)
+        self.batch = [('Д-124', 0.2, datetime(2026, 1, 1, 12, 0, 5 * i), 'НОРМА') for i in range(10)]
+
+        self.blocker = sqlite3.connect(self.path, check_same_thread=False)
+        self.blocker.execute('BEGIN IMMEDIATE')
+
+    def tearDown(self):
+        self.blocker.close()
+        self.db.close()
+        self.tmp_dir.cleanup()
+
+    def stored(self):
+        with self.db.reader() as conn:
+            measurements = conn.execute('SELECT COUNT(*) FROM measurements').fetchone()[0]
+            rollup = conn.execute('SELECT COALESCE(SUM(samples), 0) FROM rollup_hour').fetchone()[0]
+        return measurements, rollup
+
+    def test_batch_written_after_lock_released(self):
+        writer = MeasurementWriter(self.db, rollups=self.rollups, retries=5, backoff=0.05)
+        threading.Timer(0.2, self.blocker.rollback).start()
+        writer.write_batch(self.batch)
+        self.assertEqual(self.stored(), (10, 10))
+        sketches = self.rollups.open_sketches['rollup_hour']
+        self.assertEqual(sketches[('Д-124', '2026-01-01 12:00:00')].count, 10)
+
+    def test_batch_dropped_after_retries(self):
+        writer = MeasurementWriter(self.db, rollups=self.rollups, retries=2, backoff=0.01)
+        writer.write_batch(self.batch)
+        self.blocker.rollback()
+        self.assertEqual(self.stored(), (0, 0))
+        self.assertFalse(self.rollups.open_sketches.get('rollup_hour'))
+
+
+
+class MeasurementWriterQueueTest(unittest.TestCase):
+    def test_full_queue_waits_once_per_cycle(self):
+        # Поток записи не запущен: очередь переполняется
+        writer = MeasurementWriter(None, queue_size=5, flush_interval_ms=200)
+        started = time.monotonic()
+        accepted = sum(writer.put('Д-124', 0.2, datetime(2026, 1, 1), 'НОРМА') for _ in range(50))
+        self.assertEqual(accepted, 5)
+        self.assertLess(time.monotonic() - started, 1.0)
+        self.assertEqual(writer.dropped, 45)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,153 @@
+import os
+import random
+import sys
+import tempfile
+import unittest
+from datetime import datetime, timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from Coursework import SCHEMA_MIGRATIONS, DatabaseManager, MeasurementWriter, QuantileSketch, RollupManager
+
+QUANTILES = (0.5, 0.95, 0.99)
+
+
+def distributions(size=20000, seed=7):
+    rng = random.Random(seed)
+    return {
+        'uniform': [rng.uniform(0.05, 3.0) for _ in range(size)],
+        'lognormal': [rng.lognormvariate(-1.0, 0.8) for _ in range(size)],
+        'exponential': [rng.expovariate(2.0) for _ in range(size)],
+        # Фон с редкими всплесками, как у имитатора датчиков
+        'spikes': [(0.4 + rng.uniform(-0.1, 0.1)) * (rng.uniform(1.5, 4.0) if rng.random() < 0.1 else 1)
+                   for _ in range(size)],
+    }
+
+
+def sketch_of(values):
+    sketch = QuantileSketch()
+    for value in values:
+        sketch.add(value)
+    return sketch
+
+
+class QuantileSketchTest(unittest.TestCase):
+    def test_quantiles_within_relative_error(self):
+        for name, values in distributions().items():
+            sketch = sketch_of(values)
+            ordered = sorted(values)
+            for q in QUANTILES:
+                # Точное значение того же ранга, что использует скетч
+                exact = ordered[int(q * (len(values) - 1))]
+                with self.subTest(distribution=name, q=q):
+                    self.assertLessEqual(abs(sketch.quantile(q) - exact), QuantileSketch.ALPHA * exact)
+
+    def test_merge_equals_single_sketch(self):
+        values = distributions()['lognormal']
+        merged = QuantileSketch()
+        for part in range(0, len(values), 3000):
+            merged.merge(sketch_of(values[part:part + 3000]))
+        single = sketch_of(values)
+        self.assertEqual(merged.count, single.count)
+        self.assertEqual(merged.bins, single.bins)
+        self.assertEqual([merged.quantile(q) for q in QUANTILES], [single.quantile(q) for q in QUANTILES])
+
+    def test_bytes_round_trip(self):
+        sketch = sketch_of(distributions()['spikes'] + [0.0] * 5)
+        restored = QuantileSketch.from_bytes(sketch.to_bytes())
+        self.assertEqual((restored.bins, restored.zeros, restored.count), (sketch.bins, sketch.zeros, sketch.count))
+        self.assertIsNone(QuantileSketch.from_bytes(QuantileSketch().to_bytes()).quantile(0.5))
+
+
+class RollupSketchTest(unittest.TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.db = DatabaseManager(os.path.join(self.tmp_dir.name, 'test.db'))
+        with self.db.writer() as conn:
+            conn.execute('''
+                CREATE TABLE measurements (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT, sensor_id TEXT,
+                    radiation_level REAL, timestamp DATETIME, status TEXT
+                )
+            ''')
+            conn.execute('CREATE TABLE alerts (id INTEGER PRIMARY KEY, sensor_id TEXT, timestamp DATETIME, '
+                         'notified INTEGER DEFAULT 0)')
+        self.db.apply_migrations(SCHEMA_MIGRATIONS)
+        self.rollups = RollupManager(self.db)
+        self.writer = MeasurementWriter(self.db, rollups=self.rollups)
+
+        rng = random.Random(3)
+        start = datetime(2026, 1, 1, 22, 0)
+        # Три часа через полночь: закрываются и часовые, и суточные интервалы
+        for cycle in range(3 * 720):
+            timestamp = start + timedelta(seconds=5 * cycle)
+            self.writer.write_batch([(sensor_id, rng.uniform(0.05, 3.0), timestamp, 'НОРМА')
+                                     for sensor_id in ('Д-124', 'Д-128')])
+
+    def tearDown(self):
+        self.db.close()
+        self.tmp_dir.cleanup()
+
+    def stored_sketches(self, table):
+        with self.db.reader() as conn:
+            return {(sensor_id, bucket): data for sensor_id, bucket, data in conn.execute(
+                f'SELECT sensor_id, bucket, sketch FROM {table} ORDER BY sensor_id, bucket')}
+
+    def test_open_buckets_are_kept_in_memory(self):
+        with self.db.reader() as conn:
+            sensors, total = self.rollups.quantiles(conn, 'hour')
+        self.assertEqual(set(sensors), {'Д-124', 'Д-128'})
+        self.assertEqual(set(self.rollups.open_sketches['rollup_hour']),
+                         {('Д-124', '2026-01-02 00:00:00'), ('Д-128', '2026-01-02 00:00:00')})
+        # Завершенные часы записаны в БД, текущий - еще нет (до контрольной записи)
+        hours = self.stored_sketches('rollup_hour')
+        self.assertIsNotNone(hours[('Д-124', '2026-01-01 23:00:00')])
+
+    def test_flushed_sketches_match_backfill(self):
+        with self.db.writer() as conn:
+            self.rollups.flush_sketches(conn)
+        written = {table: self.stored_sketches(table) for table in ('rollup_hour', 'rollup_day')}
+        RollupManager(self.db).backfill()
+        for table, sketches in written.items():
+            with self.subTest(table=table):
+                self.assertEqual(sketches, self.stored_sketches(table))
+
+    def test_backfill_keeps_open_buckets(self):
+        # Измерения без агрегатов (например, после сбоя) в завершенном и в текущем часе
+        with self.db.writer() as conn:
+            conn.executemany('INSERT INTO measurements (sensor_id, radiation_level, timestamp, status) '
+                             'VALUES (?, ?, ?, ?)',
+                             [('Д-124', 5.0, datetime(2026, 1, 1, 23, 30, 1), 'НОРМА'),
+                              ('Д-124', 5.0, datetime(2026, 1, 2, 0, 30, 1), 'НОРМА')])
+        # Пересчет в отдельном процессе (--backfill-rollups) при работающей записи
+        RollupManager(self.db).backfill()
+        with self.db.writer() as conn:
+            self.rollups.flush_sketches(conn)
+
+        for table in ('rollup_hour', 'rollup_day'):
+            with self.db.reader() as conn:
+                samples = {(sensor_id, bucket): count for sensor_id, bucket, count in conn.execute(
+                    f'SELECT sensor_id, bucket, samples FROM {table}')}
+            for key, data in self.stored_sketches(table).items():
+                with self.subTest(table=table, key=key):
+                    self.assertEqual(QuantileSketch.from_bytes(data).count, samples[key])
+        with self.db.reader() as conn:
+            closed, current = [row[0] for row in conn.execute(
+                "SELECT samples FROM rollup_hour WHERE sensor_id = 'Д-124' AND bucket IN "
+                "('2026-01-01 23:00:00', '2026-01-02 00:00:00') ORDER BY bucket")]
+        self.assertEqual((closed, current), (721, 720))
+
+    def test_rolled_back_batch_is_not_counted(self):
+        with self.db.writer() as conn:
+            self.rollups.flush_sketches(conn)
+        before = self.rollups.open_sketches['rollup_hour'][('Д-124', '2026-01-02 00:00:00')].count
+        with self.assertRaises(RuntimeError):
+            with self.db.writer() as conn:
+                self.rollups.update(conn, [('Д-124', 1.0, datetime(2026, 1, 2, 0, 59, 59), 'НОРМА')])
+                raise RuntimeError
+        self.rollups.commit_sketches(committed=False)
+        self.assertEqual(self.rollups.open_sketches['rollup_hour'][('Д-124', '2026-01-02 00:00:00')].count, before)
+
+
+if __name__ == '__main__':
+    unittest.main()